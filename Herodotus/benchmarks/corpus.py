@@ -0,0 +1,53 @@
+"""合成史料语料
+
+按固定种子生成类似史书叙述的中文段落，段落之间以空行分隔，规模以段落数计。
+"""
+from typing import List
+import os
+import random
+
+DYNASTIES = ["夏", "商", "周", "秦", "汉", "魏", "晋", "隋", "唐", "宋", "元", "明", "清"]
+TITLES = ["帝", "王", "丞相", "太尉", "将军", "刺史", "太守", "御史大夫", "尚书", "侍中"]
+SURNAMES = ["赵", "钱", "孙", "李", "周", "吴", "郑", "王", "刘", "张", "陈", "杨", "曹", "司马", "诸葛"]
+GIVEN = ["安", "平", "德", "仁", "义", "礼", "智", "信", "忠", "孝", "文", "武", "成", "康", "昭", "宣"]
+PLACES = ["长安", "洛阳", "咸阳", "邯郸", "建康", "临安", "汴梁", "大都", "金陵", "成都", "江陵", "襄阳"]
+EVENTS = ["变法", "北伐", "会盟", "迁都", "修史", "开科取士", "治河", "屯田", "和亲", "平叛", "改元", "大赦"]
+VERBS = ["上书", "率军", "奉诏", "出使", "镇守", "征讨", "辅政", "谏言", "筑城", "巡幸"]
+OUTCOMES = ["天下遂安", "百姓称颂", "国力日盛", "朝野震动", "功败垂成", "史家褒贬不一", "其制沿用数百年", "民心归附"]
+
+
+def _sentence(rng: random.Random) -> str:
+    person = rng.choice(SURNAMES) + rng.choice(GIVEN) + rng.choice(GIVEN)
+    year = rng.randint(1, 40)
+    return (f"{rng.choice(DYNASTIES)}{rng.choice(TITLES)}{year}年，{person}于{rng.choice(PLACES)}"
+            f"{rng.choice(VERBS)}，主持{rng.choice(EVENTS)}，{rng.choice(OUTCOMES)}。")
+
+
+def make_chunk(rng: random.Random, sentences: int = 6) -> str:
+    """生成一个约200字的段落"""
+    return "".join(_sentence(rng) for _ in range(sentences))
+
+
+def make_chunks(count: int, seed: int = 0) -> List[str]:
+    """生成count个段落"""
+    rng = random.Random(seed)
+    return [make_chunk(rng) for _ in range(count)]
+
+
+def make_queries(count: int, seed: int = 1) -> List[str]:
+    """生成count个查询"""
+    rng = random.Random(seed)
+    return [f"{rng.choice(DYNASTIES)}代{rng.choice(EVENTS)}的经过如何？" for _ in range(count)]
+
+
+def write_corpus(directory: str, chunk_count: int, chunks_per_file: int = 100, seed: int = 0) -> List[str]:
+    """把chunk_count个段落写入若干文本文件，返回文件路径列表"""
+    os.makedirs(directory, exist_ok=True)
+    chunks = make_chunks(chunk_count, seed)
+    paths = []
+    for start in range(0, chunk_count, chunks_per_file):
+        path = os.path.join(directory, f"doc_{start // chunks_per_file:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(chunks[start:start + chunks_per_file]))
+        paths.append(path)
+    return paths
@@ -0,0 +1,582 @@
+"""本地OpenAI兼容模拟服务
+
+实现chat completions（流式与非流式）和embeddings接口，响应内容按各代理的提示词
+返回可解析的固定格式（检索策略的params.k、重排序数组、Q:/A:问答对等），
+并支持可配置的延迟分布、生成速度和故障注入，用于离线、可复现地测量性能。
+
+用法：
+    python fake_openai_server.py --port 8000 --latency lognormal:-1.6,0.4 --tps 80
+    OPENAI_API_BASE=http://127.0.0.1:8000/v1 OPENAI_API_KEY=fake python ../src/main.py "任务"
+"""
+from typing import Optional, Dict, Any, List, Callable, Tuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dataclasses import dataclass, field
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def count_tokens(text: str) -> int:
+    """粗略估算令牌数：中日韩字符每个计1个，其余非空白字符每4个计1个"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(re.sub(r"\s", "", CJK_PATTERN.sub("", text)))
+    return cjk + math.ceil(other / 4)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """按count_tokens的估算截取不超过max_tokens个令牌的最长前缀"""
+    cjk = other = 0
+    for i, char in enumerate(text):
+        if CJK_PATTERN.match(char):
+            cjk += 1
+        elif not char.isspace():
+            other += 1
+        if cjk + math.ceil(other / 4) > max_tokens:
+            return text[:i]
+    return text
+
+
+class LatencyModel:
+    """延迟分布，格式为 名称:参数，单位为秒
+
+    fixed:0.2 | uniform:0.1,0.5 | normal:0.3,0.05 | lognormal:mu,sigma
+    """
+
+    def __init__(self, spec: str = "fixed:0"):
+        name, _, args = spec.partition(":")
+        self.name = name
+        self.args = [float(a) for a in args.split(",") if a]
+        if name not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未知的延迟分布: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.name == "fixed":
+            return self.args[0] if self.args else 0.0
+        if self.name == "uniform":
+            return rng.uniform(self.args[0], self.args[1])
+        if self.name == "normal":
+            return max(0.0, rng.gauss(self.args[0], self.args[1]))
+        return rng.lognormvariate(self.args[0], self.args[1])
+
+
+@dataclass
+class FakeServerConfig:
+    """模拟服务配置"""
+    seed: int = 0
+    latency: str = "fixed:0"             # 首个令牌前的延迟
+    tokens_per_second: float = 0.0       # 生成速度，0表示不限速
+    embedding_latency: str = "fixed:0"
+    embedding_dim: int = 1536
+    error_rate: float = 0.0              # 返回500的概率
+    rate_limit_rate: float = 0.0         # 返回429的概率
+    timeout_rate: float = 0.0            # 挂起后返回504的概率
+    timeout_seconds: float = 30.0
+    malformed_rate: float = 0.0          # 返回无法解析内容的概率
+    chunk_tokens: int = 4                # 流式输出每个片段的令牌数
+
+
+@dataclass
+class FakeServerStats:
+    """请求统计"""
+    chat_requests: int = 0
+    stream_requests: int = 0
+    embedding_requests: int = 0
+    embedding_inputs: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    embedding_tokens: int = 0
+    faults: Dict[str, int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts) -> None:
+        with self.lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def add_fault(self, kind: str) -> None:
+        with self.lock:
+            self.faults[kind] = self.faults.get(kind, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "chat_requests": self.chat_requests,
+                "stream_requests": self.stream_requests,
+                "embedding_requests": self.embedding_requests,
+                "embedding_inputs": self.embedding_inputs,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "embedding_tokens": self.embedding_tokens,
+                "faults": dict(self.faults)
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            for name in ("chat_requests", "stream_requests", "embedding_requests", "embedding_inputs",
+                         "prompt_tokens", "completion_tokens", "embedding_tokens"):
+                setattr(self, name, 0)
+            self.faults.clear()
+
+
+# ---------------------------------------------------------------------------
+# 固定响应：按系统提示和用户消息首行中的关键词匹配，先注册者优先
+# ---------------------------------------------------------------------------
+
+Responder = Callable[[str, str], str]
+RESPONDERS: List[Tuple[str, Responder, bool]] = []
+
+
+def register_responder(keyword: str, json_output: bool = False):
+    """注册固定响应，keyword出现在系统提示或用户消息首行时使用
+
+    json_output为True表示代理会把响应当作JSON解析，故障注入时可以返回无效内容。
+    """
+    def decorator(func: Responder) -> Responder:
+        RESPONDERS.append((keyword, func, json_output))
+        return func
+    return decorator
+
+
+def _sentences(text: str) -> List[str]:
+    parts = re.split(r"(?<=[。！？!?；;])|\n+", text)
+    return [p.strip() for p in parts if p and p.strip()]
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _extract_json_after(text: str, marker: str) -> Optional[Any]:
+    """提取marker之后的第一个JSON值"""
+    index = text.find(marker)
+    if index < 0:
+        return None
+    rest = text[index + len(marker):].lstrip()
+    try:
+        value, _ = json.JSONDecoder().raw_decode(rest)
+        return value
+    except ValueError:
+        return None
+
+
+@register_responder("转换为3-5个问答对")
+def _qa_pairs(system: str, user: str) -> str:
+    sentences = _sentences(user) or [user.strip() or "空文本"]
+    lines = []
+    for i, sentence in enumerate(sentences[:3]):
+        lines.append(f"Q: 第{i + 1}个要点讲了什么？")
+        lines.append(f"A: {sentence[:200]}")
+    return "\n".join(lines)
+
+
+@register_responder("改写以下查询")
+def _rewrite_query(system: str, user: str) -> str:
+    query = user.strip()
+    return "\n".join([query, f"关于{query}的史料记载", f"{query}的历史背景"])
+
+
+@register_responder("假设的文档片段")
+def _hyde(system: str, user: str) -> str:
+    return f"据史料记载，{user.strip()}一事在当时影响深远。"
+
+
+@register_responder("设计检索策略", json_output=True)
+def _strategy(system: str, user: str) -> str:
+    return _dumps({
+        "method": "vector",
+        "keywords": [user.strip()[:20]],
+        "params": {"k": 5, "min_relevance": 0.0},
+        "sort": "score"
+    })
+
+
+@register_responder("分析以下查询的意图", json_output=True)
+def _query_intent(system: str, user: str) -> str:
+    return _dumps({"type": "factual", "concepts": [user.strip()[:20]], "expected": "史实", "expansions": []})
+
+
+@register_responder("确定各个评估维度", json_output=True)
+def _weights(system: str, user: str) -> str:
+    return _dumps({"relevance": 0.4, "quality": 0.2, "completeness": 0.2, "reliability": 0.1, "timeliness": 0.1})
+
+
+@register_responder("重新排序以下结果列表", json_output=True)
+def _rerank(system: str, user: str) -> str:
+    results = _extract_json_after(user, "结果：")
+    if not isinstance(results, list):
+        results = []
+    return _dumps(sorted(results, key=lambda r: r.get("score", 0) if isinstance(r, dict) else 0))
+
+
+@register_responder("评估该结果的各个方面", json_output=True)
+def _evaluate_result(system: str, user: str) -> str:
+    return _dumps({"relevance": 0.8, "quality": 0.7, "completeness": 0.7, "reliability": 0.8, "timeliness": 0.5})
+
+
+@register_responder("清洗和标准化以下文本")
+def _clean(system: str, user: str) -> str:
+    paragraphs = [re.sub(r"[ \t]+", " ", p).strip() for p in re.split(r"\n\s*\n", user)]
+    return "\n\n".join(p for p in paragraphs if p)
+
+
+@register_responder("生成摘要和要点", json_output=True)
+def _summarize_chunk(system: str, user: str) -> str:
+    sentences = _sentences(user) or [user.strip()]
+    return _dumps({"summary": sentences[0][:60], "key_points": [s[:20] for s in sentences[:3]]})
+
+
+@register_responder("分析以下文本片段", json_output=True)
+def _analyze_chunk(system: str, user: str) -> str:
+    return _dumps({
+        "topic": user.strip()[:20],
+        "concepts": [],
+        "entities": [],
+        "type": "narrative",
+        "complexity": "medium"
+    })
+
+
+@register_responder("批量分析以下文本的语义内容", json_output=True)
+def _semantic_batch(system: str, user: str) -> str:
+    try:
+        texts = json.loads(user)
+    except ValueError:
+        texts = {}
+    return _dumps({
+        key: {"c": [str(text)[:10]], "t": [str(text)[:10]], "s": str(text)[:50], "i": 0.5}
+        for key, text in (texts.items() if isinstance(texts, dict) else [])
+    })
+
+
+@register_responder("分析以下文本的语义内容", json_output=True)
+def _semantic(system: str, user: str) -> str:
+    text = user.split("\n", 2)[-1].strip()
+    return _dumps({
+        "key_concepts": [text[:10]],
+        "main_topics": [text[:10]],
+        "semantic_summary": text[:50],
+        "importance_score": 0.5
+    })
+
+
+@register_responder("评估检索结果与查询的相关性", json_output=True)
+def _similarity_relevance(system: str, user: str) -> str:
+    return _dumps({"relevance_score": 0.7, "explanation": "模拟评估"})
+
+
+@register_responder("返回0-1之间的分数")
+def _score(system: str, user: str) -> str:
+    return "0.7"
+
+
+@register_responder("可用的代理类型", json_output=True)
+def _route(system: str, user: str) -> str:
+    return _dumps({"steps": [{"agent": "rag", "task": user.strip()}]})
+
+
+@register_responder("JSON格式", json_output=True)
+def _generic_json(system: str, user: str) -> str:
+    return _dumps({"score": 80, "relevance": 80, "accuracy": 80, "completeness": 80, "suggestions": ["模拟建议"]})
+
+
+def _default(system: str, user: str) -> str:
+    return f"模拟回答：{user.strip()[:200]}"
+
+
+def respond(messages: List[Dict[str, Any]]) -> Tuple[str, bool]:
+    """根据消息选择固定响应，返回(内容, 是否期望JSON)"""
+    system = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    user = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") != "system")
+    instruction = system + "\n" + user.split("\n", 1)[0]
+    for keyword, func, json_output in RESPONDERS:
+        if keyword in instruction:
+            return func(system, user), json_output
+    return _default(system, user), False
+
+
+def fake_embedding(item: Any, dim: int) -> List[float]:
+    """确定性的伪嵌入：字符（或令牌）一元和二元组哈希到各维度后归一化
+
+    共享片段越多的文本向量越接近，足以让相似度检索产生有意义的排序。
+    """
+    units = [str(t) for t in item] if isinstance(item, list) else list(str(item))
+    features = units + [a + "\x00" + b for a, b in zip(units, units[1:])]
+    vector = [0.0] * dim
+    for feature in features or [""]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dim] += 1.0 if (value >> 63) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOpenAIServer:
+    """在后台线程运行的模拟服务，可作为上下文管理器使用"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[FakeServerConfig] = None):
+        self.config = config or FakeServerConfig()
+        self.stats = FakeServerStats()
+        self.latency = LatencyModel(self.config.latency)
+        self.embedding_latency = LatencyModel(self.config.embedding_latency)
+        self._attempts: Dict[str, int] = {}
+        self._attempts_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def rng_for(self, body: bytes) -> random.Random:
+        """同一请求体第n次出现时使用固定的随机源，结果与并发顺序无关"""
+        digest = hashlib.sha256(body).hexdigest()
+        with self._attempts_lock:
+            attempt = self._attempts.get(digest, 0)
+            self._attempts[digest] = attempt + 1
+        return random.Random(f"{self.config.seed}:{digest}:{attempt}")
+
+    def pick_fault(self, rng: random.Random) -> Optional[str]:
+        roll = rng.random()
+        for kind, rate in (("rate_limit", self.config.rate_limit_rate),
+                           ("error", self.config.error_rate),
+                           ("timeout", self.config.timeout_rate),
+                           ("malformed", self.config.malformed_rate)):
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+                self._send_json(status, {"error": {"message": message, "type": "fake_error", "code": status}}, headers)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+                elif self.path.rstrip("/").endswith("/stats"):
+                    self._send_json(200, server.stats.to_dict())
+                else:
+                    self._send_error(404, "not found")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                raw = self.rfile.read(length)
+                try:
+                    payload = json.loads(raw or b"{}")
+                except ValueError:
+                    self._send_error(400, "invalid json")
+                    return
+                rng = server.rng_for(raw)
+                fault = server.pick_fault(rng)
+                if fault in ("rate_limit", "error", "timeout"):
+                    server.stats.add_fault(fault)
+                    if fault == "rate_limit":
+                        self._send_error(429, "rate limit exceeded (injected)", {"Retry-After": "0.1"})
+                    elif fault == "error":
+                        self._send_error(500, "internal error (injected)")
+                    else:
+                        time.sleep(server.config.timeout_seconds)
+                        self._send_error(504, "gateway timeout (injected)")
+                    return
+
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    self._chat(payload, rng, fault == "malformed")
+                elif self.path.rstrip("/").endswith("/embeddings"):
+                    self._embeddings(payload, rng)
+                else:
+                    self._send_error(404, "not found")
+
+            def _chat(self, payload: Dict[str, Any], rng: random.Random, malformed: bool) -> None:
+                messages = payload.get("messages", [])
+                content, json_output = respond(messages)
+                if malformed and json_output:
+                    server.stats.add_fault("malformed")
+                    content = "抱歉，我无法按要求的格式回答。"
+                # 按令牌估算截断并报告length；结构化响应保持完整，避免产生真实接口不会出现的半截JSON
+                max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens")
+                finish_reason = "stop"
+                if max_tokens and not json_output and count_tokens(content) > max_tokens:
+                    content = truncate_tokens(content, max_tokens)
+                    finish_reason = "length"
+                prompt_tokens = sum(count_tokens(str(m.get("content", ""))) + 4 for m in messages) + 3
+                completion_tokens = count_tokens(content)
+                server.stats.add(chat_requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+                time.sleep(server.latency.sample(rng))
+                model = payload.get("model", "fake-model")
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+
+                if not payload.get("stream"):
+                    if server.config.tokens_per_second > 0:
+                        time.sleep(completion_tokens / server.config.tokens_per_second)
+                    self._send_json(200, {
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": finish_reason
+                        }],
+                        "usage": usage
+                    })
+                    return
+
+                server.stats.add(stream_requests=1)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def event(choices, extra=None):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": choices
+                    }
+                    chunk.update(extra or {})
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                pieces = self._pieces(content)
+                event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+                for piece in pieces:
+                    if server.config.tokens_per_second > 0:
+                        time.sleep(count_tokens(piece) / server.config.tokens_per_second)
+                    event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    event([], {"usage": usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def _pieces(self, content: str) -> List[str]:
+                """按大约chunk_tokens个令牌切分流式片段"""
+                size = max(1, server.config.chunk_tokens)
+                units = re.findall(r"[A-Za-z0-9]+\s*|\s+|.", content, flags=re.S)
+                return ["".join(units[i:i + size]) for i in range(0, len(units), size)]
+
+            def _embeddings(self, payload: Dict[str, Any], rng: random.Random) -> None:
+                inputs = payload.get("input", [])
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                dim = int(payload.get("dimensions") or server.config.embedding_dim)
+                tokens = sum(len(i) if isinstance(i, list) else count_tokens(i) for i in inputs)
+                server.stats.add(embedding_requests=1, embedding_inputs=len(inputs), embedding_tokens=tokens)
+                time.sleep(server.embedding_latency.sample(rng))
+
+                data = []
+                for index, item in enumerate(inputs):
+                    vector = fake_embedding(item, dim)
+                    if payload.get("encoding_format") == "base64":
+                        embedding: Any = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+                    else:
+                        embedding = vector
+                    data.append({"object": "embedding", "index": index, "embedding": embedding})
+                self._send_json(200, {
+                    "object": "list",
+                    "data": data,
+                    "model": payload.get("model", "fake-embedding"),
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--latency", default="fixed:0", help="首个令牌前的延迟分布，如 lognormal:-1.6,0.4")
+    parser.add_argument("--embedding-latency", default="fixed:0", help="嵌入接口的延迟分布")
+    parser.add_argument("--tps", type=float, default=0.0, help="每秒生成的令牌数，0表示不限速")
+    parser.add_argument("--embedding-dim", type=int, default=1536, help="嵌入向量维度")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="挂起后返回504的概率")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0, help="超时故障的挂起时长")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="JSON响应返回无效内容的概率")
+    args = parser.parse_args()
+
+    config = FakeServerConfig(
+        seed=args.seed,
+        latency=args.latency,
+        tokens_per_second=args.tps,
+        embedding_latency=args.embedding_latency,
+        embedding_dim=args.embedding_dim,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        malformed_rate=args.malformed_rate
+    )
+    server = FakeOpenAIServer(args.host, args.port, config)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""RAG导入与查询管道的基准测试
+
+全部在本地模拟服务上离线运行，每个用例在独立子进程中执行以得到准确的峰值内存。
+
+用法：
+    python run_benchmarks.py                                  # 默认 1k/10k/100k
+    python run_benchmarks.py --sizes 1000 --cases ingest query
+    python run_benchmarks.py --output results.json --save-baseline baselines/local.json
+    python run_benchmarks.py --baseline baselines/local.json  # 与基线比较，退化时返回非零
+"""
+from typing import Dict, Any, List, Callable
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SRC_DIR)
+
+from fake_openai_server import FakeOpenAIServer, FakeServerConfig
+import corpus
+
+CASES = ["ingest", "database", "find_similar", "query"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值的百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def timed(func: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def summarize(latencies: List[float], items: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "items": items,
+        "operations": len(latencies),
+        "elapsed_s": elapsed,
+        "throughput_items_s": items / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000
+    }
+
+
+def bench_ingest(size: int, args, workdir: str, server) -> Dict[str, Any]:
+    """RAGAgent.load_documents：逐个文件导入"""
+    from agents.rag.rag_agent import RAGAgent
+    paths = corpus.write_corpus(os.path.join(workdir, "corpus"), size, args.chunks_per_file, args.seed)
+    agent = RAGAgent(streaming=False)
+    latencies = []
+    start = time.perf_counter()
+    for path in paths:
+        _, elapsed = timed(agent.load_documents, [path])
+        latencies.append(elapsed)
+    return summarize(latencies, size, time.perf_counter() - start)
+
+
+def bench_database(size: int, args, workdir: str, server) -> Dict[str, Any]:
+    """DatabaseAgent.add_knowledge逐条写入，随后search_knowledge查询；另用add_knowledge_batch一次写入预先计算的向量"""
+    from agents.rag.database_agent import DatabaseAgent
+    agent = DatabaseAgent(streaming=False)
+    texts = corpus.make_chunks(size, args.seed)
+    add_latencies = []
+    start = time.perf_counter()
+    for text in texts:
+        _, elapsed = timed(agent.add_knowledge, text, {"source": "bench"})
+        add_latencies.append(elapsed)
+    add_elapsed = time.perf_counter() - start
+
+    search_latencies = []
+    queries = corpus.make_queries(args.queries, args.seed + 1)
+    start = time.perf_counter()
+    for query in queries:
+        _, elapsed = timed(agent.search_knowledge, query, 5)
+        search_latencies.append(elapsed)
+    search_elapsed = time.perf_counter() - start
+
+    # 预先生成嵌入，只计批量写入本身
+    embeddings = agent.embed_documents(texts)
+    _, batch_elapsed = timed(DatabaseAgent(streaming=False).add_knowledge_batch,
+                             texts, [{"source": "bench"} for _ in texts], embeddings)
+    return {
+        "add": summarize(add_latencies, size, add_elapsed),
+        "add_batch": summarize([batch_elapsed], size, batch_elapsed),
+        "search": summarize(search_latencies, len(queries), search_elapsed)
+    }
+
+
+def bench_find_similar(size: int, args, workdir: str, server) -> Dict[str, Any]:
+    """EmbeddingAgent.find_similar：在size个候选中逐个查询，以及find_similar_batch一次查询全部"""
+    from agents.rag.embedding_agent import EmbeddingAgent
+    agent = EmbeddingAgent(streaming=False)
+    texts = corpus.make_chunks(size, args.seed)
+    queries = corpus.make_queries(args.queries, args.seed + 1)
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        _, elapsed = timed(agent.find_similar, query, texts, 5)
+        latencies.append(elapsed)
+    single = summarize(latencies, len(queries), time.perf_counter() - start)
+    _, elapsed = timed(agent.find_similar_batch, queries, texts, 5)
+    return {"single": single, "batch": summarize([elapsed], len(queries), elapsed)}
+
+
+def bench_query(size: int, args, workdir: str, server) -> Dict[str, Any]:
+    """RAGAgent.query：先导入size个片段（不计时、不计调用），再测量查询"""
+    from agents.rag.rag_agent import RAGAgent
+    paths = corpus.write_corpus(os.path.join(workdir, "corpus"), size, args.chunks_per_file, args.seed)
+    agent = RAGAgent(streaming=False)
+    agent.load_documents(paths)
+    server.stats.reset()
+    from agents.tracing import get_aggregator
+    get_aggregator().reset()
+    queries = corpus.make_queries(args.queries, args.seed + 1)
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        _, elapsed = timed(agent.query, query)
+        latencies.append(elapsed)
+    return summarize(latencies, len(queries), time.perf_counter() - start)
+
+
+BENCHMARKS = {
+    "ingest": bench_ingest,
+    "database": bench_database,
+    "find_similar": bench_find_similar,
+    "query": bench_query
+}
+
+
+def run_case(case: str, size: int, args) -> Dict[str, Any]:
+    """在当前进程运行单个用例"""
+    config = FakeServerConfig(
+        seed=args.seed,
+        latency=args.latency,
+        tokens_per_second=args.tps,
+        embedding_latency=args.embedding_latency
+    )
+    with FakeOpenAIServer(config=config) as server, tempfile.TemporaryDirectory() as workdir:
+        os.environ["OPENAI_API_BASE"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "fake-key"
+        os.environ["HISTORIAN_CACHE_DIR"] = os.path.join(workdir, "cache")
+        # 不按tiktoken切分嵌入输入，无需联网下载编码文件
+        os.environ["EMBEDDING_CHECK_CTX_LENGTH"] = "off"
+        if not args.cache:
+            os.environ["RESPONSE_CACHE"] = "off"
+            os.environ["EMBEDDING_CACHE"] = "off"
+        if args.trace:
+            os.environ["HISTORIAN_TRACE"] = "1"
+
+        metrics = BENCHMARKS[case](size, args, workdir, server)
+        stats = server.stats.to_dict()
+    result = {
+        "case": case,
+        "size": size,
+        "metrics": metrics,
+        "llm": {
+            "chat_calls": stats["chat_requests"],
+            "embedding_calls": stats["embedding_requests"],
+            "prompt_tokens": stats["prompt_tokens"],
+            "completion_tokens": stats["completion_tokens"],
+            "embedding_tokens": stats["embedding_tokens"]
+        },
+        "peak_rss_mb": peak_rss_mb()
+    }
+    if args.trace:
+        from agents.tracing import get_aggregator
+        result["trace"] = get_aggregator().summary()
+    return result
+
+
+def run_isolated(case: str, size: int, args) -> Dict[str, Any]:
+    """在子进程中运行用例，隔离峰值内存
+
+    结果写入单独的文件，子进程的标准输出（如流式回调打印的令牌）不影响解析。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        result_file = os.path.join(tmp, "result.json")
+        command = [sys.executable, os.path.abspath(__file__), "--worker", case, str(size),
+                   "--result-file", result_file] + args.passthrough
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0 or not os.path.exists(result_file):
+            return {"case": case, "size": size, "error": completed.stderr.strip()[-2000:]}
+        with open(result_file, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def _flatten(prefix: str, metrics: Dict[str, Any], out: Dict[str, float]) -> None:
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            _flatten(f"{prefix}{key}.", value, out)
+        elif isinstance(value, (int, float)):
+            out[prefix + key] = float(value)
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """与基线比较吞吐量和p95延迟，返回退化描述"""
+    indexed = {(b["case"], b["size"]): b for b in baseline if "metrics" in b}
+    regressions = []
+    for result in results:
+        base = indexed.get((result["case"], result["size"]))
+        if base is None or "metrics" not in result:
+            continue
+        current, previous = {}, {}
+        _flatten("", result["metrics"], current)
+        _flatten("", base["metrics"], previous)
+        for key, value in current.items():
+            old = previous.get(key)
+            if not old:
+                continue
+            if key.endswith("throughput_items_s") and value < old * (1 - tolerance):
+                regressions.append(f"{result['case']}@{result['size']} {key}: {old:.2f} -> {value:.2f}")
+            if key.endswith("p95_ms") and value > old * (1 + tolerance):
+                regressions.append(f"{result['case']}@{result['size']} {key}: {old:.2f} -> {value:.2f}")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Historian RAG基准测试")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES, help="要运行的用例")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000], help="语料片段数")
+    parser.add_argument("--queries", type=int, default=20, help="查询次数")
+    parser.add_argument("--chunks-per-file", type=int, default=100, help="每个文件的片段数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--latency", default="fixed:0", help="模拟服务的聊天延迟分布")
+    parser.add_argument("--embedding-latency", default="fixed:0", help="模拟服务的嵌入延迟分布")
+    parser.add_argument("--tps", type=float, default=0.0, help="模拟服务的生成速度")
+    parser.add_argument("--cache", action="store_true", help="启用响应缓存和嵌入缓存（默认关闭以测量冷启动）")
+    parser.add_argument("--trace", action="store_true", help="启用追踪并在结果中附带各代理方法的耗时汇总")
+    parser.add_argument("--output", help="结果JSON输出路径，默认打印到标准输出")
+    parser.add_argument("--baseline", help="要比较的基线JSON")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化幅度")
+    parser.add_argument("--worker", nargs=2, metavar=("CASE", "SIZE"), help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser
+
+
+def main() -> int:
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.worker:
+        case, size = args.worker[0], int(args.worker[1])
+        result = run_case(case, size, args)
+        if args.result_file:
+            with open(args.result_file, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+        else:
+            print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    # 传给子进程的公共参数
+    args.passthrough = [
+        "--queries", str(args.queries),
+        "--chunks-per-file", str(args.chunks_per_file),
+        "--seed", str(args.seed),
+        "--latency", args.latency,
+        "--embedding-latency", args.embedding_latency,
+        "--tps", str(args.tps)
+    ] + (["--cache"] if args.cache else []) + (["--trace"] if args.trace else [])
+
+    results = []
+    for size in args.sizes:
+        for case in args.cases:
+            result = run_isolated(case, size, args)
+            results.append(result)
+            status = "失败" if "error" in result else "完成"
+            print(f"[{status}] {case} @ {size}", file=sys.stderr)
+
+    report = {
+        "python": sys.version.split()[0],
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    exit_code = 1 if any("error" in r for r in results) else 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"[退化] {line}", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
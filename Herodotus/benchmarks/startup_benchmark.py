@@ -0,0 +1,134 @@
+"""CLI启动时间基准与导入预算检查
+
+测量 main.py 的冷启动耗时，并用 ``python -X importtime`` 检查轻量路径
+（--help、参数错误、import agents）没有加载重依赖。超出预算或加载了禁止的模块时返回非零。
+
+用法：
+    python startup_benchmark.py
+    python startup_benchmark.py --runs 20 --budget cli_help=200
+    python startup_benchmark.py --json
+"""
+from typing import Dict, Any, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "src"))
+MAIN = os.path.join(SRC_DIR, "main.py")
+
+# 用例名 -> 命令参数（在src目录下执行）
+CASES = {
+    "cli_help": [MAIN, "--help"],
+    "cli_usage_error": [MAIN],
+    "import_agents": ["-c", "import agents"],
+}
+
+# 默认耗时预算（毫秒，取中位数），包含解释器自身的启动时间
+DEFAULT_BUDGETS_MS = {
+    "cli_help": 300.0,
+    "cli_usage_error": 300.0,
+    "import_agents": 200.0,
+}
+
+# 轻量路径不允许加载的顶层模块
+FORBIDDEN_MODULES = [
+    "langchain", "langchain_core", "langchain_community", "langchain_openai",
+    "openai", "numpy", "faiss", "tiktoken", "httpx", "dotenv", "PyQt6",
+]
+
+
+def run_once(argv: List[str], importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + argv
+    return subprocess.run(command, cwd=SRC_DIR, capture_output=True, text=True)
+
+
+def measure(argv: List[str], runs: int) -> Dict[str, float]:
+    """多次运行命令，返回墙钟时间统计（毫秒）"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_once(argv)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "runs": runs,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "max_ms": timings[-1]
+    }
+
+
+def imported_modules(argv: List[str]) -> Dict[str, int]:
+    """解析-X importtime输出，返回 模块名 -> 累计导入耗时（微秒）"""
+    modules = {}
+    for line in run_once(argv, importtime=True).stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        modules[parts[2].strip()] = int(parts[1])
+    return modules
+
+
+def check_case(name: str, argv: List[str], runs: int, budget_ms: float) -> Dict[str, Any]:
+    timing = measure(argv, runs)
+    modules = imported_modules(argv)
+    forbidden = sorted({m.split(".")[0] for m in modules} & set(FORBIDDEN_MODULES))
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]
+    return {
+        "case": name,
+        "timing": timing,
+        "budget_ms": budget_ms,
+        "over_budget": timing["median_ms"] > budget_ms,
+        "forbidden_imports": forbidden,
+        "slowest_imports_us": dict(slowest)
+    }
+
+
+def parse_budgets(values: List[str]) -> Dict[str, float]:
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for value in values or []:
+        name, _, ms = value.partition("=")
+        if name not in CASES or not ms:
+            raise argparse.ArgumentTypeError(f"无效的预算: {value}")
+        budgets[name] = float(ms)
+    return budgets
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Historian CLI启动时间基准")
+    parser.add_argument("--runs", type=int, default=10, help="每个用例的运行次数")
+    parser.add_argument("--budget", action="append", metavar="CASE=MS", help="覆盖用例的耗时预算")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    try:
+        budgets = parse_budgets(args.budget)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    results = [check_case(name, argv, args.runs, budgets[name]) for name, argv in CASES.items()]
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            timing = result["timing"]
+            status = "超出预算" if result["over_budget"] else "通过"
+            print(f"{result['case']:<18} 中位数 {timing['median_ms']:7.1f}ms "
+                  f"(最小 {timing['min_ms']:.1f}ms, 预算 {result['budget_ms']:.0f}ms) {status}")
+            if result["forbidden_imports"]:
+                print(f"{'':<18} 加载了重依赖: {', '.join(result['forbidden_imports'])}")
+
+    failed = any(r["over_budget"] or r["forbidden_imports"] for r in results)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
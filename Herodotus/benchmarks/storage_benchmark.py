@@ -0,0 +1,115 @@
+"""向量存储方式的召回率与内存对比
+
+用与嵌入相似的合成向量（带聚类结构、L2归一化）分别构建flat/float16/int8/pq索引，
+以flat的精确结果为基准计算recall@k，并报告每个向量的字节数、序列化大小、构建和查询耗时，
+以及按该字节数推算的千万级向量内存占用（不含文本和元数据）。
+
+用法：
+    python storage_benchmark.py
+    python storage_benchmark.py --sizes 100000 1000000 --dim 1536 --queries 500
+    python storage_benchmark.py --modes float16 pq --json
+"""
+from typing import Dict, Any
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCH_DIR, "..", "src")))
+
+from agents.rag.vector_index import STORAGE_MODES, create_index, needs_training, bytes_per_vector  # noqa: E402
+
+
+def make_vectors(count: int, dim: int, seed: int, clusters: int = 256) -> np.ndarray:
+    """生成带聚类结构的归一化向量，近似真实嵌入的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def bench_mode(mode: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+               k: int, train_samples: int) -> Dict[str, Any]:
+    import faiss
+    start = time.perf_counter()
+    training = vectors[:train_samples] if needs_training(mode) else None
+    index = create_index(mode, vectors.shape[1], training)
+    index.add(vectors)
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    found = np.empty_like(truth)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = ids[0]
+
+    per_vector = bytes_per_vector(index)
+    return {
+        "mode": mode,
+        "recall_at_k": round(recall_at_k(found, truth), 4),
+        "bytes_per_vector": per_vector,
+        "compression": round(vectors.shape[1] * 4 / per_vector, 1),
+        "serialized_mb": round(len(faiss.serialize_index(index)) / 1e6, 2),
+        "build_s": round(build_s, 3),
+        "query_p50_ms": round(statistics.median(latencies), 3),
+    }
+
+
+def run_size(size: int, args) -> Dict[str, Any]:
+    import faiss
+    vectors = make_vectors(size, args.dim, args.seed)
+    queries = make_vectors(args.queries, args.dim, args.seed + 1)
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    results = [bench_mode(mode, vectors, queries, truth, args.k, min(size, args.train_samples)) for mode in args.modes]
+    for result in results:
+        result["projected_gb"] = round(result["bytes_per_vector"] * args.project / 1e9, 2)
+    return {"size": size, "dim": args.dim, "k": args.k, "project": args.project, "results": results}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Historian向量存储召回率与内存对比")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000], help="向量数")
+    parser.add_argument("--dim", type=int, default=1536, help="向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k的k")
+    parser.add_argument("--modes", nargs="+", choices=STORAGE_MODES, default=list(STORAGE_MODES), help="存储方式")
+    parser.add_argument("--train-samples", type=int, default=100000, help="需要训练的方式使用的样本数")
+    parser.add_argument("--project", type=int, default=10_000_000, help="推算内存占用的向量数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    reports = [run_size(size, args) for size in args.sizes]
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+        return 0
+
+    for report in reports:
+        print(f"向量数 {report['size']}，维度 {report['dim']}，recall@{report['k']}，"
+              f"推算 {report['project']:,} 个向量的内存")
+        print(f"{'方式':<10}{'召回率':>8}{'字节/向量':>11}{'压缩比':>8}{'序列化MB':>10}"
+              f"{'构建s':>9}{'查询p50ms':>11}{'推算GB':>9}")
+        for r in report["results"]:
+            print(f"{r['mode']:<10}{r['recall_at_k']:>8.3f}{r['bytes_per_vector']:>11.0f}{r['compression']:>8.1f}"
+                  f"{r['serialized_mb']:>10.2f}{r['build_s']:>9.2f}{r['query_p50_ms']:>11.3f}{r['projected_gb']:>9.2f}")
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""Historian代理包
+
+代理类在首次访问时才导入对应模块，``import agents`` 本身不会加载LangChain等重依赖：
+
+    from agents import RAGAgent
+"""
+from typing import List
+import importlib
+
+# 导出名称 -> 所在模块
+_LAZY_EXPORTS = {
+    "BaseAgent": ".base_agent",
+    "RAGAgent": ".rag.rag_agent",
+    "DataAgent": ".rag.data_agent",
+    "RewriteAgent": ".rag.rewrite_agent",
+    "EmbeddingAgent": ".rag.embedding_agent",
+    "DatabaseAgent": ".rag.database_agent",
+    "RetrievalAgent": ".rag.retrieval_agent",
+    "RerankAgent": ".rag.rerank_agent",
+    "ToolAgent": ".tools.tool_agent",
+    "MemoryAgent": ".memory.memory_agent",
+    "RouterAgent": ".router.router_agent",
+    "ReasoningAgent": ".reasoning.reasoning_agent",
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # 缓存到包命名空间，之后的访问不再经过__getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + __all__)
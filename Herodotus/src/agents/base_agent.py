@@ -1,11 +1,21 @@
-from typing import Optional, Dict, Any
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain.callbacks.manager import CallbackManager
+from typing import Optional, Dict, Any, List, Iterable, Iterator, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
+from .client_pool import get_chat_model, get_embeddings
+from .local_embeddings import DEFAULT_LOCAL_MODEL
+from .response_cache import resolve_cache, make_cache_key
+from .embedding_cache import resolve_embedding_cache
+from .embedding_batcher import EmbeddingBatcher
+from .rate_limiter import (get_rate_limiter, call_with_retry, acall_with_retry,
+                           estimate_tokens, estimate_messages_tokens, chat_key, embedding_key)
+from .tracing import span, current_span, usage_tokens
 import os
 import json
+import time
+import asyncio
+import itertools
+import contextvars
 import logging
 
 # 加载环境变量
@@ -39,45 +49,427 @@ class BaseAgent:
             raise ValueError("OpenAI API key is required")
             
         # 从环境变量获取配置
-        temperature = float(os.getenv("TEMPERATURE", "0.7"))
-        max_tokens = int(os.getenv("MAX_TOKENS", "2000"))
+        self.temperature = float(os.getenv("TEMPERATURE", "0.7"))
+        self.max_tokens = int(os.getenv("MAX_TOKENS", "2000"))
         
-        # 设置回调
-        callback_manager = CallbackManager([StreamingStdOutCallbackHandler()]) if self.streaming else None
-        
-        # 初始化语言模型
-        self.llm = ChatOpenAI(
+        # 从进程级客户端池获取语言模型，相同配置的代理共享客户端和连接
+        self.llm = get_chat_model(
             model_name=model_name,
-            openai_api_key=self.api_key,
-            openai_api_base=self.api_base,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            streaming=self.streaming,
-            callback_manager=callback_manager
+            api_key=self.api_key,
+            api_base=self.api_base,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            streaming=self.streaming
+        )
+        
+        # 初始化嵌入模型：EMBEDDING_BACKEND为openai（默认）或local（本地CPU模型，不经过限流调度）
+        self.embedding_backend = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+        self.embedding_model = os.getenv(
+            "EMBEDDING_MODEL",
+            DEFAULT_LOCAL_MODEL if self.embedding_backend == "local" else "text-embedding-ada-002"
+        )
+        self.embeddings = get_embeddings(
+            api_key=self.api_key,
+            api_base=self.api_base,
+            model=self.embedding_model,
+            backend=self.embedding_backend
+        )
+        
+        # 响应缓存，默认只对确定性调用（temperature为0）启用
+        self.response_cache = resolve_cache(self.temperature)
+        # 嵌入缓存，默认开启，同一文本跨运行只生成一次嵌入；首次生成嵌入时才创建
+        self._embedding_cache = None
+        self._embedding_cache_resolved = False
+        # 嵌入请求按令牌数装包并发发送
+        self.embedding_batcher = EmbeddingBatcher(model=self.embedding_model)
+        
+    def _stream_llm(self):
+        """逐段返回给调用方时使用的客户端，不挂终端输出回调，避免文本同时回显到stdout"""
+        if not self.streaming:
+            return self.llm
+        return get_chat_model(
+            model_name=self.model_name,
+            api_key=self.api_key,
+            api_base=self.api_base,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            streaming=False
         )
         
-        # 初始化嵌入模型
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002",
-            openai_api_key=self.api_key,
-            openai_api_base=self.api_base
+    def _cache_key(self, messages) -> str:
+        """生成当前模型配置下的缓存键"""
+        return make_cache_key(
+            self.model_name,
+            {"temperature": self.temperature, "max_tokens": self.max_tokens},
+            messages,
+            api_base=self.api_base
         )
         
+    def _on_retry(self, key: str, target=None):
+        """重试回调：计入调度器统计和span（默认为当前span）"""
+        limiter = get_rate_limiter()
+        
+        def callback(error):
+            limiter.record_retry(key, error)
+            (target or current_span()).add("retries")
+            
+        return callback
+        
+    def _invoke(self, messages):
+        """经过全局调度器调用语言模型，限流和临时错误按退避重试"""
+        limiter = get_rate_limiter()
+        key = chat_key(self.api_base, self.model_name)
+        tokens = estimate_messages_tokens(messages, self.model_name) + self.max_tokens
+        
+        def call():
+            limiter.acquire(key, tokens)
+            used = 0  # 失败的调用按未使用结算，预留全部退回
+            try:
+                response = self.llm.invoke(messages)
+                used = self._used_tokens(response, tokens - self.max_tokens)
+                return response
+            finally:
+                limiter.reconcile(key, tokens, used)
+            
+        return call_with_retry(call, on_retry=self._on_retry(key))
+        
+    async def _ainvoke(self, messages):
+        """_invoke的异步版本"""
+        limiter = get_rate_limiter()
+        key = chat_key(self.api_base, self.model_name)
+        tokens = estimate_messages_tokens(messages, self.model_name) + self.max_tokens
+        
+        async def call():
+            await limiter.aacquire(key, tokens)
+            used = 0  # 失败的调用按未使用结算，预留全部退回
+            try:
+                response = await self.llm.ainvoke(messages)
+                used = self._used_tokens(response, tokens - self.max_tokens)
+                return response
+            finally:
+                limiter.reconcile(key, tokens, used)
+            
+        return await acall_with_retry(call, on_retry=self._on_retry(key))
+        
+    def _used_tokens(self, response, prompt_estimate: int) -> int:
+        """调用实际使用的令牌数，响应没有用量信息时按估算"""
+        prompt_tokens, completion_tokens = usage_tokens(response)
+        if prompt_tokens is None:
+            prompt_tokens = prompt_estimate
+        if completion_tokens is None:
+            content = getattr(response, "content", "")
+            completion_tokens = estimate_tokens(content if isinstance(content, str) else str(content), self.model_name)
+        return prompt_tokens + completion_tokens
+        
+    @property
+    def embedding_cache(self):
+        """进程级嵌入缓存，首次访问时才导入numpy并打开缓存目录，未启用时为None"""
+        if not self._embedding_cache_resolved:
+            self._embedding_cache = resolve_embedding_cache()
+            self._embedding_cache_resolved = True
+        return self._embedding_cache
+        
+    def _embedding_cache_model(self) -> str:
+        """嵌入缓存中的模型标识：本地模型只看模型名，远程模型同时区分接口地址"""
+        if self.embedding_backend == "local":
+            return f"local:{self.embedding_model}"
+        return f"{self.embedding_model}@{self.api_base}"
+        
+    def _cached_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """从嵌入缓存读取，未启用缓存或未命中的位置为None"""
+        if self.embedding_cache is None:
+            return [None] * len(texts)
+        return self.embedding_cache.get_many(self._embedding_cache_model(), texts)
+        
+    def _store_embeddings(self, texts: List[str], vectors: List[List[float]]) -> None:
+        if self.embedding_cache is not None:
+            self.embedding_cache.put_many(self._embedding_cache_model(), texts, vectors)
+            
+    def _send_embedding_pack(self, texts: List[str], tokens: int) -> List[List[float]]:
+        """发送一个嵌入请求包，配额由全局调度器控制，限流和临时错误按退避重试"""
+        limiter = get_rate_limiter()
+        key = embedding_key(self.api_base, self.embedding_model)
+        with span("embed_batch", self, count=len(texts), prompt_tokens=tokens) as sp:
+            
+            def call():
+                limiter.acquire(key, tokens)
+                return self.embeddings.embed_documents(texts)
+                
+            return call_with_retry(call, on_retry=self._on_retry(key, sp))
+            
+    def _embed_cached(self, texts: List[str], compute) -> List[List[float]]:
+        """查询嵌入缓存，批内去重后只为未命中的文本调用compute，结果写回缓存"""
+        with span("embed_documents", self, count=len(texts)) as sp:
+            unique = list(dict.fromkeys(texts))
+            vectors = dict(zip(unique, self._cached_embeddings(unique)))
+            missing = [text for text in unique if vectors[text] is None]
+            sp.set(cache_hits=len(unique) - len(missing))
+            if missing:
+                computed = compute(missing)
+                self._store_embeddings(missing, computed)
+                vectors.update(zip(missing, computed))
+            return [vectors[text] for text in texts]
+            
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """经过嵌入缓存生成文档嵌入向量
+        
+        批内重复的文本只请求一次，未命中缓存的文本按令牌数装包后并发发送（本地模型直接计算）。
+        """
+        if self.embedding_backend == "local":
+            # 本地模型自行动态分批，不需要装包和限流
+            return self._embed_cached(texts, self.embeddings.embed_documents)
+        return self._embed_cached(texts, lambda missing: self.embedding_batcher.run(missing, self._send_embedding_pack))
+            
+    def embed_iter(self, texts: Iterable[str]) -> Iterator[List[float]]:
+        """流式生成文档嵌入向量，按输入顺序逐个产出
+        
+        输入按需读取并装包，多个包并发发送，适合无法一次放入内存的大批量输入。
+        """
+        def send(pack: List[str], tokens: int) -> List[List[float]]:
+            # 包已由embedding_batcher装好，未命中缓存的部分直接发送，不再嵌套一层装包
+            if self.embedding_backend == "local":
+                return self._embed_cached(pack, self.embeddings.embed_documents)
+            return self._embed_cached(pack, lambda missing: self._send_embedding_pack(
+                missing, tokens if len(missing) == len(pack) else sum(map(estimate_tokens, missing))))
+            
+        return self.embedding_batcher.iter_run(texts, send)
+        
+    def embed_query(self, text: str) -> List[float]:
+        """经过嵌入缓存和全局调度器生成查询嵌入向量"""
+        with span("embed_query", self, count=1) as sp:
+            cached = self._cached_embeddings([text])[0]
+            sp.set(cache_hits=int(cached is not None))
+            if cached is not None:
+                return cached
+            if self.embedding_backend == "local":
+                vector = self.embeddings.embed_query(text)
+                self._store_embeddings([text], [vector])
+                return vector
+            limiter = get_rate_limiter()
+            key = embedding_key(self.api_base, self.embedding_model)
+            tokens = estimate_tokens(text, self.embedding_model)
+            sp.set(prompt_tokens=tokens)
+            
+            def call():
+                limiter.acquire(key, tokens)
+                return self.embeddings.embed_query(text)
+                
+            vector = call_with_retry(call, on_retry=self._on_retry(key, sp))
+            self._store_embeddings([text], [vector])
+            return vector
+        
+    async def aembed_query(self, text: str) -> List[float]:
+        """embed_query的异步版本"""
+        with span("embed_query", self, count=1) as sp:
+            cached = self._cached_embeddings([text])[0]
+            sp.set(cache_hits=int(cached is not None))
+            if cached is not None:
+                return cached
+            if self.embedding_backend == "local":
+                vector = await self.embeddings.aembed_query(text)
+                self._store_embeddings([text], [vector])
+                return vector
+            limiter = get_rate_limiter()
+            key = embedding_key(self.api_base, self.embedding_model)
+            tokens = estimate_tokens(text, self.embedding_model)
+            sp.set(prompt_tokens=tokens)
+            
+            async def call():
+                await limiter.aacquire(key, tokens)
+                return await self.embeddings.aembed_query(text)
+                
+            vector = await acall_with_retry(call, on_retry=self._on_retry(key, sp))
+            self._store_embeddings([text], [vector])
+            return vector
+        
     def chat(self, messages):
         """与语言模型交互"""
-        return self.llm.invoke(messages).content
+        with span("chat", self, model=self.model_name) as sp:
+            key = self._cache_key(messages) if self.response_cache is not None else None
+            if key is not None:
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    sp.set(cache_hit=True)
+                    return cached
+                    
+            response = self._invoke(messages)
+            prompt_tokens, completion_tokens = usage_tokens(response)
+            sp.set(cache_hit=False, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            content = response.content
+            
+            if key is not None:
+                self.response_cache.set(key, content)
+            return content
         
-    def process(self, task: str, context: str = "") -> str:
-        """处理任务，支持上下文传递
+    async def achat(self, messages):
+        """与语言模型异步交互"""
+        with span("achat", self, model=self.model_name) as sp:
+            key = self._cache_key(messages) if self.response_cache is not None else None
+            if key is not None:
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    sp.set(cache_hit=True)
+                    return cached
+                    
+            response = await self._ainvoke(messages)
+            prompt_tokens, completion_tokens = usage_tokens(response)
+            sp.set(cache_hit=False, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            content = response.content
+            
+            if key is not None:
+                self.response_cache.set(key, content)
+            return content
+        
+    def stream_chat(self, messages) -> Iterator[str]:
+        """流式与语言模型交互，逐段返回生成的文本
+        
+        首个片段到达前的失败按调度器的退避策略重试；命中缓存时一次性返回完整结果。
+        """
+        # 生成器可能跨上下文消费，span不设为当前span，由这里显式结束
+        sp = span("stream_chat", self, model=self.model_name)
+        error = None
+        try:
+            key = self._cache_key(messages) if self.response_cache is not None else None
+            if key is not None:
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    sp.set(cache_hit=True)
+                    yield cached
+                    return
+                    
+            limiter = get_rate_limiter()
+            limiter_key = chat_key(self.api_base, self.model_name)
+            tokens = estimate_messages_tokens(messages, self.model_name) + self.max_tokens
+            started = time.perf_counter()
+            
+            def start():
+                limiter.acquire(limiter_key, tokens)
+                try:
+                    iterator = iter(self._stream_llm().stream(messages))
+                    return next(iterator, None), iterator
+                except Exception:
+                    limiter.reconcile(limiter_key, tokens, 0)
+                    raise
+                
+            first, iterator = call_with_retry(start, on_retry=self._on_retry(limiter_key, sp))
+            sp.set(cache_hit=False, first_chunk_ms=(time.perf_counter() - started) * 1000)
+            
+            parts = []
+            try:
+                if first is not None:
+                    for chunk in itertools.chain([first], iterator):
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield chunk.content
+            finally:
+                # 中途失败或调用方提前停止时按已生成的部分结算
+                content = "".join(parts)
+                completion_tokens = estimate_tokens(content, self.model_name)
+                limiter.reconcile(limiter_key, tokens, tokens - self.max_tokens + completion_tokens)
+                        
+            sp.set(prompt_tokens=tokens - self.max_tokens, completion_tokens=completion_tokens)
+            if key is not None:
+                self.response_cache.set(key, content)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            sp.finish(error)
+            
+    async def astream_chat(self, messages) -> AsyncIterator[str]:
+        """stream_chat的异步版本"""
+        sp = span("astream_chat", self, model=self.model_name)
+        error = None
+        try:
+            key = self._cache_key(messages) if self.response_cache is not None else None
+            if key is not None:
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    sp.set(cache_hit=True)
+                    yield cached
+                    return
+                    
+            limiter = get_rate_limiter()
+            limiter_key = chat_key(self.api_base, self.model_name)
+            tokens = estimate_messages_tokens(messages, self.model_name) + self.max_tokens
+            started = time.perf_counter()
+            
+            async def start():
+                await limiter.aacquire(limiter_key, tokens)
+                try:
+                    iterator = self._stream_llm().astream(messages).__aiter__()
+                    try:
+                        return await iterator.__anext__(), iterator
+                    except StopAsyncIteration:
+                        return None, iterator
+                except Exception:
+                    limiter.reconcile(limiter_key, tokens, 0)
+                    raise
+                    
+            first, iterator = await acall_with_retry(start, on_retry=self._on_retry(limiter_key, sp))
+            sp.set(cache_hit=False, first_chunk_ms=(time.perf_counter() - started) * 1000)
+            
+            parts = []
+            try:
+                if first is not None:
+                    if first.content:
+                        parts.append(first.content)
+                        yield first.content
+                    async for chunk in iterator:
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield chunk.content
+            finally:
+                # 中途失败或调用方提前停止时按已生成的部分结算
+                content = "".join(parts)
+                completion_tokens = estimate_tokens(content, self.model_name)
+                limiter.reconcile(limiter_key, tokens, tokens - self.max_tokens + completion_tokens)
+                        
+            sp.set(prompt_tokens=tokens - self.max_tokens, completion_tokens=completion_tokens)
+            if key is not None:
+                self.response_cache.set(key, content)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            sp.finish(error)
+            
+    def _max_concurrency(self, max_concurrency: Optional[int]) -> int:
+        return max(1, max_concurrency or int(os.getenv("MAX_CONCURRENCY", "8")))
+        
+    def chat_many(self, messages_list: List[list], max_concurrency: Optional[int] = None) -> List[str]:
+        """批量与语言模型交互
         
         Args:
-            task: 要处理的任务
-            context: 上下文信息，可能来自其他代理的处理结果
+            messages_list: 每个元素是一次调用的消息列表
+            max_concurrency: 最大并发数，默认取环境变量MAX_CONCURRENCY
             
         Returns:
-            处理结果
+            与输入顺序一致的响应列表
         """
-        messages = [
+        if not messages_list:
+            return []
+        workers = min(self._max_concurrency(max_concurrency), len(messages_list))
+        if workers == 1:
+            return [self.chat(messages) for messages in messages_list]
+        # 工作线程继承调用方的上下文（如调度优先级）
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda messages: context.copy().run(self.chat, messages), messages_list))
+            
+    async def achat_many(self, messages_list: List[list], max_concurrency: Optional[int] = None) -> List[str]:
+        """异步批量与语言模型交互，参数与chat_many相同"""
+        semaphore = asyncio.Semaphore(self._max_concurrency(max_concurrency))
+        
+        async def run(messages):
+            async with semaphore:
+                return await self.achat(messages)
+                
+        return list(await asyncio.gather(*[run(messages) for messages in messages_list]))
+        
+    def _process_messages(self, task: str, context: str = "") -> list:
+        """构建通用任务处理的消息"""
+        return [
             SystemMessage(content=f"""你是一个智能代理。
             
             当前任务：{task}
@@ -89,7 +481,30 @@ class BaseAgent:
             HumanMessage(content=f"上下文信息：{context}" if context else task)
         ]
         
-        return self.chat(messages)
+    def process(self, task: str, context: str = "") -> str:
+        """处理任务，支持上下文传递
+        
+        Args:
+            task: 要处理的任务
+            context: 上下文信息，可能来自其他代理的处理结果
+            
+        Returns:
+            处理结果
+        """
+        return self.chat(self._process_messages(task, context))
+        
+    async def aprocess(self, task: str, context: str = "") -> str:
+        """异步处理任务，参数与process相同"""
+        return await self.achat(self._process_messages(task, context))
+        
+    def process_stream(self, task: str, context: str = "") -> Iterator[str]:
+        """流式处理任务，参数与process相同，逐段返回生成的文本"""
+        yield from self.stream_chat(self._process_messages(task, context))
+        
+    async def aprocess_stream(self, task: str, context: str = "") -> AsyncIterator[str]:
+        """异步流式处理任务，参数与process相同"""
+        async for chunk in self.astream_chat(self._process_messages(task, context)):
+            yield chunk
         
     def update_config(self, config: Dict[str, Any]) -> None:
         """更新代理配置
@@ -98,23 +513,32 @@ class BaseAgent:
             config: 新的配置信息
         """
         # 更新语言模型配置
-        self.llm = ChatOpenAI(
-            model_name=config.get("model", self.llm.model_name),
-            temperature=config.get("temperature", self.llm.temperature),
-            max_tokens=config.get("max_tokens", self.llm.max_tokens),
-            streaming=config.get("stream_output", self.llm.streaming)
-        )
+        self.model_name = config.get("model", self.model_name)
+        self.api_key = config.get("openai_api_key", self.api_key)
+        self.api_base = config.get("openai_api_base", self.api_base)
+        self.temperature = config.get("temperature", self.temperature)
+        self.max_tokens = config.get("max_tokens", self.max_tokens)
+        self.streaming = config.get("stream_output", self.streaming)
         
-    def combine_results(self, results: list) -> str:
-        """合并多个处理结果
+        self.llm = get_chat_model(
+            model_name=self.model_name,
+            api_key=self.api_key,
+            api_base=self.api_base,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            streaming=self.streaming
+        )
+        self.embeddings = get_embeddings(
+            api_key=self.api_key,
+            api_base=self.api_base,
+            model=self.embedding_model,
+            backend=self.embedding_backend
+        )
+        self.response_cache = resolve_cache(self.temperature)
         
-        Args:
-            results: 处理结果列表
-            
-        Returns:
-            合并后的结果
-        """
-        messages = [
+    def _combine_messages(self, results: list) -> list:
+        """构建结果整合的消息"""
+        return [
             SystemMessage(content="""你是一个结果整合专家。
             
             请将多个处理结果整合成一个连贯的输出。
@@ -126,4 +550,17 @@ class BaseAgent:
             HumanMessage(content=f"请整合以下结果：\n\n{json.dumps(results, ensure_ascii=False, indent=2)}")
         ]
         
-        return self.chat(messages)
\ No newline at end of file
+    def combine_results(self, results: list) -> str:
+        """合并多个处理结果
+        
+        Args:
+            results: 处理结果列表
+            
+        Returns:
+            合并后的结果
+        """
+        return self.chat(self._combine_messages(results))
+        
+    async def acombine_results(self, results: list) -> str:
+        """异步合并多个处理结果"""
+        return await self.achat(self._combine_messages(results))
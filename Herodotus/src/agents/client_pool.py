@@ -0,0 +1,174 @@
+from typing import Dict, Optional, Tuple, Any, TYPE_CHECKING
+import os
+import threading
+import logging
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# 进程级客户端注册表：相同配置的代理共享同一个模型客户端和HTTP连接池
+# httpx和langchain_openai在首次创建客户端时才导入，保持包导入轻量
+_lock = threading.Lock()
+_chat_models: Dict[Tuple, Any] = {}
+_embedding_models: Dict[Tuple, Any] = {}
+_http_clients: Dict[str, "httpx.Client"] = {}
+_async_http_clients: Dict[str, "httpx.AsyncClient"] = {}
+_stdout_callback_manager = None
+
+
+def _http_limits() -> "httpx.Limits":
+    """HTTP连接池限制，保持长连接以复用TLS会话"""
+    import httpx
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    )
+
+
+def _http_timeout() -> "httpx.Timeout":
+    import httpx
+    return httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", "600")), connect=10.0)
+
+
+def get_http_client(api_base: str) -> "httpx.Client":
+    """获取指定API地址共享的同步HTTP客户端"""
+    import httpx
+    with _lock:
+        client = _http_clients.get(api_base)
+        if client is None or client.is_closed:
+            client = httpx.Client(limits=_http_limits(), timeout=_http_timeout())
+            _http_clients[api_base] = client
+        return client
+
+
+def get_async_http_client(api_base: str) -> "httpx.AsyncClient":
+    """获取指定API地址共享的异步HTTP客户端"""
+    import httpx
+    with _lock:
+        client = _async_http_clients.get(api_base)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout())
+            _async_http_clients[api_base] = client
+        return client
+
+
+def _get_stdout_callback_manager():
+    """流式输出到终端的回调管理器，所有流式客户端共用一份"""
+    global _stdout_callback_manager
+    if _stdout_callback_manager is None:
+        from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+        from langchain.callbacks.manager import CallbackManager
+        _stdout_callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
+    return _stdout_callback_manager
+
+
+def get_chat_model(model_name: Optional[str],
+                   api_key: str,
+                   api_base: str,
+                   temperature: float,
+                   max_tokens: int,
+                   streaming: bool = False):
+    """获取共享的聊天模型客户端
+
+    Args:
+        model_name: 模型名称
+        api_key: OpenAI API密钥
+        api_base: OpenAI API基础URL
+        temperature: 生成温度
+        max_tokens: 最大令牌数
+        streaming: 是否启用流式输出
+
+    Returns:
+        以(模型, 地址, 密钥, 采样参数)为键缓存的ChatOpenAI实例
+    """
+    key = (model_name, api_base, api_key, float(temperature), int(max_tokens), bool(streaming))
+    with _lock:
+        llm = _chat_models.get(key)
+    if llm is not None:
+        return llm
+
+    from langchain_openai import ChatOpenAI
+    kwargs = {}
+    if model_name:
+        kwargs["model_name"] = model_name
+    llm = ChatOpenAI(
+        openai_api_key=api_key,
+        openai_api_base=api_base,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        streaming=streaming,
+        callback_manager=_get_stdout_callback_manager() if streaming else None,
+        max_retries=0,  # 重试由rate_limiter统一调度
+        http_client=get_http_client(api_base),
+        http_async_client=get_async_http_client(api_base),
+        **kwargs
+    )
+    with _lock:
+        # 并发创建时以先注册者为准
+        llm = _chat_models.setdefault(key, llm)
+    return llm
+
+
+def get_embeddings(api_key: str,
+                   api_base: str,
+                   model: str = "text-embedding-ada-002",
+                   backend: str = "openai"):
+    """获取共享的嵌入模型客户端
+
+    backend为local时返回本地sentence-transformers模型，同一模型在进程内只加载一次。
+    """
+    key = (model, api_base, api_key) if backend != "local" else ("local", model)
+    with _lock:
+        embeddings = _embedding_models.get(key)
+    if embeddings is not None:
+        return embeddings
+
+    if backend == "local":
+        from .local_embeddings import LocalEmbeddings
+        with _lock:
+            return _embedding_models.setdefault(key, LocalEmbeddings(model_name=model))
+
+    from langchain_openai import OpenAIEmbeddings
+    embeddings = OpenAIEmbeddings(
+        model=model,
+        openai_api_key=api_key,
+        openai_api_base=api_base,
+        # 按上下文长度切分输入需要tiktoken编码文件，EMBEDDING_CHECK_CTX_LENGTH=off时直接发送文本
+        check_embedding_ctx_length=os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "on").lower() not in ("off", "false", "0"),
+        # 与EmbeddingBatcher的包条数上限一致，装好的包由客户端一次发出而不再二次切分
+        chunk_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "2048")),
+        max_retries=0,  # 重试由rate_limiter统一调度
+        http_client=get_http_client(api_base),
+        http_async_client=get_async_http_client(api_base)
+    )
+    with _lock:
+        embeddings = _embedding_models.setdefault(key, embeddings)
+    return embeddings
+
+
+def pool_stats() -> Dict[str, int]:
+    """返回注册表中的客户端数量"""
+    with _lock:
+        return {
+            "chat_models": len(_chat_models),
+            "embedding_models": len(_embedding_models),
+            "http_clients": len(_http_clients),
+            "async_http_clients": len(_async_http_clients)
+        }
+
+
+def clear_pool() -> None:
+    """清空注册表并关闭同步HTTP连接"""
+    with _lock:
+        for client in _http_clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"关闭HTTP客户端失败: {str(e)}")
+        _chat_models.clear()
+        _embedding_models.clear()
+        _http_clients.clear()
+        _async_http_clients.clear()
@@ -0,0 +1,111 @@
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import contextvars
+import os
+from .rate_limiter import estimate_tokens
+
+Vector = List[float]
+# 发送一个包的函数：(文本列表, 估算令牌数) -> 与文本顺序一致的向量列表
+SendPack = Callable[[List[str], int], List[Vector]]
+
+
+def pack_by_tokens(token_counts: Sequence[int], max_tokens: int, max_inputs: int) -> List[List[int]]:
+    """按令牌数把输入装包，保持原顺序
+
+    每个包的令牌总数不超过max_tokens、条数不超过max_inputs；
+    单条超过max_tokens的输入单独成包，由服务端决定截断或报错。
+
+    Returns:
+        每个包包含的输入下标
+    """
+    packs: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_inputs):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+class EmbeddingBatcher:
+    """嵌入请求装包与并发发送
+
+    输入按令牌数装成接近服务端上限的包，多个包并发发送，速率由调用方在send中
+    通过全局调度器控制，结果按输入顺序重新组装。批量导入的吞吐量因此取决于
+    每分钟令牌配额，而不是请求往返次数。
+    """
+
+    def __init__(self,
+                 model: Optional[str] = None,
+                 max_tokens: Optional[int] = None,
+                 max_inputs: Optional[int] = None,
+                 max_concurrency: Optional[int] = None):
+        """初始化装包器
+
+        Args:
+            model: 用于估算令牌数的嵌入模型名
+            max_tokens: 每个包的令牌上限，默认取环境变量EMBEDDING_BATCH_TOKENS（100000）
+            max_inputs: 每个包的条数上限，默认取环境变量EMBEDDING_BATCH_SIZE（2048）
+            max_concurrency: 同时发送的包数，默认取环境变量EMBEDDING_CONCURRENCY，其次MAX_CONCURRENCY
+        """
+        self.model = model
+        self.max_tokens = max_tokens or int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+        self.max_inputs = max_inputs or int(os.getenv("EMBEDDING_BATCH_SIZE", "2048"))
+        self.max_concurrency = max(1, max_concurrency or int(
+            os.getenv("EMBEDDING_CONCURRENCY", os.getenv("MAX_CONCURRENCY", "8"))
+        ))
+
+    def _packs(self, texts: List[str]) -> List[Tuple[List[str], int]]:
+        token_counts = [estimate_tokens(text, self.model) for text in texts]
+        return [
+            ([texts[i] for i in pack], sum(token_counts[i] for i in pack))
+            for pack in pack_by_tokens(token_counts, self.max_tokens, self.max_inputs)
+        ]
+
+    def run(self, texts: List[str], send: SendPack) -> List[Vector]:
+        """装包并发送全部输入，返回与输入顺序一致的向量"""
+        if not texts:
+            return []
+        packs = self._packs(texts)
+        if len(packs) == 1 or self.max_concurrency == 1:
+            return [vector for pack, tokens in packs for vector in send(pack, tokens)]
+        # 工作线程继承调用方的上下文（如调度优先级和当前span）
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(packs))) as executor:
+            results = executor.map(lambda item: context.copy().run(send, *item), packs)
+            return [vector for vectors in results for vector in vectors]
+
+    def iter_run(self, texts: Iterable[str], send: SendPack) -> Iterator[Vector]:
+        """流式装包发送，按输入顺序逐个产出向量
+
+        输入按需读取，在途的包不超过并发数的两倍，内存占用与输入总量无关。
+        """
+        context = contextvars.copy_context()
+        pending: deque = deque()
+        buffer: List[str] = []
+        buffer_tokens = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+
+            def submit(pack: List[str], tokens: int) -> None:
+                pending.append(executor.submit(context.copy().run, send, pack, tokens))
+
+            for text in texts:
+                tokens = estimate_tokens(text, self.model)
+                if buffer and (buffer_tokens + tokens > self.max_tokens or len(buffer) >= self.max_inputs):
+                    submit(buffer, buffer_tokens)
+                    buffer, buffer_tokens = [], 0
+                buffer.append(text)
+                buffer_tokens += tokens
+                # 队首的包完成后立即产出，避免结果堆积
+                while pending and (pending[0].done() or len(pending) >= self.max_concurrency * 2):
+                    yield from pending.popleft().result()
+            if buffer:
+                submit(buffer, buffer_tokens)
+            while pending:
+                yield from pending.popleft().result()
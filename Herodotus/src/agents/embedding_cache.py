@@ -0,0 +1,230 @@
+from typing import Optional, Dict, Any, List, Sequence, TYPE_CHECKING
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import logging
+from .response_cache import get_cache_dir
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 向量文件每次扩容的最小行数
+MIN_GROWTH_ROWS = 1024
+
+
+def text_key(text: str) -> str:
+    """文本内容哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _VectorFile:
+    """单个模型的向量文件：按行存放定长向量的内存映射数组，容量不足时按倍数扩容"""
+
+    def __init__(self, path: str, dim: int, dtype: "np.dtype"):
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.row_bytes = dim * dtype.itemsize
+        self.array: Optional["np.memmap"] = None
+        self.capacity = 0
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self._map(os.path.getsize(path) // self.row_bytes)
+
+    def _map(self, rows: int) -> None:
+        import numpy as np
+        if self.array is not None:
+            self.array.flush()
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(rows, self.dim)) if rows else None
+        self.capacity = rows
+
+    def ensure(self, rows: int) -> None:
+        """保证至少容纳rows行；其他进程扩容过的文件直接重新映射"""
+        if rows <= self.capacity:
+            return
+        on_disk = os.path.getsize(self.path) // self.row_bytes
+        if on_disk < rows:
+            target = max(rows, on_disk * 2, MIN_GROWTH_ROWS)
+            with open(self.path, "r+b") as f:
+                f.truncate(target * self.row_bytes)
+            on_disk = target
+        self._map(on_disk)
+
+    def read(self, rows: Sequence[int]) -> "np.ndarray":
+        import numpy as np
+        self.ensure(max(rows) + 1)
+        return np.asarray(self.array[list(rows)], dtype=np.float32)
+
+    def write(self, start: int, vectors: "np.ndarray") -> None:
+        self.ensure(start + len(vectors))
+        self.array[start:start + len(vectors)] = vectors
+        self.array.flush()
+
+
+class EmbeddingCache:
+    """持久化嵌入缓存
+
+    以 (模型标识, 文本哈希) 为键。模型标识由调用方给出，应同时包含模型名和接口地址，
+    避免模拟服务或代理返回的向量被用于其他接口。向量存放在每个模型一个的内存映射文件中
+    （float32或float16），键到行号的索引存放在SQLite中。条目不过期，同一文本在任何一次
+    运行中只需生成一次嵌入。
+    """
+
+    def __init__(self, directory: str, dtype: str = "float32"):
+        """初始化缓存
+
+        Args:
+            directory: 缓存目录
+            dtype: 向量存储精度，float32或float16（体积减半，读出时转换为float32）
+        """
+        import numpy as np
+        if dtype not in ("float32", "float16"):
+            raise ValueError("dtype必须是float32或float16")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._files: Dict[str, _VectorFile] = {}
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                rows INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS vectors (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (model, key)
+            );
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, model: str, dim: int) -> _VectorFile:
+        if model not in self._files:
+            name = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+            path = os.path.join(self.directory, f"{name}.{dim}.{self.dtype.name}.bin")
+            self._files[model] = _VectorFile(path, dim, self.dtype)
+        return self._files[model]
+
+    def _lookup(self, model_key: str, keys: Sequence[str]) -> Dict[str, int]:
+        """查询已缓存键的行号，调用方持有锁"""
+        rows: Dict[str, int] = {}
+        unique = list(set(keys))
+        # SQLite单条语句的参数个数有限，分批查询
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.update(self._conn.execute(
+                f"SELECT key, row FROM vectors WHERE model = ? AND key IN ({placeholders})",
+                [model_key] + batch
+            ).fetchall())
+        return rows
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """批量读取，未缓存的位置为None
+
+        Args:
+            model: 模型标识（模型名和接口地址）
+            texts: 文本列表
+        """
+        model_key = f"{model}/{self.dtype.name}"
+        keys = [text_key(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            row = self._conn.execute("SELECT dim FROM models WHERE model = ?", (model_key,)).fetchone()
+            if row is None:
+                self.misses += len(texts)
+                return results
+            rows = self._lookup(model_key, keys)
+            found = [i for i, key in enumerate(keys) if key in rows]
+            if found:
+                vectors = self._file(model_key, row[0]).read([rows[keys[i]] for i in found])
+                for i, vector in zip(found, vectors):
+                    results[i] = vector.tolist()
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """批量写入，已存在的键保持不变"""
+        if not texts:
+            return
+        import numpy as np
+        model_key = f"{model}/{self.dtype.name}"
+        matrix = np.asarray(vectors, dtype=self.dtype)
+        dim = matrix.shape[1]
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            # 写事务内分配行号，多个进程共享缓存目录时不会分到同一行
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT dim, rows FROM models WHERE model = ?", (model_key,)).fetchone()
+                if row is None:
+                    self._conn.execute("INSERT INTO models (model, dim, rows) VALUES (?, ?, 0)", (model_key, dim))
+                    row = (dim, 0)
+                if row[0] != dim:
+                    raise ValueError(f"嵌入维度不一致: {model} 缓存为{row[0]}维，写入为{dim}维")
+                new, seen = [], set(self._lookup(model_key, keys))
+                for i, key in enumerate(keys):
+                    if key not in seen:
+                        seen.add(key)
+                        new.append(i)
+                if new:
+                    start = row[1]
+                    self._file(model_key, dim).write(start, matrix[new])
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO vectors (model, key, row) VALUES (?, ?, ?)",
+                        [(model_key, keys[i], start + n) for n, i in enumerate(new)]
+                    )
+                    self._conn.execute("UPDATE models SET rows = ? WHERE model = ?", (start + len(new), model_key))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {
+                model: {"dim": dim, "rows": rows}
+                for model, dim, rows in self._conn.execute("SELECT model, dim, rows FROM models")
+            }
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "models": models
+        }
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_lock = threading.Lock()
+
+
+def resolve_embedding_cache() -> Optional[EmbeddingCache]:
+    """根据EMBEDDING_CACHE配置获取进程级嵌入缓存
+
+    默认开启，存放在缓存目录的embeddings子目录（EMBEDDING_CACHE_DIR可覆盖），
+    EMBEDDING_CACHE_DTYPE选择存储精度，EMBEDDING_CACHE=off关闭。
+    """
+    global _default_cache
+    if os.getenv("EMBEDDING_CACHE", "on").lower() == "off":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            try:
+                directory = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(get_cache_dir(), "embeddings"))
+                _default_cache = EmbeddingCache(directory, dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float32"))
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"无法创建嵌入缓存，嵌入不做缓存: {str(e)}")
+                return None
+        return _default_cache
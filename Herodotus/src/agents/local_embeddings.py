@@ -0,0 +1,94 @@
+from typing import List, Optional
+import asyncio
+import os
+import threading
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_LOCAL_MODEL = "BAAI/bge-small-zh-v1.5"
+
+
+class LocalEmbeddings(Embeddings):
+    """基于sentence-transformers的本地CPU嵌入模型
+
+    首次调用时才加载模型。输入按长度排序后动态分批：短文本批次大、长文本批次小，
+    每批的字符总量不超过max_batch_chars，减少填充带来的浪费，结果按原顺序返回。
+    """
+
+    def __init__(self,
+                 model_name: str = DEFAULT_LOCAL_MODEL,
+                 device: str = "cpu",
+                 max_batch_chars: Optional[int] = None,
+                 max_batch_size: Optional[int] = None,
+                 num_threads: Optional[int] = None):
+        """初始化本地嵌入模型
+
+        Args:
+            model_name: sentence-transformers模型名或本地路径
+            device: 运行设备
+            max_batch_chars: 每批字符总量上限，默认取环境变量LOCAL_EMBEDDING_BATCH_CHARS（16000）
+            max_batch_size: 每批条数上限，默认取环境变量LOCAL_EMBEDDING_BATCH_SIZE（64）
+            num_threads: PyTorch计算线程数，默认取环境变量EMBEDDING_THREADS，其次为CPU核数
+        """
+        self.model_name = model_name
+        self.device = device
+        self.max_batch_chars = max_batch_chars or int(os.getenv("LOCAL_EMBEDDING_BATCH_CHARS", "16000"))
+        self.max_batch_size = max_batch_size or int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+        self.num_threads = num_threads or int(os.getenv("EMBEDDING_THREADS", "0")) or os.cpu_count() or 1
+        self._model = None
+        # 模型推理本身已按线程数并行，多个调用方串行使用同一个模型
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None:
+            try:
+                import torch
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError("本地嵌入需要安装sentence-transformers: pip install sentence-transformers") from e
+            torch.set_num_threads(self.num_threads)
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def _batches(self, order: List[int], texts: List[str]) -> List[List[int]]:
+        """按长度排序后的下标切成动态大小的批次"""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for i in order:
+            # 同一批按最长文本填充，批内总量按当前最长文本估算
+            longest = max(len(texts[i]), len(texts[current[0]]) if current else 0)
+            if current and (longest * (len(current) + 1) > self.max_batch_chars or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        with self._lock:
+            model = self._load()
+            # 从长到短排序，每批的第一条就是最长的
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+            vectors: List[Optional[List[float]]] = [None] * len(texts)
+            for batch in self._batches(order, texts):
+                encoded = model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    normalize_embeddings=True,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+                for i, vector in zip(batch, encoded):
+                    vectors[i] = vector.tolist()
+            return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_query, text)
@@ -1,7 +1,6 @@
 from typing import List, Dict, Any
 from ..base_agent import BaseAgent
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain.memory import ConversationBufferMemory
 import json
 
 class MemoryAgent(BaseAgent):
@@ -16,8 +15,10 @@ class MemoryAgent(BaseAgent):
     4. 管理记忆检索
     请确保记忆的准确性和相关性。"""
 
-    def __init__(self, model_name: str = "gpt-3.5-turbo"):
-        super().__init__(model_name, streaming=False)
+    def __init__(self, model_name: str = "gpt-3.5-turbo", streaming: bool = False):
+        super().__init__(model_name, streaming=streaming)
+        # 记忆组件在实例化时才导入，避免拖慢不使用记忆代理的启动
+        from langchain.memory import ConversationBufferMemory
         self.memory = ConversationBufferMemory(
             memory_key="chat_history",
             return_messages=True
@@ -38,34 +39,57 @@ class MemoryAgent(BaseAgent):
         """清除所有记忆"""
         self.memory.clear()
         
-    def summarize_memory(self) -> str:
-        """总结对话历史"""
-        messages = [
+    def _summarize_messages(self) -> list:
+        """构建对话总结的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
             请总结以下对话历史：..."""),
             HumanMessage(content=str(self.get_memory()))
         ]
-        response = self.chat(messages)
+        
+    def summarize_memory(self) -> str:
+        """总结对话历史"""
+        response = self.chat(self._summarize_messages())
         return response
         
-    def extract_key_points(self) -> List[str]:
-        """提取关键信息"""
-        messages = [
+    async def asummarize_memory(self) -> str:
+        """异步总结对话历史"""
+        return await self.achat(self._summarize_messages())
+        
+    def _key_points_messages(self) -> list:
+        """构建关键信息提取的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
             请从以下对话历史中提取关键信息点：..."""),
             HumanMessage(content=str(self.get_memory()))
         ]
-        response = self.chat(messages)
+        
+    def extract_key_points(self) -> List[str]:
+        """提取关键信息"""
+        response = self.chat(self._key_points_messages())
         return json.loads(response)
         
-    def search_memory(self, query: str) -> List[Dict]:
-        """搜索相关记忆"""
-        messages = [
+    async def aextract_key_points(self) -> List[str]:
+        """异步提取关键信息"""
+        response = await self.achat(self._key_points_messages())
+        return json.loads(response)
+        
+    def _search_messages(self, query: str) -> list:
+        """构建记忆搜索的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
             请在对话历史中搜索与以下查询相关的内容：..."""),
             HumanMessage(content=f"""查询：{query} 历史：{str(self.get_memory())}""")
         ]
-        response = self.chat(messages)
+        
+    def search_memory(self, query: str) -> List[Dict]:
+        """搜索相关记忆"""
+        response = self.chat(self._search_messages(query))
+        return json.loads(response)
+        
+    async def asearch_memory(self, query: str) -> List[Dict]:
+        """异步搜索相关记忆"""
+        response = await self.achat(self._search_messages(query))
         return json.loads(response)
         
     def evaluate_memory_quality(self) -> Dict:
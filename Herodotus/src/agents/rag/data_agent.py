@@ -1,9 +1,25 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Union
 from ..base_agent import BaseAgent
+from .text_splitter import TextSplitter
+from .text_cleaner import TextCleaner
+from .file_reader import FileReader
+from .extractors import get_extractor, extract_text, get_extraction_pool, submit_extractions
+from concurrent.futures import Future
 from langchain_core.messages import SystemMessage, HumanMessage
 import json
 import os
 
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    """把迭代器按size分批"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 class DataAgent(BaseAgent):
     """基于语言模型的数据处理代理"""
     
@@ -17,22 +33,12 @@ class DataAgent(BaseAgent):
 
 请确保处理后的文本保持语义完整性和连贯性。"""
 
-    CHUNK_PROMPT = """请将以下文本分割成多个语义完整的片段。
-每个片段应该：
-1. 包含完整的上下文
-2. 长度适中（约500-1000字）
-3. 保持语义连贯性
-4. 避免跨段落的概念割裂
+    SUMMARY_PROMPT = """请为以下文本片段生成摘要和要点。
 
-请以JSON格式返回分割结果：
+请以JSON格式返回结果：
 {
-    "chunks": [
-        {
-            "content": "片段内容",
-            "summary": "片段摘要",
-            "key_points": ["要点1", "要点2"]
-        }
-    ]
+    "summary": "片段摘要",
+    "key_points": ["要点1", "要点2"]
 }"""
 
     def __init__(self, 
@@ -53,14 +59,29 @@ class DataAgent(BaseAgent):
                         api_base=api_base,
                         streaming=streaming)
         
+        # 本地分割器，按令牌预算切分，不调用语言模型
+        self.splitter = TextSplitter(
+            chunk_tokens=int(os.getenv("CHUNK_TOKENS", "500")),
+            overlap_tokens=int(os.getenv("CHUNK_OVERLAP", "50")),
+            model=model_name
+        )
+        # 按窗口流式读取文件，峰值内存取决于窗口大小
+        self.reader = FileReader()
+        
+        # 本地规则清洗，只有噪声分数超过阈值的段落才交给语言模型
+        self.cleaner = TextCleaner()
+        self.noise_threshold = float(os.getenv("CLEAN_NOISE_THRESHOLD", "0.2"))
+        
+        # 是否为每个片段额外生成摘要和要点（需要调用语言模型）
+        self.summarize_chunks = os.getenv("CHUNK_SUMMARY", "false").lower() in ("1", "true", "on")
+        
     def read_file(self, file_path: str) -> str:
         """读取文件内容"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return self.reader.read_text(file_path)
             
-    def clean_text(self, text: str) -> str:
-        """清洗文本"""
-        messages = [
+    def _clean_messages(self, text: str) -> list:
+        """构建语言模型清洗的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请清洗和标准化以下文本，包括：
 1. 删除无意义的字符和空白
@@ -72,30 +93,80 @@ class DataAgent(BaseAgent):
             HumanMessage(content=text)
         ]
         
-        return self.chat(messages)
+    def _clean_batch(self, paragraphs: List[str]) -> List[str]:
+        """把一批已规则清洗的段落中的噪声段落批量交给语言模型"""
+        noisy = [i for i, p in enumerate(paragraphs) if self.cleaner.noise_score(p) > self.noise_threshold]
+        if noisy:
+            responses = self.chat_many([self._clean_messages(paragraphs[i]) for i in noisy])
+            for i, response in zip(noisy, responses):
+                paragraphs[i] = response.strip()
+        return [p for p in paragraphs if p]
         
-    def split_text(self, text: str) -> List[Dict]:
-        """分割文本"""
-        messages = [
-            SystemMessage(content=f"""{self.ROLE}\n{self.CHUNK_PROMPT}"""),
-            HumanMessage(content=text)
+    def iter_clean(self, source: Union[str, Iterable[str]], batch_size: int = 32) -> Iterator[str]:
+        """流式清洗文本，逐段产出清洗后的段落
+        
+        Args:
+            source: 字符串或文本块迭代器
+            batch_size: 噪声段落按批调用语言模型的批大小
+        """
+        normalized = (self.cleaner.normalize(p) for p in self.cleaner.iter_paragraphs(source))
+        for batch in _batched((p for p in normalized if p), batch_size):
+            yield from self._clean_batch(batch)
+            
+    def clean_text(self, text: str) -> str:
+        """清洗文本，段落之间以空行分隔"""
+        return "\n\n".join(self.iter_clean(text))
+        
+    def iter_chunks(self, source: Union[str, Iterable[str]]) -> Iterator[str]:
+        """流式分割文本，source可以是字符串或文本块迭代器"""
+        return self.splitter.iter_chunks(source)
+        
+    def _summary_messages(self, chunk: str) -> list:
+        """构建片段摘要的消息"""
+        return [
+            SystemMessage(content=f"""{self.ROLE}\n{self.SUMMARY_PROMPT}"""),
+            HumanMessage(content=chunk)
         ]
         
-        response = self.chat(messages)
-        try:
-            result = json.loads(response)
-            return result["chunks"]
-        except:
-            # 如果解析失败，将整个文本作为一个片段返回
-            return [{
-                "content": text,
-                "summary": "完整文档",
-                "key_points": ["文档内容"]
-            }]
+    def summarize(self, chunks: List[str]) -> List[Dict]:
+        """批量生成片段摘要和要点，解析失败的片段返回空摘要"""
+        responses = self.chat_many([self._summary_messages(chunk) for chunk in chunks])
+        summaries = []
+        for response in responses:
+            try:
+                result = json.loads(response)
+                summaries.append({
+                    "summary": result.get("summary", ""),
+                    "key_points": result.get("key_points", [])
+                })
+            except (json.JSONDecodeError, AttributeError):
+                summaries.append({"summary": "", "key_points": []})
+        return summaries
+        
+    def split_text(self, text: str, summarize: bool = None) -> List[Dict]:
+        """分割文本
+        
+        Args:
+            text: 要分割的文本
+            summarize: 是否生成摘要和要点，默认取环境变量CHUNK_SUMMARY
             
-    def analyze_chunk(self, chunk: str) -> Dict:
-        """分析文本片段"""
-        messages = [
+        Returns:
+            片段列表，每个片段包含content，启用摘要时还包含summary和key_points
+        """
+        chunks = [{"content": chunk} for chunk in self.splitter.iter_chunks(text)]
+        
+        if self.summarize_chunks if summarize is None else summarize:
+            chunks = self._add_summaries(chunks)
+            
+        return chunks
+        
+    def _add_summaries(self, chunks: List[Dict]) -> List[Dict]:
+        summaries = self.summarize([chunk["content"] for chunk in chunks])
+        return [{**chunk, **summary} for chunk, summary in zip(chunks, summaries)]
+        
+    def _analyze_chunk_messages(self, chunk: str) -> list:
+        """构建片段分析的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请分析以下文本片段，提供：
 1. 主要主题
@@ -108,42 +179,84 @@ class DataAgent(BaseAgent):
             HumanMessage(content=chunk)
         ]
         
-        response = self.chat(messages)
+    def analyze_chunk(self, chunk: str) -> Dict:
+        """分析文本片段"""
+        response = self.chat(self._analyze_chunk_messages(chunk))
         return json.loads(response)
         
-    def process_document(self, file_path: str) -> Dict:
-        """处理文档"""
+    def analyze_chunks(self, chunks: List[str]) -> List[Dict]:
+        """批量分析文本片段，结果顺序与输入一致"""
+        responses = self.chat_many([self._analyze_chunk_messages(chunk) for chunk in chunks])
+        return [json.loads(response) for response in responses]
+        
+    def _iter_source(self, file_path: str, extracted: Future = None) -> Iterable[str]:
+        """文档的文本来源：纯文本按窗口流式读取，其他格式在进程池中提取"""
+        if extracted is None and get_extractor(file_path) is not None:
+            extracted = get_extraction_pool().submit(extract_text, file_path)
+        if extracted is not None:
+            return [extracted.result()]
+        return self.reader.iter_text(file_path)
+        
+    def iter_file_chunks(self, file_path: str, extracted: Future = None) -> Iterator[str]:
+        """读取、清洗并分割文档，逐个产出片段文本，不做片段分析"""
+        paragraphs = self.iter_clean(self._iter_source(file_path, extracted))
+        # 段落之间补回空行，分割器据此识别段落边界
+        return self.splitter.iter_chunks(p + "\n\n" for p in paragraphs)
+        
+    def iter_document(self, file_path: str, batch_size: int = 32, extracted: Future = None) -> Iterator[Dict]:
+        """以流水线方式处理文档，逐个产出带分析结果的片段
+        
+        读取、清洗、分割都是流式的，语言模型调用按batch_size分批，
+        纯文本的峰值内存取决于读取窗口和批大小，与文件大小无关。
+        
+        Args:
+            file_path: 文件路径，支持纯文本、HTML、PDF、EPUB等已注册的格式
+            batch_size: 语言模型调用的批大小
+            extracted: 已提交到提取进程池的Future，为空时按需提交
+        """
+        for batch in _batched(self.iter_file_chunks(file_path, extracted), batch_size):
+            processed = [{"content": chunk} for chunk in batch]
+            if self.summarize_chunks:
+                processed = self._add_summaries(processed)
+            analyses = self.analyze_chunks(batch)
+            for chunk, analysis in zip(processed, analyses):
+                yield {**chunk, "analysis": analysis}
+                
+    def _count_chunks(self, chunks: Iterator[Dict], metadata: Dict) -> Iterator[Dict]:
+        """逐个产出片段并累加metadata中的chunk_count"""
         try:
-            # 读取文件
-            text = self.read_file(file_path)
-            
-            # 清洗文本
-            cleaned_text = self.clean_text(text)
-            
-            # 分割文本
-            chunks = self.split_text(cleaned_text)
-            
-            # 分析每个片段
-            processed_chunks = []
             for chunk in chunks:
-                analysis = self.analyze_chunk(chunk["content"])
-                processed_chunks.append({
-                    **chunk,
-                    "analysis": analysis
-                })
-                
-            return {
-                "texts": processed_chunks,
-                "metadata": {
-                    "file_path": file_path,
-                    "file_name": os.path.basename(file_path),
-                    "chunk_count": len(processed_chunks)
-                }
-            }
-            
+                metadata["chunk_count"] += 1
+                yield chunk
         except Exception as e:
             raise ValueError(f"文档处理失败: {str(e)}")
             
+    def process_document(self, file_path: str, extracted: Future = None) -> Dict:
+        """处理文档
+        
+        texts是逐个产出带分析结果片段的迭代器，片段在迭代时才生成，
+        metadata中的chunk_count随迭代累加，迭代结束后为片段总数。
+        """
+        metadata = {
+            "file_path": file_path,
+            "file_name": os.path.basename(file_path),
+            "chunk_count": 0
+        }
+        return {
+            "texts": self._count_chunks(self.iter_document(file_path, extracted=extracted), metadata),
+            "metadata": metadata
+        }
+            
+    def process_documents(self, file_paths: List[str]) -> Iterator[Dict]:
+        """批量处理文档，逐个产出各文档的处理结果
+        
+        需要解析的格式先全部提交到进程池并行提取，CPU密集的解析与
+        当前文档的语言模型调用重叠进行。
+        """
+        futures = submit_extractions(file_paths)
+        for path in file_paths:
+            yield self.process_document(path, futures.get(path))
+        
     def merge_chunks(self, chunks: List[Dict]) -> str:
         """合并文本片段"""
         messages = [
@@ -1,9 +1,11 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence
 from ..base_agent import BaseAgent
+from ..tracing import span
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_community.vectorstores import FAISS
+import os
 import json
-import numpy as np
+import uuid
+from .vector_index import STORAGE_MODES, needs_training, create_index, convert_index, training_sample, is_ivf, bytes_per_vector
 
 class DatabaseAgent(BaseAgent):
     """基于语言模型的知识存储代理"""
@@ -33,7 +35,8 @@ class DatabaseAgent(BaseAgent):
                  model_name: str = "gpt-3.5-turbo",
                  api_key: str = None,
                  api_base: str = None,
-                 streaming: bool = True):
+                 streaming: bool = True,
+                 storage_mode: str = None):
         """初始化数据库代理
         
         Args:
@@ -41,6 +44,7 @@ class DatabaseAgent(BaseAgent):
             api_key: OpenAI API密钥
             api_base: OpenAI API基础URL
             streaming: 是否启用流式输出
+            storage_mode: 向量存储方式flat/float16/int8/pq，默认取环境变量VECTOR_STORAGE（flat）
         """
         super().__init__(model_name=model_name, 
                         api_key=api_key, 
@@ -49,40 +53,224 @@ class DatabaseAgent(BaseAgent):
                         
         # 初始化向量数据库
         self.vector_store = None
+        self.storage_mode = (storage_mode or os.getenv("VECTOR_STORAGE", "flat")).lower()
+        if self.storage_mode not in STORAGE_MODES:
+            raise ValueError(f"storage_mode必须是{'/'.join(STORAGE_MODES)}之一")
+        # 需要训练的方式先写入平面索引，向量数达到train_size后训练并转存
+        self.train_size = int(os.getenv("VECTOR_TRAIN_SIZE", "10000"))
+        # 批量写入时每块转换为连续float32数组的向量数，限制列表转数组的峰值内存
+        self.insert_block = int(os.getenv("VECTOR_INSERT_BLOCK", "8192"))
+        # 倒排索引的下一个标签，删除后标签不复用
+        self._next_label = 0
         
-    def add_knowledge(self, text: str, metadata: Dict = None) -> None:
-        """添加知识到存储"""
+    def _create_store(self, dim: int, training=None):
+        """按存储方式创建空的向量库（FAISS在首次写入时才导入）
+        
+        需要训练的方式在没有训练样本时先用平面索引，由compact转存。
+        """
+        from langchain_community.vectorstores import FAISS
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        mode = self.storage_mode
+        if needs_training(mode) and training is None:
+            mode = "flat"
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=create_index(mode, dim, training),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
+        
+    def _is_trained(self) -> bool:
+        """当前索引是否已经是目标存储方式"""
+        return not needs_training(self.storage_mode) or type(self.vector_store.index).__name__ != "IndexFlatL2"
+        
+    def compact(self) -> bool:
+        """把平面索引中的向量训练并转存为目标存储方式，不需要转存时返回False
+        
+        平面索引的位置就是标签，转存后按原顺序写入，条目ID映射无需修改。
+        """
+        if self.vector_store is None or self._is_trained():
+            return False
+        with span("faiss.compact", self, count=self.vector_store.index.ntotal, mode=self.storage_mode):
+            self.vector_store.index = convert_index(self.vector_store.index, self.storage_mode)
+        self._next_label = self.vector_store.index.ntotal
+        return True
+        
+    def storage_stats(self) -> Dict[str, Any]:
+        """向量存储的方式、条目数和内存占用估算"""
+        if self.vector_store is None:
+            return {"mode": self.storage_mode, "trained": False, "vectors": 0, "bytes_per_vector": 0, "index_bytes": 0}
+        index = self.vector_store.index
+        per_vector = bytes_per_vector(index)
+        return {
+            "mode": self.storage_mode,
+            "trained": self._is_trained(),
+            "vectors": index.ntotal,
+            "bytes_per_vector": per_vector,
+            "index_bytes": int(per_vector * index.ntotal)
+        }
+        
+    def add_knowledge(self, text: str, metadata: Dict = None, embedding: List[float] = None, doc_id: str = None) -> str:
+        """添加知识到存储
+        
+        Args:
+            text: 知识文本
+            metadata: 元数据
+            embedding: 预先计算的嵌入向量，为空时现场生成
+            doc_id: 条目ID，为空时随机生成
+            
+        Returns:
+            条目ID，可用于delete_knowledge
+        """
         # 生成文本的嵌入向量
-        embedding = self.embeddings.embed_query(text)
+        if embedding is None:
+            embedding = self.embed_query(text)
+        return self.add_knowledge_batch(
+            [text],
+            [metadata] if metadata else None,
+            embeddings=[embedding],
+            ids=[doc_id] if doc_id else None
+        )[0]
+        
+    def add_knowledge_batch(self,
+                            texts: List[str],
+                            metadatas: Optional[List[Dict]] = None,
+                            embeddings: Optional[Sequence] = None,
+                            ids: Optional[List[str]] = None) -> List[str]:
+        """批量添加知识到存储
+        
+        向量按insert_block条一块转换为连续的float32数组整体写入索引，
+        文档存储和位置到ID的映射每块更新一次。需要训练的存储方式在向量库为空、
+        且本批向量数达到train_size时直接用本批样本训练，不经过平面索引。
+        
+        Args:
+            texts: 知识文本
+            metadatas: 与texts等长的元数据列表
+            embeddings: 预先计算的嵌入向量（列表或numpy数组），为空时批量生成
+            ids: 条目ID，为空时随机生成
+            
+        Returns:
+            与texts顺序一致的条目ID列表
+        """
+        if not texts:
+            return []
+        import numpy as np
+        from langchain_core.documents import Document
+        
+        if embeddings is None:
+            embeddings = self.embed_documents(texts)
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+        if len(embeddings) != len(texts) or len(ids) != len(texts) or (metadatas is not None and len(metadatas) != len(texts)):
+            raise ValueError("texts、metadatas、embeddings和ids的长度必须一致")
+        if len(set(ids)) != len(ids):
+            raise ValueError("批量添加的条目ID重复")
+        
+        with span("faiss.add", self, count=len(texts)):
+            if self.vector_store is None:
+                training = None
+                if needs_training(self.storage_mode) and len(texts) >= self.train_size:
+                    training = training_sample(embeddings)
+                self.vector_store = self._create_store(len(embeddings[0]), training)
+            store = self.vector_store
+            # InMemoryDocstore找不到时返回提示字符串
+            if any(not isinstance(store.docstore.search(doc_id), str) for doc_id in ids):
+                raise ValueError("条目ID已存在")
+            
+            for start in range(0, len(texts), self.insert_block):
+                end = min(start + self.insert_block, len(texts))
+                vectors = np.ascontiguousarray(embeddings[start:end], dtype=np.float32)
+                if is_ivf(store.index):
+                    # 倒排索引删除后标签不连续，显式分配新标签
+                    offset = self._next_label
+                    store.index.add_with_ids(vectors, np.arange(offset, offset + end - start, dtype=np.int64))
+                    self._next_label += end - start
+                else:
+                    offset = store.index.ntotal
+                    store.index.add(vectors)
+                store.docstore.add({
+                    ids[i]: Document(page_content=texts[i], metadata=(metadatas[i] if metadatas else None) or {})
+                    for i in range(start, end)
+                })
+                store.index_to_docstore_id.update({offset + j: ids[start + j] for j in range(end - start)})
+        
+        if store.index.ntotal >= self.train_size:
+            self.compact()
+        return ids
         
-        # 如果向量数据库不存在，创建一个新的
+    def update_metadata(self, doc_id: str, updates: Dict) -> bool:
+        """合并更新条目的元数据，条目不存在时返回False"""
         if self.vector_store is None:
-            self.vector_store = FAISS.from_embeddings(
-                [embedding],
-                [text],
-                self.embeddings,
-                metadatas=[metadata] if metadata else None
-            )
-        else:
-            # 添加到现有数据库
-            self.vector_store.add_embeddings(
-                [embedding],
-                [text],
-                [metadata] if metadata else None
-            )
+            return False
+        document = self.vector_store.docstore.search(doc_id)
+        # InMemoryDocstore找不到时返回提示字符串
+        if isinstance(document, str):
+            return False
+        document.metadata.update(updates)
+        return True
+        
+    def knowledge_ids(self) -> set:
+        """返回已存储的条目ID"""
+        if self.vector_store is None:
+            return set()
+        return set(self.vector_store.index_to_docstore_id.values())
+        
+    def delete_knowledge(self, ids: List[str]) -> int:
+        """按条目ID删除知识，忽略不存在的ID，返回删除的条目数"""
+        if self.vector_store is None or not ids:
+            return 0
+        existing = self.knowledge_ids()
+        ids = [doc_id for doc_id in ids if doc_id in existing]
+        if ids:
+            with span("faiss.delete", self, count=len(ids)):
+                if is_ivf(self.vector_store.index):
+                    self._delete_labels(ids)
+                else:
+                    # 平面编码的索引删除后位置前移，FAISS.delete同步重新编号
+                    self.vector_store.delete(ids)
+        return len(ids)
+        
+    def _delete_labels(self, ids: List[str]) -> None:
+        """从倒排索引删除条目，其余标签不变，映射中只移除被删除的标签"""
+        import numpy as np
+        store = self.vector_store
+        labels = {doc_id: label for label, doc_id in store.index_to_docstore_id.items()}
+        removed = [labels[doc_id] for doc_id in ids]
+        store.index.remove_ids(np.array(removed, dtype=np.int64))
+        store.docstore.delete(ids)
+        for label in removed:
+            del store.index_to_docstore_id[label]
         
     def search_knowledge(self, query: str, top_k: int = 3) -> List[Dict]:
         """搜索相关知识"""
         if self.vector_store is None:
             return []
             
-        # 使用向量数据库进行相似度搜索
-        results = self.vector_store.similarity_search_with_score(
-            query,
-            k=top_k
-        )
+        # 使用向量数据库进行相似度搜索，查询向量经过全局调度器生成
+        embedding = self.embed_query(query)
+        with span("faiss.search", self, k=top_k):
+            results = self.vector_store.similarity_search_with_score_by_vector(
+                embedding,
+                k=top_k
+            )
+        
+        return self._format_results(results)
+        
+    async def asearch_knowledge(self, query: str, top_k: int = 3) -> List[Dict]:
+        """异步搜索相关知识，查询向量通过异步接口生成"""
+        if self.vector_store is None:
+            return []
+            
+        embedding = await self.aembed_query(query)
+        with span("faiss.search", self, k=top_k):
+            results = self.vector_store.similarity_search_with_score_by_vector(
+                embedding,
+                k=top_k
+            )
+        
+        return self._format_results(results)
         
-        # 格式化结果
+    def _format_results(self, results) -> List[Dict]:
+        """格式化结果"""
         formatted_results = []
         for doc, score in results:
             formatted_results.append({
@@ -91,4 +279,4 @@ class DatabaseAgent(BaseAgent):
                 "score": float(score)  # 转换numpy.float64为Python float
             })
             
-        return formatted_results 
\ No newline at end of file
+        return formatted_results
\ No newline at end of file
@@ -0,0 +1,182 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import os
+import re
+import numpy as np
+
+WHITESPACE = re.compile(r"\s+")
+
+# 字符串哈希的乘数（64位，乘法按2^64自然回绕）
+SHINGLE_BASE = np.uint64(1099511628211)
+
+
+# 相似度恰好等于阈值的片段成为候选的最低概率
+LSH_RECALL = 0.9
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """选择分带数和每带行数
+
+    候选还要比较完整签名，误报只多一次比较，漏报则直接漏掉重复，因此不把S曲线的拐点放在阈值上，
+    而是取阈值处成为候选的概率 1-(1-t^r)^b 不低于LSH_RECALL的最大行数（行数越大候选越少）。
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= LSH_RECALL:
+            best = (bands, rows)
+    return best
+
+
+class NearDuplicateIndex:
+    """基于MinHash和LSH的近重复片段检测
+
+    每个片段按字符n-gram取特征，用num_perm个乘移位哈希计算MinHash签名；
+    签名分带后落入同一桶的片段才比较签名，估计的Jaccard相似度不低于阈值即视为重复。
+    哈希和签名计算用NumPy向量化，索引大小与片段数成线性关系。
+    """
+
+    def __init__(self,
+                 threshold: Optional[float] = None,
+                 num_perm: int = 128,
+                 shingle_size: int = 5,
+                 seed: int = 1):
+        """初始化索引
+
+        Args:
+            threshold: Jaccard相似度阈值，默认取环境变量DEDUP_THRESHOLD（0.85）
+            num_perm: MinHash签名长度
+            shingle_size: 字符n-gram长度，中文建议4到6
+            seed: 哈希参数的随机种子，相同种子的签名可以互相比较
+        """
+        threshold = threshold if threshold is not None else float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold必须在0和1之间")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        # 乘移位哈希 (a*x + b) >> 32，a取奇数
+        self._a = rng.integers(1, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+
+        self.reset()
+
+    def reset(self) -> None:
+        """清空索引"""
+        self._signatures: List[np.ndarray] = []
+        self._keys: List[Optional[str]] = []
+        self._positions: Dict[str, int] = {}
+        self._removed: Set[int] = set()
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+
+    def __len__(self) -> int:
+        return len(self._signatures) - len(self._removed)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def _shingles(self, text: str) -> np.ndarray:
+        """计算去掉空白并转小写后的字符n-gram哈希"""
+        text = WHITESPACE.sub("", text).lower()
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        width = min(self.shingle_size, len(codes))
+        if width == 0:
+            return np.zeros(1, dtype=np.uint64)
+        count = len(codes) - width + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(width):
+            hashes = hashes * SHINGLE_BASE + codes[offset:offset + count]
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> np.ndarray:
+        """计算文本的MinHash签名"""
+        shingles = self._shingles(text)
+        # 无符号整数乘法按2^64回绕，取高32位
+        hashed = (self._a * shingles[None, :] + self._b) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def similarity(self, first: np.ndarray, second: np.ndarray) -> float:
+        """由签名估计Jaccard相似度"""
+        return float(np.count_nonzero(first == second)) / self.num_perm
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in signature.reshape(self.bands, self.rows)]
+
+    def query(self, signature: np.ndarray) -> Optional[int]:
+        """返回与签名最相似且达到阈值的已索引片段编号，没有则返回None"""
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        candidates -= self._removed
+        if not candidates:
+            return None
+        candidates = sorted(candidates)
+        scores = np.count_nonzero(np.stack([self._signatures[i] for i in candidates]) == signature, axis=1)
+        best = int(np.argmax(scores))
+        if scores[best] / self.num_perm >= self.threshold:
+            return candidates[best]
+        return None
+
+    def insert(self, signature: np.ndarray, key: Optional[str] = None) -> int:
+        """加入索引，返回片段编号；key为片段的外部标识（如内容哈希），可用于discard"""
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        self._keys.append(key)
+        if key is not None:
+            self._positions[key] = position
+        for bucket, band in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band, []).append(position)
+        return position
+
+    def add(self, key: str, text: str) -> None:
+        """把已入库的片段加入索引，已存在的key忽略"""
+        if key not in self._positions:
+            self.insert(self.signature(text), key)
+
+    def discard(self, keys: Iterable[str]) -> None:
+        """从索引中移除片段，之后的查询不再匹配它们"""
+        for key in keys:
+            position = self._positions.pop(key, None)
+            if position is not None:
+                self._removed.add(position)
+
+    def assign(self, texts: List[str], keys: List[str]) -> List[Optional[str]]:
+        """在不清空索引的情况下为新片段查找近重复
+
+        与索引中已有片段（包括之前调用加入的片段和本次调用中排在前面的片段）
+        近重复的文本返回对应片段的key，否则把它以自己的key加入索引并返回None。
+        """
+        matches: List[Optional[str]] = []
+        for text, key in zip(texts, keys):
+            signature = self.signature(text)
+            match = self.query(signature)
+            if match is None:
+                self.insert(signature, key)
+                matches.append(None)
+            else:
+                matches.append(self._keys[match])
+        return matches
+
+    def group(self, texts: List[str]) -> List[List[int]]:
+        """把文本分组，每组第一个元素是保留的代表，其余是它的近重复
+
+        每次调用都从空索引开始，不与之前加入的片段比较；需要跨批次比较时使用assign。
+
+        Returns:
+            按代表出现顺序排列的分组，元素为texts中的下标
+        """
+        self.reset()
+        groups: List[List[int]] = []
+        for i, text in enumerate(texts):
+            signature = self.signature(text)
+            match = self.query(signature)
+            if match is None:
+                self.insert(signature)
+                groups.append([i])
+            else:
+                groups[match].append(i)
+        return groups
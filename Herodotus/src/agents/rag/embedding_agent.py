@@ -1,7 +1,24 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Callable, Optional
 from ..base_agent import BaseAgent
+from ..tracing import traced
+from .similarity import cosine_similarity, rank, top_k_cosine
+from .enrichment import AnalysisQueue
+from ..local_embeddings import DEFAULT_LOCAL_MODEL
 from langchain_core.messages import SystemMessage, HumanMessage
+import os
 import json
+import threading
+
+ANALYSIS_MODES = ("off", "batched", "deferred")
+
+# 不相关文本之间典型的余弦相似度，各嵌入模型差异很大（ada-002几乎不低于0.65）。
+# 级联先把余弦相似度按此下限缩放到0-1，再与不确定区间比较
+SIMILARITY_FLOORS = {
+    "text-embedding-ada-002": 0.7,
+    "text-embedding-3-small": 0.1,
+    "text-embedding-3-large": 0.1,
+    DEFAULT_LOCAL_MODEL: 0.4
+}
 
 class EmbeddingAgent(BaseAgent):
     """基于语言模型的嵌入代理"""
@@ -22,11 +39,19 @@ class EmbeddingAgent(BaseAgent):
     "importance_score": 0-1
 }"""
 
+    BATCH_ANALYSIS_PROMPT = """你是一个专门进行语义理解和表示的AI助手。
+请批量分析以下文本的语义内容。输入是以ID为键的JSON对象，
+只返回以相同ID为键的JSON对象，每个值使用紧凑字段：
+{"ID": {"c": ["关键概念"], "t": ["主题"], "s": "语义概要", "i": 0-1之间的重要性}}"""
+
     def __init__(self, 
                  model_name: str = "gpt-3.5-turbo",
                  api_key: str = None,
                  api_base: str = None,
-                 streaming: bool = True):
+                 streaming: bool = True,
+                 analysis_mode: str = None,
+                 similarity_band: Optional[Tuple[float, float]] = None,
+                 similarity_floor: Optional[float] = None):
         """初始化嵌入代理
         
         Args:
@@ -34,27 +59,140 @@ class EmbeddingAgent(BaseAgent):
             api_key: OpenAI API密钥
             api_base: OpenAI API基础URL
             streaming: 是否启用流式输出
+            analysis_mode: embed_texts的语义分析方式，默认取环境变量EMBEDDING_ANALYSIS（batched）：
+                off不分析；batched多条文本合并到一次调用；deferred交给后台队列，结果通过defer_analysis写回
+            similarity_band: 缩放后相似度的不确定区间 (下限, 上限)，默认取环境变量SIMILARITY_LOW（0.3）和
+                SIMILARITY_HIGH（0.85）。compare_texts和evaluate_similarity先算嵌入余弦相似度，只有落在区间内才调用模型
+            similarity_floor: 当前嵌入模型下不相关文本的典型余弦相似度，默认取环境变量SIMILARITY_FLOOR，
+                其次按SIMILARITY_FLOORS中的模型取值（未知模型为0）。阈值与嵌入后端相关，更换模型时需要重新设定
         """
         super().__init__(model_name=model_name, 
                         api_key=api_key, 
                         api_base=api_base,
                         streaming=streaming)
         
-    def analyze_text(self, text: str) -> Dict:
-        """分析文本语义"""
-        messages = [
+        self.analysis_mode = (analysis_mode or os.getenv("EMBEDDING_ANALYSIS", "batched")).lower()
+        if self.analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"analysis_mode必须是{'/'.join(ANALYSIS_MODES)}之一")
+        # 每次批量分析的文本数和每条文本的最大字符数
+        self.analysis_batch_size = int(os.getenv("ANALYSIS_BATCH_SIZE", "10"))
+        self.analysis_max_chars = int(os.getenv("ANALYSIS_MAX_CHARS", "1000"))
+        self.analysis_queue = AnalysisQueue(self.analyze_texts_batched, batch_size=self.analysis_batch_size)
+        
+        self.similarity_low, self.similarity_high = similarity_band or (
+            float(os.getenv("SIMILARITY_LOW", "0.3")),
+            float(os.getenv("SIMILARITY_HIGH", "0.85"))
+        )
+        if self.similarity_low > self.similarity_high:
+            raise ValueError("相似度区间下限不能大于上限")
+        if similarity_floor is None:
+            similarity_floor = float(os.getenv("SIMILARITY_FLOOR") or SIMILARITY_FLOORS.get(self.embedding_model, 0.0))
+        if not 0 <= similarity_floor < 1:
+            raise ValueError("similarity_floor必须在[0, 1)之间")
+        self.similarity_floor = similarity_floor
+        # 级联统计：由余弦相似度直接给出结果的次数，以及调用模型的次数
+        self.cascade_local = 0
+        self.cascade_llm = 0
+        # 批量评估在线程池中并发进行，计数需要加锁
+        self._cascade_lock = threading.Lock()
+        
+    def _analyze_text_messages(self, text: str) -> list:
+        """构建语义分析的消息"""
+        return [
             SystemMessage(content=self.ROLE),
             HumanMessage(content=f"""请分析以下文本的语义内容：
 
 {text}""")
         ]
         
-        response = self.chat(messages)
+    def analyze_text(self, text: str) -> Dict:
+        """分析文本语义"""
+        response = self.chat(self._analyze_text_messages(text))
         return json.loads(response)
         
-    def compare_texts(self, text1: str, text2: str) -> float:
-        """比较两段文本的语义相似度"""
-        messages = [
+    def analyze_texts(self, texts: List[str]) -> List[Dict]:
+        """批量分析文本语义，结果顺序与输入一致"""
+        responses = self.chat_many([self._analyze_text_messages(text) for text in texts])
+        return [json.loads(response) for response in responses]
+        
+    def _batch_analysis_messages(self, texts: List[str]) -> list:
+        """构建批量语义分析的消息，文本以序号为ID"""
+        payload = {str(i): text[:self.analysis_max_chars] for i, text in enumerate(texts)}
+        return [
+            SystemMessage(content=self.BATCH_ANALYSIS_PROMPT),
+            HumanMessage(content=json.dumps(payload, ensure_ascii=False))
+        ]
+        
+    @staticmethod
+    def _parse_batch_analysis(response: str, count: int) -> List[Dict]:
+        """展开紧凑字段，缺失或无法解析的条目返回空结果"""
+        try:
+            data = json.loads(response)
+        except json.JSONDecodeError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        analyses = []
+        for i in range(count):
+            item = data.get(str(i))
+            if not isinstance(item, dict):
+                analyses.append({})
+                continue
+            analyses.append({
+                "key_concepts": item.get("c", []),
+                "main_topics": item.get("t", []),
+                "semantic_summary": item.get("s", ""),
+                "importance_score": item.get("i", 0)
+            })
+        return analyses
+        
+    @traced()
+    def analyze_texts_batched(self, texts: List[str]) -> List[Dict]:
+        """批量分析文本语义，每次调用处理analysis_batch_size条，结果顺序与输入一致"""
+        batches = [texts[i:i + self.analysis_batch_size] for i in range(0, len(texts), self.analysis_batch_size)]
+        responses = self.chat_many([self._batch_analysis_messages(batch) for batch in batches])
+        analyses = []
+        for batch, response in zip(batches, responses):
+            analyses.extend(self._parse_batch_analysis(response, len(batch)))
+        return analyses
+        
+    def defer_analysis(self, items: List[Tuple[Any, str]], apply: Callable[[Any, Dict], None]) -> None:
+        """deferred模式下把 (条目键, 文本) 交给后台队列，分析完成后调用apply(条目键, 结果)"""
+        if self.analysis_mode == "deferred":
+            self.analysis_queue.submit(items, apply)
+            
+    def _relevance(self, cosine: float) -> float:
+        """把余弦相似度按当前模型的下限线性缩放到0-1"""
+        score = (cosine - self.similarity_floor) / (1 - self.similarity_floor)
+        return min(max(score, 0.0), 1.0)
+        
+    def _is_certain(self, score: float) -> bool:
+        """缩放后的相似度是否明显高于或低于不确定区间，同时记入级联统计"""
+        certain = score <= self.similarity_low or score >= self.similarity_high
+        with self._cascade_lock:
+            if certain:
+                self.cascade_local += 1
+            else:
+                self.cascade_llm += 1
+        return certain
+        
+    def cascade_stats(self) -> Dict[str, Any]:
+        """相似度级联的统计，saved_calls为省下的模型调用次数"""
+        with self._cascade_lock:
+            local, llm = self.cascade_local, self.cascade_llm
+        total = local + llm
+        return {
+            "band": [self.similarity_low, self.similarity_high],
+            "floor": self.similarity_floor,
+            "decided_locally": local,
+            "llm_calls": llm,
+            "saved_calls": local,
+            "saved_ratio": local / total if total else 0.0
+        }
+        
+    def _compare_messages(self, text1: str, text2: str) -> list:
+        """构建模型打分的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请分析以下两段文本的语义相似度，返回0-1之间的分数。
 1表示完全相似，0表示完全不相关。
@@ -66,21 +204,41 @@ class EmbeddingAgent(BaseAgent):
 {text2}""")
         ]
         
-        response = self.chat(messages)
+    @traced()
+    def compare_texts(self, text1: str, text2: str) -> float:
+        """比较两段文本的语义相似度
+        
+        先用嵌入（经过嵌入缓存）计算余弦相似度并按模型下限缩放到0-1，明显相似或明显无关时
+        直接返回缩放后的分数，只有落在不确定区间内才请模型打分。
+        """
+        embeddings = self.embed_documents([text1, text2])
+        score = self._relevance(cosine_similarity(embeddings[0], embeddings[1]))
+        if self._is_certain(score):
+            return score
+        
+        response = self.chat(self._compare_messages(text1, text2))
         try:
             return float(response.strip())
         except:
             return 0.0
         
+    @traced()
     def embed_texts(self, texts: List[str]) -> List[Dict]:
-        """生成文本的语义表示"""
+        """生成文本的语义表示
+        
+        analysis只在batched模式下同步生成，off和deferred模式为None，
+        deferred模式由调用方在写入向量后通过defer_analysis补充。
+        """
         # 使用OpenAI的嵌入模型生成向量
-        embeddings = self.embeddings.embed_documents(texts)
+        embeddings = self.embed_documents(texts)
         
-        # 分析文本语义
+        # 批量分析文本语义，多条文本合并到一次调用
+        if self.analysis_mode == "batched":
+            analyses = self.analyze_texts_batched(texts)
+        else:
+            analyses = [None] * len(texts)
         results = []
-        for text, embedding in zip(texts, embeddings):
-            analysis = self.analyze_text(text)
+        for text, embedding, analysis in zip(texts, embeddings, analyses):
             results.append({
                 "text": text,
                 "embedding": embedding,
@@ -91,28 +249,37 @@ class EmbeddingAgent(BaseAgent):
     def find_similar(self, query: str, texts: List[str], top_k: int = 3) -> List[Dict]:
         """查找语义相似的文本"""
         # 生成查询的嵌入向量
-        query_embedding = self.embeddings.embed_query(query)
+        query_embedding = self.embed_query(query)
         
         # 生成所有文本的嵌入向量
-        text_embeddings = self.embeddings.embed_documents(texts)
-        
-        # 计算相似度
-        similarities = []
-        for text, embedding in zip(texts, text_embeddings):
-            # 计算余弦相似度
-            similarity = self.compute_cosine_similarity(query_embedding, embedding)
-            similarities.append({
-                "text": text,
-                "score": similarity
-            })
-            
-        # 按相似度排序
-        similarities.sort(key=lambda x: x["score"], reverse=True)
-        return similarities[:top_k]
+        text_embeddings = self.embed_documents(texts)
         
-    def evaluate_similarity(self, query: str, result: Dict) -> Dict:
-        """评估检索结果的相关性"""
-        messages = [
+        # 归一化后一次矩阵乘法计算全部相似度，只对前top_k个排序
+        return [
+            {"text": texts[i], "score": score}
+            for i, score in rank(query_embedding, text_embeddings, top_k)
+        ]
+        
+    def find_similar_batch(self, queries: List[str], texts: List[str], top_k: int = 3) -> List[List[Dict]]:
+        """批量查找语义相似的文本，结果顺序与queries一致
+        
+        查询和候选文本各批量生成一次嵌入，全部查询与候选的相似度由矩阵乘法一次算出。
+        """
+        if not queries:
+            return []
+        if not texts:
+            return [[] for _ in queries]
+        query_embeddings = self.embed_documents(queries)
+        text_embeddings = self.embed_documents(texts)
+        indices, scores = top_k_cosine(query_embeddings, text_embeddings, top_k)
+        return [
+            [{"text": texts[i], "score": float(score)} for i, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+        
+    def _evaluate_messages(self, query: str, result: Dict) -> list:
+        """构建模型评估相关性的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请评估检索结果与查询的相关性。返回JSON格式：
 {{
@@ -128,12 +295,43 @@ class EmbeddingAgent(BaseAgent):
 相似度分数：{result["score"]}""")
         ]
         
-        response = self.chat(messages)
-        return json.loads(response) 
+    def _local_evaluation(self, cosine: float, score: float) -> Dict:
+        """不调用模型时的评估结果"""
+        side = "高于" if score >= self.similarity_high else "低于"
+        return {
+            "relevance_score": score,
+            "explanation": f"嵌入余弦相似度{cosine:.3f}（缩放后{score:.3f}）{side}不确定区间，未调用模型"
+        }
+        
+    def evaluate_similarity(self, query: str, result: Dict) -> Dict:
+        """评估检索结果的相关性，余弦相似度落在不确定区间内时才调用模型"""
+        return self.evaluate_similarities(query, [result])[0]
+        
+    @traced()
+    def evaluate_similarities(self, query: str, results: List[Dict]) -> List[Dict]:
+        """批量评估检索结果的相关性，结果顺序与results一致
+        
+        查询和全部结果一次生成嵌入；明显相关或明显无关的结果直接由缩放后的余弦相似度给出，
+        其余结果的模型调用并发执行。
+        """
+        if not results:
+            return []
+        embeddings = self.embed_documents([query] + [result["text"] for result in results])
+        cosines = [cosine_similarity(embeddings[0], embedding) for embedding in embeddings[1:]]
+        evaluations: List[Optional[Dict]] = [None] * len(results)
+        uncertain = []
+        for i, cosine in enumerate(cosines):
+            score = self._relevance(cosine)
+            if self._is_certain(score):
+                evaluations[i] = self._local_evaluation(cosine, score)
+            else:
+                uncertain.append(i)
+        
+        responses = self.chat_many([self._evaluate_messages(query, results[i]) for i in uncertain])
+        for i, response in zip(uncertain, responses):
+            evaluations[i] = json.loads(response)
+        return evaluations
 
     def compute_cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """计算两个向量的余弦相似度"""
-        dot_product = sum(a * b for a, b in zip(vec1, vec2))
-        norm1 = sum(a * a for a in vec1) ** 0.5
-        norm2 = sum(b * b for b in vec2) ** 0.5
-        return dot_product / (norm1 * norm2) if norm1 * norm2 != 0 else 0.0 
\ No newline at end of file
+        return cosine_similarity(vec1, vec2) 
\ No newline at end of file
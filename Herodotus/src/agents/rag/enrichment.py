@@ -0,0 +1,81 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import contextvars
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 回调：(条目键, 语义分析结果)
+ApplyAnalysis = Callable[[Any, Dict], None]
+
+
+class AnalysisQueue:
+    """后台语义分析队列
+
+    调用方提交 (条目键, 文本, 回调) 后立即返回；后台线程按批调用分析函数，
+    再用回调把结果写回（如更新知识库条目的元数据）。向量写入不等待任何分析调用。
+    """
+
+    def __init__(self,
+                 analyze: Callable[[List[str]], List[Dict]],
+                 batch_size: int = 10,
+                 max_pending: int = 10000):
+        """初始化队列
+
+        Args:
+            analyze: 批量分析函数，输入文本列表返回等长的分析结果
+            batch_size: 每批分析的条目数
+            max_pending: 排队条目上限，队列满时提交会阻塞
+        """
+        self.analyze = analyze
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Tuple[Any, str, ApplyAnalysis, contextvars.Context]]" = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="analysis-queue", daemon=True)
+                self._thread.start()
+
+    def submit(self, items: List[Tuple[Any, str]], apply: ApplyAnalysis) -> None:
+        """提交待分析的 (条目键, 文本)，分析完成后调用apply(条目键, 结果)"""
+        if not items:
+            return
+        # 后台线程沿用提交方的上下文（如调度优先级）
+        context = contextvars.copy_context()
+        self._ensure_worker()
+        for key, text in items:
+            self._queue.put((key, text, apply, context))
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                context = batch[0][3]
+                analyses = context.run(self.analyze, [text for _, text, _, _ in batch])
+                for (key, _, apply, _), analysis in zip(batch, analyses):
+                    apply(key, analysis)
+                self.completed += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning(f"后台语义分析失败: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def join(self) -> None:
+        """等待已提交的条目全部处理完"""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self._queue.unfinished_tasks, "completed": self.completed, "failed": self.failed}
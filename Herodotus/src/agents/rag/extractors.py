@@ -0,0 +1,191 @@
+from typing import Callable, Dict, List, Optional, Iterable
+from concurrent.futures import ProcessPoolExecutor, Future
+from html.parser import HTMLParser
+import mimetypes
+import posixpath
+import threading
+import zipfile
+import os
+import re
+import xml.etree.ElementTree as ET
+
+# 扩展名/MIME类型 -> 提取函数。提取函数接收文件路径返回纯文本，
+# 必须定义在模块顶层以便在子进程中调用
+_BY_EXTENSION: Dict[str, Callable[[str], str]] = {}
+_BY_MIME: Dict[str, Callable[[str], str]] = {}
+
+# 纯文本由FileReader流式读取，不经过提取器
+PLAIN_TEXT_EXTENSIONS = {".txt", ".md", ".text", ".csv", ".log", ""}
+
+BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6",
+              "section", "article", "blockquote", "pre", "td", "th", "title"}
+SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "head"}
+
+
+def register_extractor(extensions: Iterable[str] = (), mime_types: Iterable[str] = ()):
+    """注册提取函数
+
+    Args:
+        extensions: 文件扩展名，如 ".pdf"
+        mime_types: MIME类型，如 "application/pdf"
+    """
+    def decorator(func: Callable[[str], str]) -> Callable[[str], str]:
+        for extension in extensions:
+            _BY_EXTENSION[extension.lower()] = func
+        for mime_type in mime_types:
+            _BY_MIME[mime_type.lower()] = func
+        return func
+    return decorator
+
+
+def get_extractor(file_path: str, mime_type: Optional[str] = None) -> Optional[Callable[[str], str]]:
+    """查找文件对应的提取函数，纯文本返回None（由调用方流式读取）
+
+    先按MIME类型查找，再按扩展名，未知格式按纯文本处理。
+    """
+    mime_type = mime_type or mimetypes.guess_type(file_path)[0]
+    if mime_type and mime_type.lower() in _BY_MIME:
+        return _BY_MIME[mime_type.lower()]
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in PLAIN_TEXT_EXTENSIONS:
+        return None
+    return _BY_EXTENSION.get(extension)
+
+
+def extract_text(file_path: str, mime_type: Optional[str] = None) -> str:
+    """提取文件的纯文本，纯文本文件直接读取"""
+    extractor = get_extractor(file_path, mime_type)
+    if extractor is None:
+        with open(file_path, "r", encoding="utf-8-sig", errors="replace") as f:
+            return f.read()
+    return extractor(file_path)
+
+
+class _TextCollector(HTMLParser):
+    """标准库HTML文本提取，未安装BeautifulSoup时使用"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """把HTML转换为段落之间以空行分隔的纯文本"""
+    try:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, "html.parser")
+        for tag in soup(list(SKIP_TAGS)):
+            tag.decompose()
+        text = soup.get_text("\n")
+    except ImportError:
+        collector = _TextCollector()
+        collector.feed(html)
+        collector.close()
+        text = "".join(collector.parts)
+    lines = [line.strip() for line in text.splitlines()]
+    return "\n\n".join(line for line in lines if line)
+
+
+@register_extractor(extensions=(".html", ".htm", ".xhtml"), mime_types=("text/html", "application/xhtml+xml"))
+def extract_html(file_path: str) -> str:
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        return html_to_text(f.read())
+
+
+@register_extractor(extensions=(".pdf",), mime_types=("application/pdf",))
+def extract_pdf(file_path: str) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ImportError("提取PDF需要安装pypdf: pip install pypdf") from e
+    reader = PdfReader(file_path)
+    pages = [(page.extract_text() or "").strip() for page in reader.pages]
+    return "\n\n".join(page for page in pages if page)
+
+
+def _epub_spine(archive: zipfile.ZipFile) -> List[str]:
+    """按OPF的spine顺序列出正文文件，无法解析时按文件名排序"""
+    try:
+        container = ET.fromstring(archive.read("META-INF/container.xml"))
+        rootfile = next(e for e in container.iter() if e.tag.endswith("rootfile"))
+        opf_path = rootfile.attrib["full-path"]
+        opf = ET.fromstring(archive.read(opf_path))
+        base = posixpath.dirname(opf_path)
+        manifest = {
+            item.attrib["id"]: posixpath.normpath(posixpath.join(base, item.attrib["href"]))
+            for item in opf.iter() if item.tag.endswith("item") and "href" in item.attrib
+        }
+        spine = [manifest[ref.attrib["idref"]] for ref in opf.iter()
+                 if ref.tag.endswith("itemref") and ref.attrib.get("idref") in manifest]
+        if spine:
+            return spine
+    except (KeyError, StopIteration, ET.ParseError):
+        pass
+    return sorted(name for name in archive.namelist() if re.search(r"\.x?html?$", name, re.I))
+
+
+@register_extractor(extensions=(".epub",), mime_types=("application/epub+zip",))
+def extract_epub(file_path: str) -> str:
+    with zipfile.ZipFile(file_path) as archive:
+        sections = []
+        for name in _epub_spine(archive):
+            try:
+                html = archive.read(name).decode("utf-8", errors="replace")
+            except KeyError:
+                continue
+            text = html_to_text(html)
+            if text:
+                sections.append(text)
+    return "\n\n".join(sections)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """获取进程级提取进程池，进程数取环境变量EXTRACT_WORKERS，默认为CPU核数"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv("EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def shutdown_extraction_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def submit_extractions(file_paths: Iterable[str]) -> Dict[str, Future]:
+    """把需要解析的文件提交到进程池并行提取，纯文本文件不提交
+
+    Returns:
+        文件路径 -> 提取结果的Future
+    """
+    futures = {}
+    for file_path in file_paths:
+        if file_path not in futures and get_extractor(file_path) is not None:
+            futures[file_path] = get_extraction_pool().submit(extract_text, file_path)
+    return futures
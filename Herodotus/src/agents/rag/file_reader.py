@@ -0,0 +1,73 @@
+from typing import Iterator, Optional
+import codecs
+import mmap
+import os
+
+
+class FileReader:
+    """按窗口流式读取大文件
+
+    通过mmap映射文件，每次只解码一个窗口，增量解码器负责处理跨窗口的多字节UTF-8字符。
+    已读过的窗口会提示内核释放，峰值内存只取决于窗口大小而不是文件大小。
+    """
+
+    def __init__(self,
+                 window_size: Optional[int] = None,
+                 encoding: str = "utf-8-sig",
+                 errors: str = "replace"):
+        """初始化读取器
+
+        Args:
+            window_size: 窗口字节数，默认取环境变量READ_WINDOW_BYTES（1MB），向上对齐到内存页
+            encoding: 文本编码，默认UTF-8并去掉BOM
+            errors: 解码错误处理方式，默认替换为U+FFFD以便清洗阶段识别
+        """
+        window_size = window_size or int(os.getenv("READ_WINDOW_BYTES", str(1 << 20)))
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.window_size = max(granularity, -(-window_size // granularity) * granularity)
+        self.encoding = encoding
+        self.errors = errors
+
+    def iter_text(self, file_path: str) -> Iterator[str]:
+        """逐窗口产出解码后的文本"""
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors=self.errors)
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # 无法映射的文件（如管道、部分网络文件系统）退回到普通分块读取
+                yield from self._iter_blocks(f, decoder)
+                return
+
+            with mapped:
+                for offset in range(0, size, self.window_size):
+                    end = min(offset + self.window_size, size)
+                    text = decoder.decode(mapped[offset:end], final=end >= size)
+                    self._release(mapped, offset, end - offset)
+                    if text:
+                        yield text
+
+    def _iter_blocks(self, f, decoder) -> Iterator[str]:
+        while True:
+            block = f.read(self.window_size)
+            text = decoder.decode(block, final=not block)
+            if text:
+                yield text
+            if not block:
+                break
+
+    @staticmethod
+    def _release(mapped: mmap.mmap, offset: int, length: int) -> None:
+        """提示内核回收已读窗口的页面，不支持madvise的平台忽略"""
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+            try:
+                mapped.madvise(mmap.MADV_DONTNEED, offset, length)
+            except OSError:
+                pass
+
+    def read_text(self, file_path: str) -> str:
+        """读取整个文件"""
+        return "".join(self.iter_text(file_path))
@@ -0,0 +1,426 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import fnmatch
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from ..rate_limiter import priority, PRIORITY_BULK
+from ..tracing import span
+from .extractors import submit_extractions
+from .manifest import hash_file, pack_embedding, unpack_embedding
+
+# 文件依次经过 pending -> extracted -> cleaned -> chunked，
+# 片段依次经过 chunked -> qa -> embedded -> indexed，近重复片段标记为duplicate
+FILE_STAGES = ("pending", "extracted", "cleaned", "chunked")
+CHUNK_STAGES = ("chunked", "qa", "embedded", "indexed", "duplicate")
+
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class IngestJob:
+    """可断点续传的目录导入任务
+
+    每个阶段（提取、清洗、分块、问答、嵌入、索引）的结果都写入SQLite检查点，
+    任务中断后重新运行会从各条目停下的阶段继续，已付费的语言模型和嵌入结果不会丢失。
+    失败的条目进入重试队列，最多尝试max_retries次；队列超过上限时任务中止。
+    文件内容变化后重新处理该文件，并删除旧片段对应的向量。
+    """
+
+    def __init__(self,
+                 rag_agent,
+                 directory: str,
+                 checkpoint_path: Optional[str] = None,
+                 patterns: Iterable[str] = ("*",),
+                 batch_size: int = 32,
+                 max_retries: int = 3,
+                 max_retry_queue: int = 1000,
+                 retry_delay: float = 1.0,
+                 progress: Optional[ProgressCallback] = None):
+        """初始化导入任务
+
+        Args:
+            rag_agent: 提供数据处理、问答、嵌入和知识库组件的RAGAgent
+            directory: 要导入的目录
+            checkpoint_path: 检查点文件，默认为目录下的.historian_ingest.db
+            patterns: 文件名通配符
+            batch_size: 问答、嵌入和索引阶段每批的片段数
+            max_retries: 每个条目的最大尝试次数
+            max_retry_queue: 待重试条目的上限
+            retry_delay: 重试轮次之间的初始等待秒数，按轮次翻倍
+            progress: 进度回调 (阶段, 已完成数, 总数)
+        """
+        self.agent = rag_agent
+        self.directory = os.path.abspath(directory)
+        self.checkpoint_path = checkpoint_path or os.path.join(self.directory, ".historian_ingest.db")
+        self.patterns = list(patterns)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.max_retry_queue = max_retry_queue
+        self.retry_delay = retry_delay
+        self.progress = progress
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.checkpoint_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                text TEXT
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                qa TEXT,
+                duplicate_of INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_stage ON chunks(stage);
+            CREATE INDEX IF NOT EXISTS idx_chunks_path ON chunks(path);
+            CREATE TABLE IF NOT EXISTS entries (
+                entry_id TEXT PRIMARY KEY,
+                chunk_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT,
+                embedding BLOB NOT NULL,
+                indexed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_chunk ON entries(chunk_id);
+        """)
+        self._conn.commit()
+
+    def _execute(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        with self._lock:
+            rows = self._conn.execute(sql, tuple(params)).fetchall()
+            self._conn.commit()
+        return rows
+
+    def _report(self, stage: str, done: int, total: int) -> None:
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
+    def _iter_files(self) -> Iterator[str]:
+        checkpoint = os.path.abspath(self.checkpoint_path)
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if name.startswith(".") or path.startswith(checkpoint):
+                    continue
+                if any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns):
+                    yield path
+
+    def _scan(self) -> None:
+        """登记目录中的文件：新文件从头开始，内容变化的文件重置，已删除的文件清理"""
+        seen = set()
+        for path in self._iter_files():
+            seen.add(path)
+            file_hash = hash_file(path)
+            row = self._execute("SELECT file_hash FROM files WHERE path = ?", (path,))
+            if row and row[0][0] == file_hash:
+                continue
+            if row:
+                self._forget(path)
+            self._execute("INSERT INTO files (path, file_hash, stage) VALUES (?, ?, 'pending')", (path, file_hash))
+        for (path,) in self._execute("SELECT path FROM files"):
+            if path not in seen:
+                self._forget(path)
+
+    def _forget(self, path: str) -> None:
+        """删除文件的检查点记录和已写入知识库的向量"""
+        rows = self._execute(
+            "SELECT entry_id FROM entries WHERE indexed = 1 AND chunk_id IN (SELECT chunk_id FROM chunks WHERE path = ?)",
+            (path,)
+        )
+        if rows and getattr(self.agent, "database_agent", None) is not None:
+            self.agent.database_agent.delete_knowledge([row[0] for row in rows])
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE path = ?)", (path,))
+            # 指向被删除片段的重复片段需要重新处理
+            self._conn.execute(
+                "UPDATE chunks SET stage = 'chunked', duplicate_of = NULL "
+                "WHERE duplicate_of IN (SELECT chunk_id FROM chunks WHERE path = ?)", (path,)
+            )
+            self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._conn.commit()
+
+    def _restore(self) -> None:
+        """把检查点中已索引的条目写回知识库（知识库在内存中，进程重启后为空）"""
+        database = self.agent.database_agent
+        existing = database.knowledge_ids()
+        rows = self._execute("SELECT entry_id, text, metadata, embedding FROM entries WHERE indexed = 1")
+        rows = [row for row in rows if row[0] not in existing]
+        with span("ingest.restore", self, count=len(rows)):
+            for start in range(0, len(rows), database.insert_block):
+                self._add_entries(rows[start:start + database.insert_block])
+
+    def _add_entries(self, rows: List[tuple]) -> None:
+        """把entries表中的 (条目ID, 文本, 元数据, 嵌入) 批量写入知识库
+
+        deferred模式下尚未得到语义分析的条目在写入后交给后台队列。
+        """
+        if not rows:
+            return
+        entry_ids, texts, metadatas, embeddings = zip(*rows)
+        metadatas = [json.loads(metadata) if metadata else None for metadata in metadatas]
+        self.agent.database_agent.add_knowledge_batch(
+            list(texts),
+            metadatas,
+            [unpack_embedding(embedding) for embedding in embeddings],
+            list(entry_ids)
+        )
+        self.agent.embedding_agent.defer_analysis(
+            [(entry_id, text) for entry_id, text, metadata in zip(entry_ids, texts, metadatas)
+             if (metadata or {}).get("analysis") is None],
+            self._apply_analysis
+        )
+
+    def _apply_analysis(self, entry_id: str, analysis: Dict) -> None:
+        """把后台生成的语义分析写回知识库条目和检查点"""
+        self.agent.database_agent.update_metadata(entry_id, {"analysis": analysis})
+        with self._lock:
+            row = self._conn.execute("SELECT metadata FROM entries WHERE entry_id = ?", (entry_id,)).fetchone()
+            if row is None:
+                return
+            metadata = json.loads(row[0]) if row[0] else {}
+            metadata["analysis"] = analysis
+            self._conn.execute(
+                "UPDATE entries SET metadata = ? WHERE entry_id = ?",
+                (json.dumps(metadata, ensure_ascii=False), entry_id)
+            )
+            self._conn.commit()
+
+    def _fail(self, table: str, key: str, ids: List[Any], error: Exception) -> None:
+        """记录失败，条目留在当前阶段等待重试"""
+        with self._lock:
+            self._conn.executemany(
+                f"UPDATE {table} SET attempts = attempts + 1, error = ? WHERE {key} = ?",
+                [(str(error), item) for item in ids]
+            )
+            self._conn.commit()
+
+    def _pending_files(self, stage: str) -> List[tuple]:
+        return self._execute(
+            "SELECT path, text FROM files WHERE stage = ? AND attempts < ? ORDER BY path",
+            (stage, self.max_retries)
+        )
+
+    def _pending_chunks(self, stage: str) -> List[tuple]:
+        return self._execute(
+            "SELECT chunk_id, content, qa FROM chunks WHERE stage = ? AND attempts < ? ORDER BY chunk_id",
+            (stage, self.max_retries)
+        )
+
+    def _extract_stage(self) -> None:
+        files = self._pending_files("pending")
+        futures = submit_extractions(path for path, _ in files)
+        for done, (path, _) in enumerate(files, 1):
+            try:
+                # 纯文本文件不保存副本，清洗阶段直接流式读取
+                text = futures[path].result() if path in futures else None
+                self._execute("UPDATE files SET stage = 'extracted', text = ?, attempts = 0, error = NULL WHERE path = ?", (text, path))
+            except Exception as e:
+                self._fail("files", "path", [path], e)
+            self._report("extract", done, len(files))
+
+    def _clean_stage(self) -> None:
+        data_agent = self.agent.data_agent
+        files = self._pending_files("extracted")
+        for done, (path, text) in enumerate(files, 1):
+            try:
+                source = [text] if text is not None else data_agent.reader.iter_text(path)
+                cleaned = "\n\n".join(data_agent.iter_clean(source))
+                self._execute("UPDATE files SET stage = 'cleaned', text = ?, attempts = 0, error = NULL WHERE path = ?", (cleaned, path))
+            except Exception as e:
+                self._fail("files", "path", [path], e)
+            self._report("clean", done, len(files))
+
+    def _chunk_stage(self) -> None:
+        splitter = self.agent.data_agent.splitter
+        files = self._pending_files("cleaned")
+        for done, (path, text) in enumerate(files, 1):
+            try:
+                chunks = list(splitter.iter_chunks(p + "\n\n" for p in text.split("\n\n")))
+                with self._lock:
+                    self._conn.executemany(
+                        "INSERT INTO chunks (path, position, content, stage) VALUES (?, ?, ?, 'chunked')",
+                        [(path, position, chunk) for position, chunk in enumerate(chunks)]
+                    )
+                    # 分块后不再需要全文
+                    self._conn.execute("UPDATE files SET stage = 'chunked', text = NULL, attempts = 0, error = NULL WHERE path = ?", (path,))
+                    self._conn.commit()
+            except Exception as e:
+                self._fail("files", "path", [path], e)
+            self._report("chunk", done, len(files))
+
+    def _dedup_stage(self) -> None:
+        """合并近重复片段：已进入后续阶段的片段优先作为代表，只有尚未处理的片段会被标记为重复"""
+        deduplicator = getattr(self.agent, "deduplicator", None)
+        if deduplicator is None:
+            return
+        rows = self._execute(
+            "SELECT chunk_id, content, stage FROM chunks WHERE stage != 'duplicate' ORDER BY path, position"
+        )
+        if len(rows) < 2:
+            return
+        updates = []
+        for group in deduplicator.group([content for _, content, _ in rows]):
+            if len(group) < 2:
+                continue
+            members = [rows[i] for i in group]
+            representative = next((m for m in members if m[2] != "chunked"), members[0])
+            updates.extend(
+                (representative[0], m[0]) for m in members
+                if m is not representative and m[2] == "chunked"
+            )
+        with self._lock:
+            self._conn.executemany("UPDATE chunks SET stage = 'duplicate', duplicate_of = ? WHERE chunk_id = ?", updates)
+            self._conn.commit()
+        self._report("dedup", len(updates), len(rows))
+
+    def _qa_stage(self) -> None:
+        rewrite_agent = self.agent.rewrite_agent
+        chunks = self._pending_chunks("chunked")
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            ids = [chunk_id for chunk_id, _, _ in batch]
+            try:
+                all_qa_pairs = rewrite_agent.texts_to_qa([content for _, content, _ in batch])
+                with self._lock:
+                    self._conn.executemany(
+                        "UPDATE chunks SET stage = 'qa', qa = ?, attempts = 0, error = NULL WHERE chunk_id = ?",
+                        [(json.dumps(qa_pairs, ensure_ascii=False), chunk_id)
+                         for chunk_id, qa_pairs in zip(ids, all_qa_pairs)]
+                    )
+                    self._conn.commit()
+            except Exception as e:
+                self._fail("chunks", "chunk_id", ids, e)
+            self._report("qa", min(start + self.batch_size, len(chunks)), len(chunks))
+
+    def _sources(self, chunk_id: int) -> List[Dict]:
+        """片段及其重复片段的来源"""
+        rows = self._execute(
+            "SELECT path, position FROM chunks WHERE chunk_id = ? OR duplicate_of = ? ORDER BY chunk_id",
+            (chunk_id, chunk_id)
+        )
+        return [{"file_path": path, "chunk": position} for path, position in rows]
+
+    def _embed_stage(self) -> None:
+        embedding_agent = self.agent.embedding_agent
+        chunks = self._pending_chunks("qa")
+        for start in range(0, len(chunks), self.batch_size):
+            batch = chunks[start:start + self.batch_size]
+            ids = [chunk_id for chunk_id, _, _ in batch]
+            try:
+                groups = [self.agent.rewrite_agent.qa_texts(json.loads(qa)) for _, _, qa in batch]
+                semantics = iter(embedding_agent.embed_texts([text for group in groups for text in group]))
+                rows = []
+                for chunk_id, group in zip(ids, groups):
+                    sources = self._sources(chunk_id)
+                    for text in group:
+                        semantic = next(semantics)
+                        metadata = {k: v for k, v in semantic.items() if k != "embedding"}
+                        metadata["sources"] = sources
+                        rows.append((uuid.uuid4().hex, chunk_id, text,
+                                     json.dumps(metadata, ensure_ascii=False),
+                                     pack_embedding(semantic["embedding"])))
+                with self._lock:
+                    self._conn.executemany(
+                        "INSERT INTO entries (entry_id, chunk_id, text, metadata, embedding) VALUES (?, ?, ?, ?, ?)", rows
+                    )
+                    self._conn.executemany(
+                        "UPDATE chunks SET stage = 'embedded', attempts = 0, error = NULL WHERE chunk_id = ?", [(i,) for i in ids]
+                    )
+                    self._conn.commit()
+            except Exception as e:
+                self._fail("chunks", "chunk_id", ids, e)
+            self._report("embed", min(start + self.batch_size, len(chunks)), len(chunks))
+
+    def _index_stage(self) -> None:
+        existing = self.agent.database_agent.knowledge_ids()
+        chunks = self._pending_chunks("embedded")
+        for start in range(0, len(chunks), self.batch_size):
+            ids = [chunk_id for chunk_id, _, _ in chunks[start:start + self.batch_size]]
+            try:
+                rows = self._execute(
+                    "SELECT entry_id, text, metadata, embedding FROM entries "
+                    f"WHERE chunk_id IN ({', '.join('?' * len(ids))}) AND indexed = 0", ids
+                )
+                # 上次写入知识库后、标记之前中断的条目不重复写入
+                self._add_entries([row for row in rows if row[0] not in existing])
+                with self._lock:
+                    self._conn.executemany("UPDATE entries SET indexed = 1 WHERE entry_id = ?", [(row[0],) for row in rows])
+                    self._conn.executemany(
+                        "UPDATE chunks SET stage = 'indexed', attempts = 0, error = NULL WHERE chunk_id = ?", [(i,) for i in ids]
+                    )
+                    self._conn.commit()
+            except Exception as e:
+                self._fail("chunks", "chunk_id", ids, e)
+            self._report("index", min(start + self.batch_size, len(chunks)), len(chunks))
+
+    def _retry_queue_size(self) -> int:
+        """仍可重试的失败条目数"""
+        files = self._execute(
+            "SELECT COUNT(*) FROM files WHERE error IS NOT NULL AND attempts < ? AND stage != 'chunked'",
+            (self.max_retries,)
+        )[0][0]
+        chunks = self._execute(
+            "SELECT COUNT(*) FROM chunks WHERE error IS NOT NULL AND attempts < ? AND stage NOT IN ('indexed', 'duplicate')",
+            (self.max_retries,)
+        )[0][0]
+        return files + chunks
+
+    def run(self) -> Dict[str, Any]:
+        """运行或继续任务，返回各阶段的条目统计"""
+        with priority(PRIORITY_BULK), span("ingest_job", self, directory=self.directory):
+            self._scan()
+            self._restore()
+            for attempt in range(self.max_retries):
+                for name, stage in (("extract", self._extract_stage), ("clean", self._clean_stage),
+                                    ("chunk", self._chunk_stage), ("dedup", self._dedup_stage),
+                                    ("qa", self._qa_stage), ("embed", self._embed_stage),
+                                    ("index", self._index_stage)):
+                    with span(f"ingest.{name}", self):
+                        stage()
+                queued = self._retry_queue_size()
+                if queued == 0:
+                    break
+                if queued > self.max_retry_queue:
+                    # 检查点保留，排除故障后重新运行即可继续
+                    raise ValueError(f"导入任务中止: 待重试条目过多 ({queued} > {self.max_retry_queue})")
+                time.sleep(self.retry_delay * (2 ** attempt))
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        """各阶段的文件和片段数，以及超过重试次数的失败条目"""
+        files = dict(self._execute("SELECT stage, COUNT(*) FROM files GROUP BY stage"))
+        chunks = dict(self._execute("SELECT stage, COUNT(*) FROM chunks GROUP BY stage"))
+        failed = self._execute(
+            "SELECT path, error FROM files WHERE attempts >= ? AND stage != 'chunked' "
+            "UNION ALL SELECT path || '#' || position, error FROM chunks "
+            "WHERE attempts >= ? AND stage NOT IN ('indexed', 'duplicate')",
+            (self.max_retries, self.max_retries)
+        )
+        return {
+            "files": {stage: files.get(stage, 0) for stage in FILE_STAGES},
+            "chunks": {stage: chunks.get(stage, 0) for stage in CHUNK_STAGES},
+            "failed": [{"item": item, "error": error} for item, error in failed]
+        }
+
+    def close(self) -> None:
+        """关闭检查点；deferred模式下先等待已排队的语义分析写回"""
+        embedding_agent = getattr(self.agent, "embedding_agent", None)
+        if embedding_agent is not None and embedding_agent.analysis_mode == "deferred":
+            embedding_agent.analysis_queue.join()
+        with self._lock:
+            self._conn.close()
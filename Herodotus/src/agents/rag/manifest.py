@@ -0,0 +1,289 @@
+from typing import Optional, Dict, Any, List, Iterator, Iterable, Tuple
+from array import array
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def hash_text(text: str) -> str:
+    """文本内容哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """分块计算文件内容哈希"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pack_embedding(embedding: List[float]) -> bytes:
+    """嵌入向量序列化为float32字节串"""
+    return array("f", embedding).tobytes()
+
+
+def unpack_embedding(blob: bytes) -> List[float]:
+    """还原嵌入向量"""
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class IngestManifest:
+    """增量导入清单
+
+    记录每个文件和片段的内容哈希及其派生结果（片段文本、问答对、向量条目及嵌入），
+    重新导入时只处理新增或变化的片段，并找出需要从向量库删除的条目。
+    片段按内容哈希存储，多个文件中相同的片段只处理一次。
+    近重复片段不对应向量，duplicate_of记录其代表片段；代表片段被删除时
+    重复片段一并删除，所在文件标记为待重新处理。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS file_chunks (
+                path TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                PRIMARY KEY (path, position)
+            );
+            CREATE INDEX IF NOT EXISTS idx_file_chunks_hash ON file_chunks(chunk_hash);
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_hash TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                qa TEXT NOT NULL,
+                duplicate_of TEXT
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                entry_id TEXT PRIMARY KEY,
+                chunk_hash TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT,
+                embedding BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_chunk ON entries(chunk_hash);
+        """)
+        # 兼容没有duplicate_of列的旧清单
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if "duplicate_of" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN duplicate_of TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_duplicate ON chunks(duplicate_of)")
+        self._conn.commit()
+
+    def file_hash(self, path: str) -> Optional[str]:
+        """文件上次导入时的哈希，未导入过返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT file_hash FROM files WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def files(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM files")]
+
+    def chunk_hashes(self, path: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT chunk_hash FROM file_chunks WHERE path = ? ORDER BY position", (path,)
+            )]
+
+    def known_chunks(self, chunk_hashes: Iterable[str]) -> set:
+        """返回已处理过的片段哈希"""
+        hashes = list(set(chunk_hashes))
+        known = set()
+        with self._lock:
+            # SQLite单条语句的参数个数有限，分批查询
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                known.update(row[0] for row in self._conn.execute(
+                    f"SELECT chunk_hash FROM chunks WHERE chunk_hash IN ({placeholders})", batch
+                ))
+        return known
+
+    def get_qa(self, chunk_hash: str) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT qa FROM chunks WHERE chunk_hash = ?", (chunk_hash,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_chunk(self,
+                  chunk_hash: str,
+                  content: str,
+                  qa_pairs: List[Dict[str, str]],
+                  entries: List[Tuple[str, str, Optional[Dict], List[float]]],
+                  duplicate_of: Optional[str] = None) -> None:
+        """保存片段及其派生结果
+
+        Args:
+            chunk_hash: 片段内容哈希
+            content: 片段文本
+            qa_pairs: 问答对
+            entries: 向量条目 (条目ID, 文本, 元数据, 嵌入向量)
+            duplicate_of: 近重复片段的代表片段哈希，此时qa_pairs和entries为空
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (chunk_hash, content, qa, duplicate_of) VALUES (?, ?, ?, ?)",
+                (chunk_hash, content, json.dumps(qa_pairs, ensure_ascii=False), duplicate_of)
+            )
+            self._conn.execute("DELETE FROM entries WHERE chunk_hash = ?", (chunk_hash,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (entry_id, chunk_hash, text, metadata, embedding) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (entry_id, chunk_hash, text,
+                     json.dumps(metadata, ensure_ascii=False) if metadata is not None else None,
+                     pack_embedding(embedding))
+                    for entry_id, text, metadata, embedding in entries
+                ]
+            )
+            self._conn.commit()
+
+    def update_entry_metadata(self, entry_id: str, updates: Dict) -> bool:
+        """合并更新条目的元数据（如后台补充的语义分析），条目不存在时返回False"""
+        with self._lock:
+            row = self._conn.execute("SELECT metadata FROM entries WHERE entry_id = ?", (entry_id,)).fetchone()
+            if row is None:
+                return False
+            metadata = json.loads(row[0]) if row[0] else {}
+            metadata.update(updates)
+            self._conn.execute(
+                "UPDATE entries SET metadata = ? WHERE entry_id = ?",
+                (json.dumps(metadata, ensure_ascii=False), entry_id)
+            )
+            self._conn.commit()
+        return True
+
+    def set_file(self, path: str, file_hash: str, chunk_hashes: List[str]) -> None:
+        """记录文件的哈希和片段组成"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, file_hash, updated) VALUES (?, ?, ?)",
+                (path, file_hash, time.time())
+            )
+            self._conn.execute("DELETE FROM file_chunks WHERE path = ?", (path,))
+            self._conn.executemany(
+                "INSERT INTO file_chunks (path, position, chunk_hash) VALUES (?, ?, ?)",
+                [(path, i, h) for i, h in enumerate(chunk_hashes)]
+            )
+            self._conn.commit()
+
+    def remove_file(self, path: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM file_chunks WHERE path = ?", (path,))
+            self._conn.commit()
+
+    def pop_orphans(self) -> List[str]:
+        """删除不再被任何文件引用的片段，返回它们的向量条目ID（见pop_orphan_chunks）"""
+        return self.pop_orphan_chunks()[1]
+
+    def pop_orphan_chunks(self) -> Tuple[List[str], List[str]]:
+        """删除不再被任何文件引用的片段
+
+        依附于被删除片段的近重复片段没有自己的向量，也一并删除，
+        其所在文件的哈希被清空，下次导入时重新处理（见stale_files）。
+
+        Returns:
+            (被删除的片段哈希, 它们的向量条目ID)
+        """
+        with self._lock:
+            orphans = [row[0] for row in self._conn.execute(
+                "SELECT chunk_hash FROM chunks WHERE chunk_hash NOT IN (SELECT chunk_hash FROM file_chunks)"
+            )]
+            removed, entry_ids = list(orphans), []
+            for start in range(0, len(orphans), 500):
+                batch = orphans[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                entry_ids.extend(row[0] for row in self._conn.execute(
+                    f"SELECT entry_id FROM entries WHERE chunk_hash IN ({placeholders})", batch
+                ))
+                self._conn.execute(f"DELETE FROM entries WHERE chunk_hash IN ({placeholders})", batch)
+                self._conn.execute(f"DELETE FROM chunks WHERE chunk_hash IN ({placeholders})", batch)
+                self._conn.execute(
+                    "UPDATE files SET file_hash = '' WHERE path IN (SELECT path FROM file_chunks WHERE chunk_hash IN "
+                    f"(SELECT chunk_hash FROM chunks WHERE duplicate_of IN ({placeholders})))", batch
+                )
+                removed.extend(row[0] for row in self._conn.execute(
+                    f"SELECT chunk_hash FROM chunks WHERE duplicate_of IN ({placeholders})", batch
+                ))
+                self._conn.execute(f"DELETE FROM chunks WHERE duplicate_of IN ({placeholders})", batch)
+            self._conn.commit()
+        return removed, entry_ids
+
+    def stale_files(self) -> List[str]:
+        """因近重复片段失去代表片段而需要重新处理的文件"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM files WHERE file_hash = ''")]
+
+    def representative(self, chunk_hash: str) -> str:
+        """近重复片段返回其代表片段的哈希，其他片段返回自身"""
+        with self._lock:
+            row = self._conn.execute("SELECT duplicate_of FROM chunks WHERE chunk_hash = ?", (chunk_hash,)).fetchone()
+        return row[0] if row and row[0] else chunk_hash
+
+    def entry_metadata(self, chunk_hash: str) -> List[Tuple[str, Optional[Dict]]]:
+        """片段对应的向量条目 (条目ID, 元数据)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry_id, metadata FROM entries WHERE chunk_hash = ? ORDER BY entry_id", (chunk_hash,)
+            ).fetchall()
+        return [(entry_id, json.loads(metadata) if metadata else None) for entry_id, metadata in rows]
+
+    def iter_representatives(self, batch_size: int = 1000) -> Iterator[List[Tuple[str, str]]]:
+        """分批遍历不是近重复的片段 (片段哈希, 文本)，用于重建近重复索引"""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT chunk_hash, content FROM chunks WHERE duplicate_of IS NULL AND chunk_hash > ? "
+                    "ORDER BY chunk_hash LIMIT ?",
+                    (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def iter_entries(self, batch_size: int = 1000) -> Iterator[List[Tuple[str, str, Optional[Dict], List[float]]]]:
+        """分批遍历所有向量条目，用于重建向量库"""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT entry_id, text, metadata, embedding FROM entries WHERE entry_id > ? ORDER BY entry_id LIMIT ?",
+                    (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [
+                (entry_id, text, json.loads(metadata) if metadata else None, unpack_embedding(embedding))
+                for entry_id, text, metadata, embedding in rows
+            ]
+            last = rows[-1][0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0],
+                "chunks": self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0],
+                "entries": self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,12 +1,15 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional, Tuple
+import asyncio
+import os
+import uuid
 from ..base_agent import BaseAgent
+from ..rate_limiter import priority, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from ..tracing import span
 from langchain_core.messages import SystemMessage, HumanMessage
 from .data_agent import DataAgent
 from .rewrite_agent import RewriteAgent
-from .embedding_agent import EmbeddingAgent
-from .database_agent import DatabaseAgent
-from .retrieval_agent import RetrievalAgent
-from .rerank_agent import RerankAgent
+from .manifest import IngestManifest, hash_file, hash_text
+from .extractors import submit_extractions
 
 class RAGAgent(BaseAgent):
     """基于语言模型的RAG代理"""
@@ -30,7 +33,8 @@ class RAGAgent(BaseAgent):
                  use_embedding: bool = True,
                  use_database: bool = True,
                  use_retrieval: bool = True,
-                 use_rerank: bool = True):
+                 use_rerank: bool = True,
+                 manifest_path: str = None):
         """初始化RAG代理
         
         Args:
@@ -42,6 +46,7 @@ class RAGAgent(BaseAgent):
             use_database: 是否使用数据库
             use_retrieval: 是否使用检索
             use_rerank: 是否使用重排序
+            manifest_path: 增量导入清单路径，默认取环境变量INGEST_MANIFEST，为空时不启用
         """
         super().__init__(model_name=model_name, 
                         api_key=api_key, 
@@ -53,59 +58,334 @@ class RAGAgent(BaseAgent):
         self.use_retrieval = use_retrieval
         self.use_rerank = use_rerank
         
-        # 初始化子组件
+        # 初始化子组件，文档处理和查询改写是加载与查询的必需环节，其余组件按需导入
+        self.data_agent = DataAgent(model_name=model_name, api_key=api_key, api_base=api_base, streaming=False)
+        self.rewrite_agent = RewriteAgent(model_name=model_name, api_key=api_key, api_base=api_base, streaming=False)
+        
         if self.use_embedding:
             from .embedding_agent import EmbeddingAgent
-            self.embedding_agent = EmbeddingAgent(model_name=model_name, api_key=api_key, api_base=api_base)
+            self.embedding_agent = EmbeddingAgent(model_name=model_name, api_key=api_key, api_base=api_base, streaming=False)
             
         if self.use_database:
             from .database_agent import DatabaseAgent
-            self.database_agent = DatabaseAgent(model_name=model_name, api_key=api_key, api_base=api_base)
+            self.database_agent = DatabaseAgent(model_name=model_name, api_key=api_key, api_base=api_base, streaming=False)
             
         if self.use_retrieval:
             from .retrieval_agent import RetrievalAgent
-            self.retrieval_agent = RetrievalAgent(model_name=model_name, api_key=api_key, api_base=api_base)
+            self.retrieval_agent = RetrievalAgent(model_name=model_name, api_key=api_key, api_base=api_base, streaming=False)
             
         if self.use_rerank:
             from .rerank_agent import RerankAgent
-            self.rerank_agent = RerankAgent(model_name=model_name, api_key=api_key, api_base=api_base)
+            self.rerank_agent = RerankAgent(model_name=model_name, api_key=api_key, api_base=api_base, streaming=False)
+            
+        # 近重复片段检测，DEDUP_THRESHOLD设为off时关闭
+        self.deduplicator = None
+        if os.getenv("DEDUP_THRESHOLD", "").lower() not in ("off", "false", "0"):
+            from .dedup import NearDuplicateIndex
+            self.deduplicator = NearDuplicateIndex()
+        # 启用清单时近重复索引跨批次保留，首次去重时用清单中的片段重建
+        self._dedup_loaded = False
+            
+        # 增量导入清单：记录已处理的文件和片段，并用保存的嵌入恢复向量库
+        manifest_path = manifest_path or os.getenv("INGEST_MANIFEST")
+        self.manifest = IngestManifest(manifest_path) if manifest_path else None
+        if self.manifest is not None and self.use_database:
+            self._restore_from_manifest()
+        
+    def _restore_from_manifest(self) -> None:
+        """用清单中保存的嵌入重建向量库，不重新生成嵌入
+        
+        deferred模式下尚未得到语义分析的条目重新交给后台队列。
+        """
+        with span("load.restore", self):
+            batch = []
+            for entries in self.manifest.iter_entries():
+                batch.extend(entries)
+                if len(batch) >= self.database_agent.insert_block:
+                    self._restore_batch(batch)
+                    batch = []
+            self._restore_batch(batch)
+            
+    def _restore_batch(self, entries: List[Tuple]) -> None:
+        """把一批 (条目ID, 文本, 元数据, 嵌入) 批量写入向量库"""
+        if entries:
+            ids, texts, metadatas, embeddings = zip(*entries)
+            self.database_agent.add_knowledge_batch(list(texts), list(metadatas), list(embeddings), list(ids))
+            if getattr(self, "embedding_agent", None) is not None:
+                self.embedding_agent.defer_analysis(
+                    [(doc_id, text) for doc_id, text, metadata, _ in entries
+                     if (metadata or {}).get("analysis") is None],
+                    self._apply_analysis
+                )
+                    
+    def _changed_chunks(self, file_paths: List[str]) -> Tuple[List[Dict], List[Tuple]]:
+        """找出新增或变化的文件中尚未处理过的片段
+        
+        Returns:
+            (待处理片段 [{"hash", "content", "sources"}], 文件记录 [(路径, 文件哈希, 片段哈希列表)])
+        """
+        changed = []
+        for path in file_paths:
+            file_hash = hash_file(path)
+            if self.manifest.file_hash(os.path.abspath(path)) != file_hash:
+                changed.append((path, file_hash))
+                
+        futures = submit_extractions([path for path, _ in changed])
+        pending, records, seen, known_sources = [], [], {}, {}
+        for path, file_hash in changed:
+            chunks = list(self.data_agent.iter_file_chunks(path, futures.get(path)))
+            hashes = [hash_text(chunk) for chunk in chunks]
+            known = self.manifest.known_chunks(hashes)
+            for position, (chunk_hash, chunk) in enumerate(zip(hashes, chunks)):
+                source = {"file_path": path, "chunk": position}
+                if chunk_hash in known:
+                    # 已处理过的片段不再生成向量，只在已有条目中补充来源
+                    known_sources.setdefault(chunk_hash, []).append(source)
+                    continue
+                if chunk_hash in seen:
+                    # 完全相同的片段只处理一次，补充来源
+                    seen[chunk_hash]["sources"].append(source)
+                else:
+                    seen[chunk_hash] = {"hash": chunk_hash, "content": chunk, "sources": [source]}
+                    pending.append(seen[chunk_hash])
+            records.append((os.path.abspath(path), file_hash, hashes))
+        self._extend_sources(known_sources)
+        return pending, records
+        
+    def _dedup_chunks(self, pending: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """合并近重复片段，代表片段的sources汇总整组的来源
+        
+        启用导入清单时还与之前导入的片段比较，与已入库片段近重复的新片段不再生成向量，
+        其来源追加到已入库片段各条目的sources中。
+        
+        Returns:
+            (保留的代表片段, 被合并的重复片段)
+        """
+        kept, duplicates = [], []
+        if self.manifest is None:
+            for group in self.deduplicator.group([chunk["content"] for chunk in pending]):
+                representative = pending[group[0]]
+                for i in group[1:]:
+                    representative["sources"].extend(pending[i]["sources"])
+                    pending[i]["duplicate_of"] = representative["hash"]
+                    duplicates.append(pending[i])
+                kept.append(representative)
+            return kept, duplicates
+            
+        self._load_dedup_index()
+        matches = self.deduplicator.assign([chunk["content"] for chunk in pending],
+                                           [chunk["hash"] for chunk in pending])
+        representatives, indexed_sources = {}, {}
+        for chunk, match in zip(pending, matches):
+            if match is None:
+                representatives[chunk["hash"]] = chunk
+                kept.append(chunk)
+                continue
+            chunk["duplicate_of"] = match
+            duplicates.append(chunk)
+            if match in representatives:
+                representatives[match]["sources"].extend(chunk["sources"])
+            else:
+                indexed_sources.setdefault(match, []).extend(chunk["sources"])
+        self._extend_sources(indexed_sources)
+        return kept, duplicates
+        
+    def _load_dedup_index(self) -> None:
+        """用清单中已入库的代表片段重建近重复索引，每个进程只做一次"""
+        if self._dedup_loaded:
+            return
+        with span("load.dedup_index", self) as sp:
+            for rows in self.manifest.iter_representatives():
+                for chunk_hash, content in rows:
+                    self.deduplicator.add(chunk_hash, content)
+            sp.set(count=len(self.deduplicator))
+        self._dedup_loaded = True
+        
+    def _extend_sources(self, new_sources: Dict[str, List[Dict]]) -> None:
+        """把本次导入中的来源写入已入库片段全部条目的sources元数据，向量库和清单同步更新
+        
+        近重复片段的来源写到其代表片段；同一文件原有的来源被本次的来源替换，
+        重新导入变化的文件时片段位置随之更新。
+        
+        Args:
+            new_sources: 片段哈希 -> 本次导入中该片段的全部来源
+        """
+        merged_sources = {}
+        for chunk_hash, sources in new_sources.items():
+            merged_sources.setdefault(self.manifest.representative(chunk_hash), []).extend(sources)
+        for chunk_hash, sources in merged_sources.items():
+            paths = {source["file_path"] for source in sources}
+            for entry_id, metadata in self.manifest.entry_metadata(chunk_hash):
+                existing = (metadata or {}).get("sources", [])
+                merged = [source for source in existing if source.get("file_path") not in paths] + sources
+                if merged != existing:
+                    self.database_agent.update_metadata(entry_id, {"sources": merged})
+                    self.manifest.update_entry_metadata(entry_id, {"sources": merged})
+            
+    def _pop_orphans(self) -> int:
+        """删除不再被引用的片段及其向量，同时移出近重复索引，返回删除的向量数"""
+        chunk_hashes, entry_ids = self.manifest.pop_orphan_chunks()
+        if self.deduplicator is not None:
+            self.deduplicator.discard(chunk_hashes)
+        return self.database_agent.delete_knowledge(entry_ids)
+        
+    def _sync_manifest(self, records: List[Tuple]) -> None:
+        """更新文件记录，清理已删除的文件，并删除不再被引用的片段对应的向量"""
+        for path, file_hash, hashes in records:
+            self.manifest.set_file(path, file_hash, hashes)
+        for path in self.manifest.files():
+            if not os.path.exists(path):
+                self.manifest.remove_file(path)
+        self._pop_orphans()
+        
+    def _apply_analysis(self, doc_id: str, analysis: Dict) -> None:
+        """把后台生成的语义分析写回知识库条目和导入清单"""
+        self.database_agent.update_metadata(doc_id, {"analysis": analysis})
+        if self.manifest is not None:
+            self.manifest.update_entry_metadata(doc_id, {"analysis": analysis})
         
     def load_documents(self, file_paths: List[str]) -> None:
-        """加载并处理文档"""
+        """加载并处理文档，出站调用按批量优先级调度
+        
+        启用导入清单时只处理新增或内容变化的片段，未变化的文件直接跳过，
+        已删除或已变化的片段对应的向量会从知识库中移除。
+        本次加载的片段中的近重复只生成问答和嵌入一次，元数据的sources记录全部来源。
+        """
         try:
-            # 1. 数据处理
-            processed_docs = []
-            for path in file_paths:
-                result = self.data_agent.process_document(path)
-                processed_docs.extend(result["texts"])
-                
-            # 2. 文本重写（生成问答对）
-            enhanced_texts = []
-            for doc in processed_docs:
-                qa_pairs = self.rewrite_agent.text_to_qa(doc.page_content)
-                enhanced_texts.extend([qa["question"] for qa in qa_pairs])
-                enhanced_texts.extend([qa["answer"] for qa in qa_pairs])
+            with priority(PRIORITY_BULK), span("load_documents", self, files=len(file_paths)):
+                # 1. 数据处理
+                with span("load.process", self) as sp:
+                    records = []
+                    if self.manifest is None:
+                        # 与清单分支相同，只读取和分割，片段分析由嵌入代理负责
+                        pending = []
+                        futures = submit_extractions(file_paths)
+                        for path in file_paths:
+                            pending.extend(
+                                {"hash": None, "content": chunk,
+                                 "sources": [{"file_path": path, "chunk": position}]}
+                                for position, chunk in enumerate(self.data_agent.iter_file_chunks(path, futures.get(path)))
+                            )
+                    else:
+                        pending, records = self._changed_chunks(file_paths)
+                    sp.set(count=len(pending))
+                    
+                # 2. 近重复去重
+                duplicates = []
+                if self.deduplicator is not None and pending:
+                    with span("load.dedup", self) as sp:
+                        pending, duplicates = self._dedup_chunks(pending)
+                        sp.set(count=len(pending), duplicates=len(duplicates))
+                    
+                # 3. 文本重写（批量生成问答对）
+                with span("load.qa", self) as sp:
+                    all_qa_pairs = self.rewrite_agent.texts_to_qa([chunk["content"] for chunk in pending])
+                    groups = [self.rewrite_agent.qa_texts(qa_pairs) for qa_pairs in all_qa_pairs]
+                    enhanced_texts = [text for group in groups for text in group]
+                    sp.set(count=len(enhanced_texts))
+                    
+                # 4. 语义分析
+                with span("load.embed", self, count=len(enhanced_texts)):
+                    semantic_representations = self.embedding_agent.embed_texts(enhanced_texts)
                 
-            # 3. 语义分析
-            semantic_representations = self.embedding_agent.embed_texts(enhanced_texts)
-            
-            # 4. 存储到知识库
-            for text, semantic in zip(enhanced_texts, semantic_representations):
-                self.database_agent.add_knowledge(text, semantic)
+                # 5. 存储到知识库，嵌入向量直接复用，不写入元数据
+                with span("load.index", self, count=len(enhanced_texts)):
+                    texts, metadatas, embeddings, ids = [], [], [], []
+                    semantics = iter(semantic_representations)
+                    for chunk, group in zip(pending, groups):
+                        for i, text in enumerate(group):
+                            semantic = next(semantics)
+                            metadata = {k: v for k, v in semantic.items() if k != "embedding"}
+                            metadata["sources"] = chunk["sources"]
+                            texts.append(text)
+                            metadatas.append(metadata)
+                            embeddings.append(semantic["embedding"])
+                            ids.append(f"{chunk['hash']}:{i}" if chunk["hash"] else uuid.uuid4().hex)
+                    # 全部条目一次批量写入向量库
+                    self.database_agent.add_knowledge_batch(texts, metadatas, embeddings, ids)
+                    
+                    position = 0
+                    for chunk, qa_pairs, group in zip(pending, all_qa_pairs, groups):
+                        end = position + len(group)
+                        entries = list(zip(ids[position:end], texts[position:end],
+                                           metadatas[position:end], embeddings[position:end]))
+                        position = end
+                        if self.manifest is not None:
+                            self.manifest.put_chunk(chunk["hash"], chunk["content"], qa_pairs, entries)
+                        # deferred模式的语义分析在后台补充，写入向量不等待
+                        self.embedding_agent.defer_analysis(
+                            [(doc_id, text) for doc_id, text, _, _ in entries], self._apply_analysis
+                        )
+                            
+                # 6. 更新清单并清理过期向量，重复片段记为已处理但不对应向量
+                if self.manifest is not None:
+                    with span("load.manifest", self, files=len(records)):
+                        for chunk in duplicates:
+                            self.manifest.put_chunk(chunk["hash"], chunk["content"], [], [],
+                                                    duplicate_of=chunk["duplicate_of"])
+                        self._sync_manifest(records)
             
         except Exception as e:
+            if self._dedup_loaded:
+                # 索引中可能有未写入清单的片段，下次去重时从清单重建
+                self.deduplicator.reset()
+                self._dedup_loaded = False
             raise ValueError(f"文档加载失败: {str(e)}")
+        if self.manifest is not None:
+            self._reprocess_stale()
             
-    def query(self, question: str) -> str:
-        """查询知识库获取答案"""
+    def _reprocess_stale(self) -> None:
+        """重新处理因代表片段被删除而失去向量的近重复片段所在的文件"""
+        stale = [path for path in self.manifest.stale_files() if os.path.exists(path)]
+        if stale:
+            self.load_documents(stale)
+            
+    def ingest_directory(self, directory: str, checkpoint_path: str = None, progress=None, **kwargs) -> Dict[str, Any]:
+        """以可断点续传的任务导入整个目录，参数见IngestJob，返回各阶段的条目统计"""
+        from .ingest_job import IngestJob
+        job = IngestJob(self, directory, checkpoint_path=checkpoint_path, progress=progress, **kwargs)
         try:
-            # 1. 重写查询
-            rewritten_queries = self.rewrite_agent.rewrite_query(question)
+            return job.run()
+        finally:
+            job.close()
             
-            # 2. 获取检索策略
+    def remove_documents(self, file_paths: List[str]) -> int:
+        """从知识库移除文档，只删除不再被其他文件引用的片段，返回删除的向量数"""
+        if self.manifest is None:
+            raise ValueError("移除文档需要启用导入清单")
+        for path in file_paths:
+            self.manifest.remove_file(os.path.abspath(path))
+        removed = self._pop_orphans()
+        self._reprocess_stale()
+        return removed
+        
+    def _answer_messages(self, question: str, reranked_results: List[Dict]) -> list:
+        """基于重排序后的结果构建最终回答的消息"""
+        context = "\n\n".join([r["content"] for r in reranked_results[:3]])
+        
+        return [
+            SystemMessage(content=self.ROLE),
+            HumanMessage(content=f"""基于以下文档内容回答问题:
+
+文档内容:
+{context}
+
+问题:
+{question}""")
+        ]
+        
+    def _retrieve(self, question: str) -> List[Dict]:
+        """执行检索阶段，返回重排序后的结果"""
+        # 1. 重写查询
+        with span("query.rewrite", self):
+            rewritten_queries = self.rewrite_agent.rewrite_query(question)
+        
+        # 2. 获取检索策略
+        with span("query.strategy", self):
             strategy = self.retrieval_agent.get_strategy(question)
-            
-            # 3. 执行检索
+        
+        # 3. 执行检索
+        with span("query.search", self, queries=len(rewritten_queries)) as sp:
             all_results = []
             for query in rewritten_queries:
                 results = self.database_agent.search_knowledge(
@@ -113,37 +393,104 @@ class RAGAgent(BaseAgent):
                     top_k=strategy["params"]["k"]
                 )
                 all_results.extend(results)
-                
-            # 4. 过滤结果
-            filtered_results = self.retrieval_agent.filter_results(
-                all_results,
-                min_score=strategy["params"]["min_relevance"]
-            )
+            sp.set(count=len(all_results))
             
-            # 5. 重排序结果
+        # 4. 过滤结果
+        filtered_results = self.retrieval_agent.filter_results(
+            all_results,
+            min_score=strategy["params"]["min_relevance"]
+        )
+        
+        # 5. 重排序结果
+        with span("query.rerank", self, count=len(filtered_results)):
             weights = self.rerank_agent.get_weights(question)
-            reranked_results = self.rerank_agent.rerank_results(
+            return self.rerank_agent.rerank_results(
                 question,
                 filtered_results,
                 weights
             )
+        
+    async def _aretrieve(self, question: str) -> List[Dict]:
+        """异步执行检索阶段，互不依赖的调用并发进行"""
+        # 1-2. 重写查询、检索策略和排序权重互不依赖，并发获取
+        with span("query.plan", self):
+            rewritten_queries, strategy, weights = await asyncio.gather(
+                self.rewrite_agent.arewrite_query(question),
+                self.retrieval_agent.aget_strategy(question),
+                self.rerank_agent.aget_weights(question)
+            )
+        
+        # 3. 并发执行检索
+        with span("query.search", self, queries=len(rewritten_queries)) as sp:
+            searches = await asyncio.gather(*[
+                self.database_agent.asearch_knowledge(query, top_k=strategy["params"]["k"])
+                for query in rewritten_queries
+            ])
+            all_results = [r for results in searches for r in results]
+            sp.set(count=len(all_results))
+        
+        # 4. 过滤结果
+        filtered_results = self.retrieval_agent.filter_results(
+            all_results,
+            min_score=strategy["params"]["min_relevance"]
+        )
+        
+        # 5. 重排序结果
+        with span("query.rerank", self, count=len(filtered_results)):
+            return await self.rerank_agent.arerank_results(
+                question,
+                filtered_results,
+                weights
+            )
+        
+    def query(self, question: str) -> str:
+        """查询知识库获取答案"""
+        try:
+            with priority(PRIORITY_INTERACTIVE), span("query", self):
+                reranked_results = self._retrieve(question)
+                
+                # 6. 生成最终答案
+                with span("query.answer", self):
+                    return self.chat(self._answer_messages(question, reranked_results))
+                
+        except Exception as e:
+            raise ValueError(f"查询失败: {str(e)}")
             
-            # 6. 生成最终答案
-            context = "\n\n".join([r["content"] for r in reranked_results[:3]])
-            
-            messages = [
-                SystemMessage(content=self.ROLE),
-                HumanMessage(content=f"""基于以下文档内容回答问题:
-
-文档内容:
-{context}
-
-问题:
-{question}""")
-            ]
+    async def aquery(self, question: str) -> str:
+        """异步查询知识库获取答案"""
+        try:
+            with priority(PRIORITY_INTERACTIVE), span("aquery", self):
+                reranked_results = await self._aretrieve(question)
+                
+                # 6. 生成最终答案
+                with span("query.answer", self):
+                    return await self.achat(self._answer_messages(question, reranked_results))
+                
+        except Exception as e:
+            raise ValueError(f"查询失败: {str(e)}")
             
-            return self.chat(messages)
+    def query_stream(self, question: str) -> Iterator[str]:
+        """流式查询知识库，检索完成后逐段返回最终答案"""
+        try:
+            with priority(PRIORITY_INTERACTIVE):
+                reranked_results = self._retrieve(question)
+                
+                # 6. 流式生成最终答案
+                yield from self.stream_chat(self._answer_messages(question, reranked_results))
+                
+        except Exception as e:
+            raise ValueError(f"查询失败: {str(e)}")
             
+    async def aquery_stream(self, question: str) -> AsyncIterator[str]:
+        """异步流式查询知识库"""
+        try:
+            with priority(PRIORITY_INTERACTIVE):
+                reranked_results = await self._aretrieve(question)
+                
+                # 6. 流式生成最终答案
+                async for chunk in self.astream_chat(self._answer_messages(question, reranked_results)):
+                    yield chunk
+                    
         except Exception as e:
             raise ValueError(f"查询失败: {str(e)}")
             
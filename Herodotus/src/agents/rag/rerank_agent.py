@@ -1,5 +1,6 @@
 from typing import List, Dict, Any
 from ..base_agent import BaseAgent
+from ..tracing import traced
 from langchain_core.messages import SystemMessage, HumanMessage
 import json
 
@@ -52,9 +53,9 @@ class RerankAgent(BaseAgent):
         response = self.chat(messages)
         return json.loads(response)
         
-    def evaluate_result(self, query: str, result: Dict) -> Dict:
-        """评估单个结果"""
-        messages = [
+    def _evaluate_result_messages(self, query: str, result: Dict) -> list:
+        """构建单个结果评估的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请评估该结果的各个方面：
 1. 相关性(0-1)
@@ -71,12 +72,19 @@ class RerankAgent(BaseAgent):
 {json.dumps(result, ensure_ascii=False, indent=2)}""")
         ]
         
-        response = self.chat(messages)
+    def evaluate_result(self, query: str, result: Dict) -> Dict:
+        """评估单个结果"""
+        response = self.chat(self._evaluate_result_messages(query, result))
         return json.loads(response)
         
-    def get_weights(self, query: str) -> Dict:
-        """获取排序权重"""
-        messages = [
+    async def aevaluate_result(self, query: str, result: Dict) -> Dict:
+        """异步评估单个结果"""
+        response = await self.achat(self._evaluate_result_messages(query, result))
+        return json.loads(response)
+        
+    def _weights_messages(self, query: str) -> list:
+        """构建排序权重的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请为该查询确定各个评估维度的权���：
 1. 相关性权重
@@ -89,7 +97,16 @@ class RerankAgent(BaseAgent):
             HumanMessage(content=query)
         ]
         
-        response = self.chat(messages)
+    @traced()
+    def get_weights(self, query: str) -> Dict:
+        """获取排序权重"""
+        response = self.chat(self._weights_messages(query))
+        return json.loads(response)
+        
+    @traced()
+    async def aget_weights(self, query: str) -> Dict:
+        """异步获取排序权重"""
+        response = await self.achat(self._weights_messages(query))
         return json.loads(response)
         
     def compare_results(self, query: str, result1: Dict, result2: Dict) -> int:
@@ -119,9 +136,9 @@ class RerankAgent(BaseAgent):
         except:
             return 0
             
-    def rerank_results(self, query: str, results: List[Dict], weights: Dict = None) -> List[Dict]:
-        """重排序结果"""
-        messages = [
+    def _rerank_messages(self, query: str, results: List[Dict], weights: Dict = None) -> list:
+        """构建重排序的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请重新排序以下结果列表。
 考虑：
@@ -141,7 +158,19 @@ class RerankAgent(BaseAgent):
 {json.dumps(weights, ensure_ascii=False, indent=2) if weights else "默认权重"}""")
         ]
         
-        response = self.chat(messages)
+    @traced()
+    def rerank_results(self, query: str, results: List[Dict], weights: Dict = None) -> List[Dict]:
+        """重排序结果"""
+        response = self.chat(self._rerank_messages(query, results, weights))
+        try:
+            return json.loads(response)
+        except:
+            return results
+            
+    @traced()
+    async def arerank_results(self, query: str, results: List[Dict], weights: Dict = None) -> List[Dict]:
+        """异步重排序结果"""
+        response = await self.achat(self._rerank_messages(query, results, weights))
         try:
             return json.loads(response)
         except:
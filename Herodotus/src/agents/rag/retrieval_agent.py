@@ -1,5 +1,6 @@
 from typing import List, Dict, Any
 from ..base_agent import BaseAgent
+from ..tracing import traced
 from langchain_core.messages import SystemMessage, HumanMessage
 import json
 
@@ -34,9 +35,9 @@ class RetrievalAgent(BaseAgent):
                         api_base=api_base,
                         streaming=streaming)
         
-    def analyze_query(self, query: str) -> Dict:
-        """分析查询意图"""
-        messages = [
+    def _analyze_query_messages(self, query: str) -> list:
+        """构建查询意图分析的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请分析以下查询的意图：
 1. 查询类型
@@ -48,12 +49,19 @@ class RetrievalAgent(BaseAgent):
             HumanMessage(content=query)
         ]
         
-        response = self.chat(messages)
+    def analyze_query(self, query: str) -> Dict:
+        """分析查询意图"""
+        response = self.chat(self._analyze_query_messages(query))
         return json.loads(response)
         
-    def get_strategy(self, query: str) -> Dict:
-        """获取检索策略"""
-        messages = [
+    async def aanalyze_query(self, query: str) -> Dict:
+        """异步分析查询意图"""
+        response = await self.achat(self._analyze_query_messages(query))
+        return json.loads(response)
+        
+    def _strategy_messages(self, query: str) -> list:
+        """构建检索策略的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请为以下查询设计检索策略：
 1. 检索方法
@@ -66,12 +74,21 @@ class RetrievalAgent(BaseAgent):
             HumanMessage(content=query)
         ]
         
-        response = self.chat(messages)
+    @traced()
+    def get_strategy(self, query: str) -> Dict:
+        """获取检索策略"""
+        response = self.chat(self._strategy_messages(query))
         return json.loads(response)
         
-    def evaluate_relevance(self, query: str, document: str) -> float:
-        """评估文档相关性"""
-        messages = [
+    @traced()
+    async def aget_strategy(self, query: str) -> Dict:
+        """异步获取检索策略"""
+        response = await self.achat(self._strategy_messages(query))
+        return json.loads(response)
+        
+    def _relevance_messages(self, query: str, document: str) -> list:
+        """构建相关性评估的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请评估文档与查询的相关性，返回0-1之间的分数。
 1表示完全相关，0表示完全不相关。
@@ -83,12 +100,21 @@ class RetrievalAgent(BaseAgent):
 {document}""")
         ]
         
-        response = self.chat(messages)
+    def _parse_score(self, response: str) -> float:
+        """解析0-1之间的分数"""
         try:
             return float(response.strip())
         except:
             return 0.0
             
+    def evaluate_relevance(self, query: str, document: str) -> float:
+        """评估文档相关性"""
+        return self._parse_score(self.chat(self._relevance_messages(query, document)))
+        
+    async def aevaluate_relevance(self, query: str, document: str) -> float:
+        """异步评估文档相关性"""
+        return self._parse_score(await self.achat(self._relevance_messages(query, document)))
+            
     def filter_results(self, results: List[Dict], min_score: float = 0.5) -> List[Dict]:
         """过滤检索结果"""
         filtered = []
@@ -97,9 +123,9 @@ class RetrievalAgent(BaseAgent):
                 filtered.append(result)
         return filtered
         
-    def expand_query(self, query: str) -> List[str]:
-        """扩展查询"""
-        messages = [
+    def _expand_query_messages(self, query: str) -> list:
+        """构建查询扩展的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请为以下查询生成多个相关的扩展查询。
 考虑：
@@ -112,7 +138,17 @@ class RetrievalAgent(BaseAgent):
             HumanMessage(content=query)
         ]
         
-        response = self.chat(messages)
+    def expand_query(self, query: str) -> List[str]:
+        """扩展查询"""
+        response = self.chat(self._expand_query_messages(query))
+        try:
+            return json.loads(response)
+        except:
+            return [query]
+            
+    async def aexpand_query(self, query: str) -> List[str]:
+        """异步扩展查询"""
+        response = await self.achat(self._expand_query_messages(query))
         try:
             return json.loads(response)
         except:
@@ -1,5 +1,6 @@
 from typing import List, Dict, Any
 from ..base_agent import BaseAgent
+from ..tracing import traced
 from langchain_core.messages import SystemMessage, HumanMessage
 
 class RewriteAgent(BaseAgent):
@@ -33,16 +34,16 @@ class RewriteAgent(BaseAgent):
                         api_base=api_base,
                         streaming=streaming)
         
-    def text_to_qa(self, text: str) -> List[Dict[str, str]]:
-        """将文本转换为问答对"""
-        messages = [
+    def _text_to_qa_messages(self, text: str) -> list:
+        """构建问答对生成的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请将以下文本转换为3-5个问答对。每个问答对应该涵盖文本的重要信息。"""),
             HumanMessage(content=text)
         ]
         
-        response = self.chat(messages)
-        # 处理响应，将其转换为结构化的问答对
+    def _parse_qa_pairs(self, response: str) -> List[Dict[str, str]]:
+        """将响应转换为结构化的问答对"""
         qa_pairs = []
         current_pair = {}
         
@@ -60,25 +61,62 @@ class RewriteAgent(BaseAgent):
             
         return qa_pairs
         
-    def generate_hyde(self, query: str) -> str:
-        """生成假设文档"""
-        messages = [
+    def text_to_qa(self, text: str) -> List[Dict[str, str]]:
+        """将文本转换为问答对"""
+        response = self.chat(self._text_to_qa_messages(text))
+        return self._parse_qa_pairs(response)
+        
+    @traced()
+    def texts_to_qa(self, texts: List[str]) -> List[List[Dict[str, str]]]:
+        """批量将文本转换为问答对，结果顺序与输入一致"""
+        responses = self.chat_many([self._text_to_qa_messages(text) for text in texts])
+        return [self._parse_qa_pairs(response) for response in responses]
+        
+    @staticmethod
+    def qa_texts(qa_pairs: List[Dict[str, str]]) -> List[str]:
+        """问答对展开为待索引的文本：先全部问题，再全部答案"""
+        return ([qa["question"] for qa in qa_pairs if "question" in qa] +
+                [qa["answer"] for qa in qa_pairs if "answer" in qa])
+        
+    async def atext_to_qa(self, text: str) -> List[Dict[str, str]]:
+        """异步将文本转换为问答对"""
+        response = await self.achat(self._text_to_qa_messages(text))
+        return self._parse_qa_pairs(response)
+        
+    def _hyde_messages(self, query: str) -> list:
+        """构建假设文档生成的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请生成一个假设的文档片段，该片段可能会完美回答以下查询。
 这个假设文档将用于提高检索效果。"""),
             HumanMessage(content=query)
         ]
         
-        return self.chat(messages)
+    def generate_hyde(self, query: str) -> str:
+        """生成假设文档"""
+        return self.chat(self._hyde_messages(query))
         
-    def rewrite_query(self, query: str) -> List[str]:
-        """改写查询"""
-        messages = [
+    async def agenerate_hyde(self, query: str) -> str:
+        """异步生成假设文档"""
+        return await self.achat(self._hyde_messages(query))
+        
+    def _rewrite_query_messages(self, query: str) -> list:
+        """构建查询改写的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
 请用3种不同的方式改写以下查询，以提高检索效果。
 改写时要保持原始意图，但使用不同的表达方式。"""),
             HumanMessage(content=query)
         ]
         
-        response = self.chat(messages)
-        return [q.strip() for q in response.split('\n') if q.strip()] 
\ No newline at end of file
+    @traced()
+    def rewrite_query(self, query: str) -> List[str]:
+        """改写查询"""
+        response = self.chat(self._rewrite_query_messages(query))
+        return [q.strip() for q in response.split('\n') if q.strip()]
+        
+    @traced()
+    async def arewrite_query(self, query: str) -> List[str]:
+        """异步改写查询"""
+        response = await self.achat(self._rewrite_query_messages(query))
+        return [q.strip() for q in response.split('\n') if q.strip()]
\ No newline at end of file
@@ -0,0 +1,63 @@
+from typing import List, Sequence, Tuple, Union
+import numpy as np
+
+Vectors = Union[np.ndarray, Sequence[Sequence[float]]]
+
+# 分块计算得分矩阵时每块的最大元素数（float32约64MB）
+MAX_BLOCK_ELEMENTS = 16 * 1024 * 1024
+
+
+def normalize_rows(vectors: Vectors) -> np.ndarray:
+    """转换为按行L2归一化的float32矩阵，零向量保持为零"""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def cosine_similarity(vec1: Sequence[float], vec2: Sequence[float]) -> float:
+    """两个向量的余弦相似度"""
+    a, b = normalize_rows([vec1, vec2])
+    return float(a @ b)
+
+
+def top_k_cosine(queries: Vectors, documents: Vectors, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """为每个查询找出余弦相似度最高的top_k个文档
+
+    文档矩阵只归一化一次，每块查询做一次矩阵乘法，再用argpartition取前k个后排序，
+    不对全部得分排序。
+
+    Args:
+        queries: 查询向量，形状 (q, d)
+        documents: 文档向量，形状 (n, d)
+        top_k: 每个查询返回的文档数
+
+    Returns:
+        (下标矩阵, 得分矩阵)，形状均为 (q, min(top_k, n))，按得分从高到低排列
+    """
+    k = min(top_k, len(documents))
+    if k <= 0:
+        return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+    queries = normalize_rows(queries)
+    documents = normalize_rows(documents)
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    scores = np.empty((len(queries), k), dtype=np.float32)
+
+    block = max(1, MAX_BLOCK_ELEMENTS // max(1, len(documents)))
+    for start in range(0, len(queries), block):
+        block_scores = queries[start:start + block] @ documents.T
+        if k < len(documents):
+            candidates = np.argpartition(block_scores, -k, axis=1)[:, -k:]
+        else:
+            candidates = np.broadcast_to(np.arange(len(documents)), block_scores.shape)
+        candidate_scores = np.take_along_axis(block_scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        indices[start:start + block] = np.take_along_axis(candidates, order, axis=1)
+        scores[start:start + block] = np.take_along_axis(candidate_scores, order, axis=1)
+    return indices, scores
+
+
+def rank(query: Sequence[float], documents: Vectors, top_k: int) -> List[Tuple[int, float]]:
+    """单个查询的top_k结果 [(文档下标, 得分)]"""
+    indices, scores = top_k_cosine([query], documents, top_k)
+    return [(int(i), float(s)) for i, s in zip(indices[0], scores[0])]
@@ -0,0 +1,126 @@
+from typing import List, Iterable, Iterator, Union
+import re
+
+CJK = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+CJK_EDGE = rf"{CJK}，。！？；：、“”‘’（）《》"
+
+# 规则在模块加载时编译一次
+CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b-\u200f\u2028\u2029\ufeff]")
+PARAGRAPH_BREAK = re.compile(r"\n[ \t\u3000]*\n\s*")
+INDENTED_LINE = re.compile(r"^(?:[ \t]{2,}|\u3000+)")
+HORIZONTAL_SPACE = re.compile(r"[ \t\u00a0\u3000]+")
+SPACE_BETWEEN_CJK = re.compile(rf"(?<=[{CJK_EDGE}]) (?=[{CJK_EDGE}])")
+JOINS_WITHOUT_SPACE = re.compile(rf"[{CJK_EDGE}]")
+HALF_PUNCT_AFTER_CJK = re.compile(rf"(?<=[{CJK}])\s*([,;:!?])")
+REPEATED_PUNCT = re.compile(r"([，。；：、])\1+")
+
+# 全角字母数字和空格转半角；中文语境的半角标点转全角
+FULL_TO_HALF = {code: code - 0xFEE0 for code in range(0xFF10, 0xFF1A)}
+FULL_TO_HALF.update({code: code - 0xFEE0 for code in range(0xFF21, 0xFF3B)})
+FULL_TO_HALF.update({code: code - 0xFEE0 for code in range(0xFF41, 0xFF5B)})
+HALF_TO_FULL_PUNCT = {",": "，", ";": "；", ":": "：", "!": "！", "?": "？"}
+
+# 视为正常文本的字符：中日韩文字、字母数字、常用中英文标点和空白
+NORMAL_CHAR = re.compile(
+    rf"[{CJK}A-Za-z0-9\s，。！？；：、“”‘’（）《》「」『』…—·,.;:!?'\"()\[\]\-%/]"
+)
+
+
+class TextCleaner:
+    """基于规则的文本清洗引擎
+
+    处理控制字符、全角/半角、空白、段内硬换行的合并和标点统一，
+    以段落为单位流式处理，耗时与文本长度成线性关系。
+    noise_score给出段落的噪声程度，调用方可以只把噪声段落交给语言模型。
+    """
+
+    def __init__(self, max_paragraph_chars: int = 65536):
+        """初始化清洗引擎
+
+        Args:
+            max_paragraph_chars: 单个段落的最大字符数，没有空行的超长文本按行强制分段
+        """
+        self.max_paragraph_chars = max_paragraph_chars
+
+    def normalize(self, paragraph: str) -> str:
+        """清洗单个段落：合并硬换行并统一空白和标点"""
+        paragraph = CONTROL_CHARS.sub("", paragraph).translate(FULL_TO_HALF)
+        lines = [line.strip(" \t\u00a0\u3000") for line in paragraph.split("\n")]
+        joined = ""
+        for line in lines:
+            if not line:
+                continue
+            if not joined:
+                joined = line
+            elif joined.endswith("-") and line[:1].isalpha():
+                # 英文断词
+                joined = joined[:-1] + line
+            elif JOINS_WITHOUT_SPACE.match(joined[-1]) or JOINS_WITHOUT_SPACE.match(line[0]):
+                # 中文行之间不加空格
+                joined += line
+            else:
+                joined += " " + line
+        joined = HORIZONTAL_SPACE.sub(" ", joined)
+        joined = SPACE_BETWEEN_CJK.sub("", joined)
+        joined = HALF_PUNCT_AFTER_CJK.sub(lambda m: HALF_TO_FULL_PUNCT[m.group(1)], joined)
+        joined = REPEATED_PUNCT.sub(r"\1", joined)
+        return joined.strip()
+
+    def iter_paragraphs(self, source: Union[str, Iterable[str]]) -> Iterator[str]:
+        """逐段产出原始段落，source可以是字符串或文本块迭代器
+
+        段落以空行分隔；以两个以上空格或全角空格缩进的行也视为新段落的开始。
+        """
+        blocks = [source] if isinstance(source, str) else source
+        buffer = ""
+        pending_cr = ""
+        for block in blocks:
+            block = pending_cr + block
+            # \r\n可能跨块，末尾的\r留到下一块再处理
+            pending_cr = "\r" if block.endswith("\r") else ""
+            if pending_cr:
+                block = block[:-1]
+            buffer += block.replace("\r\n", "\n").replace("\r", "\n")
+
+            start = 0
+            for match in PARAGRAPH_BREAK.finditer(buffer):
+                if match.end() >= len(buffer):
+                    break
+                yield from self._split_indented(buffer[start:match.start()])
+                start = match.end()
+            buffer = buffer[start:]
+
+            if len(buffer) > self.max_paragraph_chars:
+                cut = buffer.rfind("\n", 0, self.max_paragraph_chars)
+                cut = cut if cut > 0 else self.max_paragraph_chars
+                yield from self._split_indented(buffer[:cut])
+                buffer = buffer[cut:]
+        buffer += "\n" if pending_cr else ""
+        if buffer.strip():
+            yield from self._split_indented(buffer)
+
+    def _split_indented(self, text: str) -> Iterator[str]:
+        """按缩进行拆分段落"""
+        current: List[str] = []
+        for line in text.split("\n"):
+            if current and INDENTED_LINE.match(line):
+                yield "\n".join(current)
+                current = []
+            current.append(line)
+        if current and "".join(current).strip():
+            yield "\n".join(current)
+
+    def noise_score(self, paragraph: str) -> float:
+        """估计段落的噪声程度，0表示干净，越大越可能是乱码或排版残留
+
+        统计异常字符（替换字符、罕见符号、残留控制字符）的比例，替换字符加重计分。
+        """
+        if not paragraph:
+            return 0.0
+        abnormal = len(paragraph) - len(NORMAL_CHAR.findall(paragraph))
+        replacement = paragraph.count("\ufffd")
+        return min(1.0, (abnormal + 2 * replacement) / len(paragraph))
+
+    def clean(self, text: str) -> str:
+        """完整清洗一段文本，段落之间以空行分隔"""
+        return "\n\n".join(p for p in (self.normalize(p) for p in self.iter_paragraphs(text)) if p)
@@ -0,0 +1,116 @@
+from typing import List, Iterable, Iterator, Optional, Union, Callable
+import re
+from ..rate_limiter import estimate_tokens
+
+# 句子边界：中英文句末标点（可跟随右引号/括号）、英文句点后接空白、段落空行；
+# 边界后的空白归入前一句，保留段落换行
+SENTENCE_BOUNDARY = re.compile(
+    r"(?:[。！？!?；;…]+[”’」』》）)\]\"']*"
+    r"|\.(?=\s)"
+    r"|\n\s*\n)\s*"
+)
+
+
+class TextSplitter:
+    """按令牌预算切分文本的本地分割器
+
+    先按句子边界（支持中文标点）切成句子，再把句子装入不超过chunk_tokens的片段，
+    相邻片段之间保留约overlap_tokens的重叠句子。超长句子按字符比例硬切。
+    不调用任何接口，结果只取决于输入和参数。
+    """
+
+    def __init__(self,
+                 chunk_tokens: int = 500,
+                 overlap_tokens: int = 50,
+                 model: Optional[str] = None,
+                 length_function: Optional[Callable[[str], int]] = None):
+        """初始化分割器
+
+        Args:
+            chunk_tokens: 每个片段的最大令牌数
+            overlap_tokens: 相邻片段的重叠令牌数
+            model: 用于选择tiktoken编码的模型名
+            length_function: 自定义长度函数，默认使用tiktoken（不可用时按字符估算）
+        """
+        if chunk_tokens <= 0:
+            raise ValueError("chunk_tokens必须大于0")
+        if overlap_tokens < 0 or overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens必须在0和chunk_tokens之间")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.length_function = length_function or (lambda text: estimate_tokens(text, model))
+
+    def _hard_split(self, sentence: str, tokens: int) -> List[tuple]:
+        """把超出预算的句子按字符比例切成若干段"""
+        parts = -(-tokens // self.chunk_tokens)
+        size = -(-len(sentence) // parts)
+        pieces = [sentence[i:i + size] for i in range(0, len(sentence), size)]
+        return [(piece, self.length_function(piece)) for piece in pieces]
+
+    def _measure(self, sentence: str) -> List[tuple]:
+        tokens = self.length_function(sentence)
+        if tokens > self.chunk_tokens:
+            return self._hard_split(sentence, tokens)
+        return [(sentence, tokens)]
+
+    def iter_sentences(self, source: Union[str, Iterable[str]]) -> Iterator[str]:
+        """逐句产出文本，source可以是字符串或按块读取的文本迭代器"""
+        blocks = [source] if isinstance(source, str) else source
+        # 缓冲区过长仍无边界时强制切出，避免无标点文本占满内存
+        max_buffer = self.chunk_tokens * 8
+        buffer = ""
+        for block in blocks:
+            buffer += block
+            start = 0
+            for match in SENTENCE_BOUNDARY.finditer(buffer):
+                # 位于缓冲区末尾的边界可能在下一块中延续（如引号、第二个换行）
+                if match.end() >= len(buffer):
+                    break
+                yield buffer[start:match.end()]
+                start = match.end()
+            buffer = buffer[start:]
+            if len(buffer) > max_buffer:
+                yield buffer
+                buffer = ""
+        if buffer:
+            yield buffer
+
+    def iter_chunks(self, source: Union[str, Iterable[str]]) -> Iterator[str]:
+        """逐个产出片段，适合流式处理大文件
+
+        Args:
+            source: 字符串或文本块迭代器
+        """
+        current: List[tuple] = []
+        current_tokens = 0
+        for sentence in self.iter_sentences(source):
+            if not sentence.strip():
+                continue
+            for piece, tokens in self._measure(sentence):
+                if current and current_tokens + tokens > self.chunk_tokens:
+                    chunk = "".join(p for p, _ in current).strip()
+                    if chunk:
+                        yield chunk
+                    current, current_tokens = self._overlap(current, tokens)
+                current.append((piece, tokens))
+                current_tokens += tokens
+        if current:
+            chunk = "".join(p for p, _ in current).strip()
+            if chunk:
+                yield chunk
+
+    def _overlap(self, sentences: List[tuple], incoming: int) -> tuple:
+        """从上一片段末尾取不超过重叠预算的句子作为下一片段的开头"""
+        kept: List[tuple] = []
+        total = 0
+        budget = min(self.overlap_tokens, self.chunk_tokens - incoming)
+        for piece, tokens in reversed(sentences):
+            if total + tokens > budget:
+                break
+            kept.insert(0, (piece, tokens))
+            total += tokens
+        return kept, total
+
+    def split_text(self, text: str) -> List[str]:
+        """切分整段文本，返回片段列表"""
+        return list(self.iter_chunks(text))
@@ -0,0 +1,95 @@
+from typing import Optional, TYPE_CHECKING
+import math
+import os
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# flat：float32原始向量；float16：半精度标量量化；int8：8位标量量化（需训练）；
+# pq：倒排+乘积量化（需训练），适合千万级向量。faiss和numpy在创建索引时才导入
+STORAGE_MODES = ("flat", "float16", "int8", "pq")
+
+
+def needs_training(mode: str) -> bool:
+    """该存储方式是否需要先用样本训练量化器"""
+    return mode in ("int8", "pq")
+
+
+def pq_subquantizers(dim: int, m: Optional[int] = None) -> int:
+    """乘积量化的子空间数，取不超过期望值的dim的约数；默认每16维一个字节"""
+    m = m or int(os.getenv("PQ_SUBQUANTIZERS", "0")) or max(1, dim // 16)
+    m = min(m, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def pq_nlist(count: int) -> int:
+    """倒排列表数，约为样本数平方根的4倍，保证每个列表至少有约39个训练样本"""
+    nlist = int(os.getenv("PQ_NLIST", "0")) or int(4 * math.sqrt(count))
+    return max(1, min(nlist, count // 39))
+
+
+def create_index(mode: str, dim: int, training: Optional["np.ndarray"] = None):
+    """创建FAISS索引，需要训练的方式用training样本训练后返回
+
+    Args:
+        mode: 存储方式，见STORAGE_MODES
+        dim: 向量维度
+        training: 训练样本，形状 (n, dim)
+    """
+    import faiss
+    import numpy as np
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"存储方式必须是{'/'.join(STORAGE_MODES)}之一")
+    if mode == "flat":
+        return faiss.IndexFlatL2(dim)
+    if mode == "float16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    if training is None or len(training) == 0:
+        raise ValueError(f"{mode}存储需要训练样本")
+
+    training = np.ascontiguousarray(training, dtype=np.float32)
+    if mode == "int8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, pq_nlist(len(training)), pq_subquantizers(dim), 8)
+        index.nprobe = int(os.getenv("PQ_NPROBE", "16"))
+    index.train(training)
+    return index
+
+
+def training_sample(vectors, max_training: Optional[int] = None) -> "np.ndarray":
+    """无放回抽取至多max_training个训练样本，vectors可以是向量列表或数组，只转换抽中的行"""
+    import numpy as np
+    max_training = max_training or int(os.getenv("VECTOR_TRAIN_SAMPLES", "100000"))
+    if len(vectors) <= max_training:
+        return np.asarray(vectors, dtype=np.float32)
+    sample = np.sort(np.random.default_rng(0).choice(len(vectors), max_training, replace=False))
+    if isinstance(vectors, np.ndarray):
+        return vectors[sample]
+    return np.asarray([vectors[i] for i in sample], dtype=np.float32)
+
+
+def convert_index(index, mode: str, max_training: Optional[int] = None):
+    """把平面索引中的全部向量按原顺序转存到指定方式的索引"""
+    vectors = index.reconstruct_n(0, index.ntotal)
+    converted = create_index(mode, index.d, training_sample(vectors, max_training))
+    converted.add(vectors)
+    return converted
+
+
+def is_ivf(index) -> bool:
+    """是否为倒排索引
+    
+    平面编码的索引删除向量后其余向量的位置前移，位置即标签；倒排索引删除后
+    其余标签不变，写入时也需要显式分配不重复的标签。
+    """
+    return hasattr(index, "invlists")
+
+
+def bytes_per_vector(index) -> float:
+    """每个向量在索引中占用的字节数：编码大小，倒排索引另加8字节的ID"""
+    size = float(getattr(index, "code_size", index.d * 4))
+    return size + 8 if is_ivf(index) else size
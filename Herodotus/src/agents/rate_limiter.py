@@ -0,0 +1,403 @@
+from typing import Optional, Dict, Any, List, Callable
+from contextlib import contextmanager
+from functools import lru_cache
+import os
+import time
+import bisect
+import random
+import asyncio
+import itertools
+import threading
+import contextvars
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 调度优先级，数值越小越先获得配额
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 10
+
+_current_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+
+@contextmanager
+def priority(level: int):
+    """在上下文内设置出站调用的优先级
+
+    例如交互式查询使用PRIORITY_INTERACTIVE，批量导入使用PRIORITY_BULK。
+    """
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+
+@lru_cache(maxsize=32)
+def _get_encoding(model: Optional[str]):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"无法加载tiktoken编码，改用字符数估算: {str(e)}")
+        return None
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """估算文本的令牌数"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 2)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_messages_tokens(messages: List[Any], model: Optional[str] = None) -> int:
+    """估算一组消息的提示令牌数，每条消息额外计入格式开销"""
+    total = 3
+    for message in messages:
+        content = getattr(message, "content", message)
+        total += 4 + estimate_tokens(content if isinstance(content, str) else str(content), model)
+    return total
+
+
+class TokenBucket:
+    """令牌桶，按每分钟速率匀速补充，rate<=0表示不限制"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """距离可以取出amount个令牌还需等待的秒数"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        # 超过桶容量的单次请求按满桶处理，避免永远等待
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        if not self.unlimited:
+            self.tokens -= min(amount, self.capacity)
+
+    def set_rate(self, rate_per_minute: float, now: float) -> None:
+        """修改速率和容量，已有令牌保留（不超过新容量），调整后排队的调用继续使用同一个桶"""
+        self._refill(now)
+        was_unlimited = self.unlimited
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity if was_unlimited else min(self.tokens, self.capacity)
+
+    def credit(self, amount: float, now: float) -> None:
+        """退回（amount为负时补扣）令牌，用于按实际用量结算预留"""
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Endpoint:
+    """单个端点/模型的配额与统计"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiters: List[tuple] = []
+        # 异步等待者：排队凭证 -> (事件循环, 事件)，配额变化时跨线程唤醒
+        self.async_waiters: Dict[tuple, tuple] = {}
+        self.granted = 0
+        self.granted_tokens = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.retries = 0
+        self.throttled = 0
+
+
+class RateLimiter:
+    """出站LLM流量调度器
+
+    每个端点/模型有独立的请求数和令牌数令牌桶；排队的调用按优先级取得配额，
+    同优先级按到达顺序。同步和异步调用共享同一套配额。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._endpoints: Dict[str, _Endpoint] = {}
+        self._limits: Dict[str, tuple] = {}
+        self._seq = itertools.count()
+
+    def configure(self, key: str, rpm: float = 0, tpm: float = 0) -> None:
+        """设置端点的每分钟请求数和令牌数上限，0表示不限制
+
+        已有端点原地调整令牌桶，排队中的调用和统计保留，并按新配额重新检查。
+        """
+        with self._cond:
+            self._limits[key] = (rpm, tpm)
+            endpoint = self._endpoints.get(key)
+            if endpoint is not None:
+                now = time.monotonic()
+                endpoint.requests.set_rate(rpm, now)
+                endpoint.tokens.set_rate(tpm, now)
+                self._notify(endpoint)
+
+    def _endpoint(self, key: str) -> _Endpoint:
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            if key in self._limits:
+                rpm, tpm = self._limits[key]
+            elif key.startswith("embedding|"):
+                rpm = float(os.getenv("EMBEDDING_RPM", "0"))
+                tpm = float(os.getenv("EMBEDDING_TPM", "0"))
+            else:
+                rpm = float(os.getenv("LLM_RPM", "0"))
+                tpm = float(os.getenv("LLM_TPM", "0"))
+            endpoint = _Endpoint(rpm, tpm)
+            self._endpoints[key] = endpoint
+        return endpoint
+
+    def _try_grant(self, endpoint: _Endpoint, ticket: tuple, tokens: int) -> Optional[float]:
+        """尝试为队首的调用发放配额
+
+        Returns:
+            0表示已发放，正数表示需要等待的秒数，None表示前面还有更高优先级的调用
+        """
+        if endpoint.waiters[0] != ticket:
+            return None
+        now = time.monotonic()
+        wait = max(endpoint.requests.wait_time(1, now), endpoint.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        endpoint.requests.consume(1)
+        endpoint.tokens.consume(tokens)
+        endpoint.waiters.pop(0)
+        endpoint.granted += 1
+        endpoint.granted_tokens += tokens
+        return 0.0
+
+    def _notify(self, endpoint: _Endpoint) -> None:
+        """唤醒同步和异步等待者重新检查配额，调用方持有锁"""
+        self._cond.notify_all()
+        for loop, event in endpoint.async_waiters.values():
+            loop.call_soon_threadsafe(event.set)
+
+    def _record_wait(self, endpoint: _Endpoint, waited: float) -> None:
+        endpoint.total_wait += waited
+        endpoint.max_wait = max(endpoint.max_wait, waited)
+
+    def acquire(self, key: str, tokens: int = 0, level: Optional[int] = None) -> float:
+        """阻塞直到获得一次调用的配额，返回等待时间"""
+        start = time.monotonic()
+        level = current_priority() if level is None else level
+        with self._cond:
+            endpoint = self._endpoint(key)
+            ticket = (level, next(self._seq))
+            bisect.insort(endpoint.waiters, ticket)
+            try:
+                while True:
+                    wait = self._try_grant(endpoint, ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(timeout=wait if wait is not None else 1.0)
+            except BaseException:
+                if ticket in endpoint.waiters:
+                    endpoint.waiters.remove(ticket)
+                raise
+            finally:
+                self._notify(endpoint)
+            waited = time.monotonic() - start
+            self._record_wait(endpoint, waited)
+        return waited
+
+    async def aacquire(self, key: str, tokens: int = 0, level: Optional[int] = None) -> float:
+        """异步等待直到获得一次调用的配额，返回等待时间
+
+        轮到自己但配额不足时按令牌桶算出的缺口时间等待；排在后面时等待
+        其他调用取得或释放配额时的唤醒，不做轮询。
+        """
+        start = time.monotonic()
+        level = current_priority() if level is None else level
+        event = asyncio.Event()
+        with self._lock:
+            endpoint = self._endpoint(key)
+            ticket = (level, next(self._seq))
+            bisect.insort(endpoint.waiters, ticket)
+            endpoint.async_waiters[ticket] = (asyncio.get_running_loop(), event)
+        try:
+            while True:
+                with self._cond:
+                    # 在锁内清除事件，检查之后的唤醒不会丢失
+                    event.clear()
+                    wait = self._try_grant(endpoint, ticket, tokens)
+                    if wait == 0:
+                        endpoint.async_waiters.pop(ticket, None)
+                        self._notify(endpoint)
+                        break
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                endpoint.async_waiters.pop(ticket, None)
+                if ticket in endpoint.waiters:
+                    endpoint.waiters.remove(ticket)
+                self._notify(endpoint)
+            raise
+        waited = time.monotonic() - start
+        with self._lock:
+            self._record_wait(endpoint, waited)
+        return waited
+
+    def reconcile(self, key: str, reserved: int, used: Optional[int]) -> None:
+        """调用完成后按实际用量结算预留的令牌
+
+        预留按提示令牌加max_tokens估算，实际生成通常少得多；多余部分退回令牌桶并唤醒等待者，
+        超出部分补扣。used为None（没有用量信息）时保持预留不变。
+        """
+        if used is None:
+            return
+        with self._cond:
+            endpoint = self._endpoint(key)
+            consumed = min(reserved, endpoint.tokens.capacity) if not endpoint.tokens.unlimited else reserved
+            endpoint.tokens.credit(consumed - used, time.monotonic())
+            endpoint.granted_tokens += used - reserved
+            self._notify(endpoint)
+
+    def record_retry(self, key: str, error: Exception) -> None:
+        """记录一次重试，429计入限流次数"""
+        with self._lock:
+            endpoint = self._endpoint(key)
+            endpoint.retries += 1
+            if _status_code(error) == 429 or type(error).__name__ == "RateLimitError":
+                endpoint.throttled += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各端点的队列深度和等待时间统计"""
+        with self._lock:
+            return {
+                key: {
+                    "queue_depth": len(e.waiters),
+                    "granted": e.granted,
+                    "granted_tokens": e.granted_tokens,
+                    "total_wait": e.total_wait,
+                    "avg_wait": e.total_wait / e.granted if e.granted else 0.0,
+                    "max_wait": e.max_wait,
+                    "retries": e.retries,
+                    "throttled": e.throttled
+                }
+                for key, e in self._endpoints.items()
+            }
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断错误是否值得重试（限流、超时、服务端错误）"""
+    return _status_code(error) in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def _backoff(attempt: int, error: Exception, base_delay: float, max_delay: float) -> float:
+    """带完全抖动的指数退避，优先遵循服务端的Retry-After"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return min(max_delay, float(retry_after)) + random.uniform(0, base_delay)
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def _max_retries(max_retries: Optional[int]) -> int:
+    return int(os.getenv("LLM_MAX_RETRIES", "3")) if max_retries is None else max_retries
+
+
+def call_with_retry(fn: Callable[[], Any],
+                    max_retries: Optional[int] = None,
+                    base_delay: float = 1.0,
+                    max_delay: float = 60.0,
+                    on_retry: Optional[Callable[[Exception], None]] = None) -> Any:
+    """调用fn，遇到可重试错误时按抖动退避重试"""
+    retries = _max_retries(max_retries)
+    for attempt in itertools.count():
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            delay = _backoff(attempt, e, base_delay, max_delay)
+            logger.warning(f"调用失败，{delay:.2f}秒后重试（第{attempt + 1}次）: {str(e)}")
+            time.sleep(delay)
+
+
+async def acall_with_retry(fn: Callable[[], Any],
+                           max_retries: Optional[int] = None,
+                           base_delay: float = 1.0,
+                           max_delay: float = 60.0,
+                           on_retry: Optional[Callable[[Exception], None]] = None) -> Any:
+    """异步版本的call_with_retry，fn返回可等待对象"""
+    retries = _max_retries(max_retries)
+    for attempt in itertools.count():
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            delay = _backoff(attempt, e, base_delay, max_delay)
+            logger.warning(f"调用失败，{delay:.2f}秒后重试（第{attempt + 1}次）: {str(e)}")
+            await asyncio.sleep(delay)
+
+
+def chat_key(api_base: str, model_name: Optional[str]) -> str:
+    return f"chat|{api_base}|{model_name}"
+
+
+def embedding_key(api_base: str, model_name: Optional[str]) -> str:
+    return f"embedding|{api_base}|{model_name}"
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程级调度器"""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
@@ -6,8 +6,8 @@ import json
 class ReasoningAgent(BaseAgent):
     """实现各种推理技巧的代理"""
     
-    def __init__(self, model_name: str = "gpt-3.5-turbo"):
-        super().__init__(model_name, streaming=False)
+    def __init__(self, model_name: str = "gpt-3.5-turbo", streaming: bool = False):
+        super().__init__(model_name, streaming=streaming)
         self.reasoning_techniques = {
             "zero_shot": False,
             "few_shot": False,
@@ -20,8 +20,8 @@ class ReasoningAgent(BaseAgent):
             "tot": False
         }
         
-    def process(self, task: str, context: str = "") -> str:
-        """处理任务,应用选定的推理技巧"""
+    def _process_messages(self, task: str, context: str = "") -> list:
+        """根据选定的推理技巧构建消息"""
         messages = []
         
         # 构建系统提示
@@ -53,10 +53,15 @@ class ReasoningAgent(BaseAgent):
             task_prompt += f"上下文: {context}\n"
         messages.append(HumanMessage(content=task_prompt))
         
-        # 获取响应
-        response = self.chat(messages)
+        return messages
+        
+    def process(self, task: str, context: str = "") -> str:
+        """处理任务,应用选定的推理技巧"""
+        return self.chat(self._process_messages(task, context))
         
-        return response
+    async def aprocess(self, task: str, context: str = "") -> str:
+        """异步处理任务,应用选定的推理技巧"""
+        return await self.achat(self._process_messages(task, context))
         
     def zero_shot_reasoning(self, task: str) -> str:
         """零样本推理"""
@@ -0,0 +1,244 @@
+from typing import Optional, Dict, Any, List
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir() -> str:
+    """获取Historian本地缓存目录"""
+    cache_dir = os.getenv("HISTORIAN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "historian"))
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def make_cache_key(model_name: Optional[str],
+                   params: Dict[str, Any],
+                   messages: List[Any],
+                   api_base: Optional[str] = None) -> str:
+    """根据接口地址、模型、采样参数和消息生成缓存键，不同接口（如模拟服务与真实服务）的响应互不共享"""
+    payload = {
+        "api_base": api_base,
+        "model": model_name,
+        "params": params,
+        "messages": [(getattr(m, "type", type(m).__name__), getattr(m, "content", m)) for m in messages]
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(ABC):
+    """缓存后端接口，自定义后端实现get/set/clear即可接入"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class MemoryCache(CacheBackend):
+    """内存LRU缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, created = item
+            if self.ttl is not None and time.time() - created > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache(CacheBackend):
+    """基于SQLite的磁盘缓存，按最近访问时间淘汰"""
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """删除过期条目，并把条目数压回上限以内"""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """分层响应缓存：先查内存LRU，再查磁盘，磁盘命中后回填内存"""
+
+    def __init__(self, tiers: List[CacheBackend]):
+        self.tiers = tiers
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits = [0] * len(tiers)
+
+    def get(self, key: str) -> Optional[str]:
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                logger.warning(f"读取缓存失败: {str(e)}")
+                continue
+            if value is not None:
+                for upper in self.tiers[:i]:
+                    upper.set(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.tier_hits[i] += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        for tier in self.tiers:
+            try:
+                tier.set(key, value)
+            except Exception as e:
+                logger.warning(f"写入缓存失败: {str(e)}")
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "tier_hits": {type(t).__name__: n for t, n in zip(self.tiers, self.tier_hits)}
+            }
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> ResponseCache:
+    """获取进程级默认缓存（内存LRU + SQLite），配置来自环境变量"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            ttl = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+            ttl = ttl if ttl > 0 else None
+            tiers: List[CacheBackend] = [
+                MemoryCache(max_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "1024")), ttl=ttl)
+            ]
+            try:
+                path = os.getenv("RESPONSE_CACHE_PATH", os.path.join(get_cache_dir(), "responses.sqlite3"))
+                tiers.append(SQLiteCache(
+                    path,
+                    max_entries=int(os.getenv("RESPONSE_CACHE_DISK_SIZE", "100000")),
+                    ttl=ttl
+                ))
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"无法创建磁盘缓存，仅使用内存缓存: {str(e)}")
+            _default_cache = ResponseCache(tiers)
+        return _default_cache
+
+
+def resolve_cache(temperature: float) -> Optional[ResponseCache]:
+    """根据RESPONSE_CACHE配置决定是否启用缓存
+
+    auto（默认）只缓存确定性调用（temperature为0），on总是缓存，off关闭缓存。
+    """
+    mode = os.getenv("RESPONSE_CACHE", "auto").lower()
+    if mode == "off":
+        return None
+    if mode == "on" or float(temperature) == 0.0:
+        return get_default_cache()
+    return None
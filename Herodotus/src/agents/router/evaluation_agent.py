@@ -46,9 +46,9 @@ class EvaluationAgent(BaseAgent):
         
     def evaluate_relevance(self, query: str, documents: List[str]) -> List[Dict]:
         """评估文档相关性"""
-        results = []
+        messages_list = []
         for doc in documents:
-            messages = [
+            messages_list.append([
                 SystemMessage(content=f"""{self.ROLE}
 请评估以下文档与查询的相关性。"""),
                 HumanMessage(content=f"""查询：
@@ -56,12 +56,10 @@ class EvaluationAgent(BaseAgent):
 
 文档内容：
 {doc}""")
-            ]
+            ])
             
-            response = self.chat(messages)
-            results.append(json.loads(response))
-            
-        return results
+        responses = self.chat_many(messages_list)
+        return [json.loads(response) for response in responses]
         
     def get_improvement_suggestions(self, content: str) -> List[str]:
         """获取改进建议"""
@@ -1,4 +1,5 @@
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Iterator, AsyncIterator
+import asyncio
 from ..base_agent import BaseAgent
 from langchain_core.messages import SystemMessage, HumanMessage
 import json
@@ -16,8 +17,8 @@ class RouterAgent(BaseAgent):
     
     请确保合理分配任务并有效整合结果。"""
     
-    def __init__(self, model_name: Optional[str] = None):
-        super().__init__(model_name, streaming=False)
+    def __init__(self, model_name: Optional[str] = None, streaming: bool = False):
+        super().__init__(model_name, streaming=streaming)
         self.registered_agents = {}
         
     def register_agents(self, agents: Dict[str, BaseAgent]) -> None:
@@ -28,16 +29,9 @@ class RouterAgent(BaseAgent):
         """
         self.registered_agents = {k: v for k, v in agents.items() if v is not None}
         
-    def analyze_task(self, task: str) -> Dict:
-        """分析任务，确定需要使用的代理
-        
-        Args:
-            task: 任务描述
-            
-        Returns:
-            包含代理使用计划的字典
-        """
-        messages = [
+    def _analyze_task_messages(self, task: str) -> list:
+        """构建任务分析的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
             
             可用的代理类型：
@@ -54,7 +48,21 @@ class RouterAgent(BaseAgent):
             HumanMessage(content=task)
         ]
         
-        response = self.chat(messages)
+    def analyze_task(self, task: str) -> Dict:
+        """分析任务，确定需要使用的代理
+        
+        Args:
+            task: 任务描述
+            
+        Returns:
+            包含代理使用计划的字典
+        """
+        response = self.chat(self._analyze_task_messages(task))
+        return json.loads(response)
+        
+    async def aanalyze_task(self, task: str) -> Dict:
+        """异步分析任务，确定需要使用的代理"""
+        response = await self.achat(self._analyze_task_messages(task))
         return json.loads(response)
         
     def process(self, task: str, context: str = "") -> str:
@@ -97,17 +105,106 @@ class RouterAgent(BaseAgent):
         # 整合多个代理的结果
         return self.combine_results([r["result"] for r in results])
         
-    def evaluate_results(self, task: str, results: List[Dict]) -> Dict:
-        """评估处理结果
+    def process_stream(self, task: str, context: str = "") -> Iterator[str]:
+        """流式处理任务，前面的代理正常执行，最后一个阶段流式输出
         
-        Args:
-            task: 原始任务
-            results: 处理结果列表
+        计划只调用一个代理时流式输出该代理的结果，否则流式输出结果整合。
+        """
+        plan = self.analyze_task(task)
+        
+        if not self.registered_agents:
+            yield "错误：没有注册任何代理。"
+            return
             
-        Returns:
-            评估报告
+        steps = [step for step in plan.get("steps", []) if step.get("agent") in self.registered_agents]
+        
+        if len(steps) == 1:
+            agent = self.registered_agents[steps[0]["agent"]]
+            yield from agent.process_stream(steps[0].get("task", task), context)
+            return
+            
+        results = []
+        current_context = context
+        for step in steps:
+            result = self.registered_agents[step["agent"]].process(step.get("task", task), current_context)
+            results.append(result)
+            current_context = result
+            
+        yield from self.stream_chat(self._combine_messages(results))
+        
+    async def aprocess(self, task: str, context: str = "") -> str:
+        """异步处理任务，协调多个代理
+        
+        代理按计划顺序调用，每一步的结果作为下一步的上下文；
+        没有异步接口的代理在线程中执行，不阻塞事件循环。
         """
-        messages = [
+        plan = await self.aanalyze_task(task)
+        
+        if not self.registered_agents:
+            return "错误：没有注册任何代理。"
+            
+        results = []
+        current_context = context
+        
+        for step in plan.get("steps", []):
+            agent_type = step.get("agent")
+            if agent_type in self.registered_agents:
+                agent = self.registered_agents[agent_type]
+                step_task = step.get("task", task)
+                if hasattr(agent, "aprocess"):
+                    result = await agent.aprocess(step_task, current_context)
+                else:
+                    result = await asyncio.to_thread(agent.process, step_task, current_context)
+                results.append({
+                    "agent": agent_type,
+                    "task": step_task,
+                    "result": result
+                })
+                current_context = result
+        
+        if len(results) == 1:
+            return results[0]["result"]
+            
+        return await self.acombine_results([r["result"] for r in results])
+        
+    async def aprocess_stream(self, task: str, context: str = "") -> AsyncIterator[str]:
+        """process_stream的异步版本，按计划路由后流式输出最后一个阶段"""
+        plan = await self.aanalyze_task(task)
+        
+        if not self.registered_agents:
+            yield "错误：没有注册任何代理。"
+            return
+            
+        steps = [step for step in plan.get("steps", []) if step.get("agent") in self.registered_agents]
+        
+        if len(steps) == 1:
+            agent = self.registered_agents[steps[0]["agent"]]
+            step_task = steps[0].get("task", task)
+            if hasattr(agent, "aprocess_stream"):
+                async for chunk in agent.aprocess_stream(step_task, context):
+                    yield chunk
+            else:
+                yield await asyncio.to_thread(agent.process, step_task, context)
+            return
+            
+        results = []
+        current_context = context
+        for step in steps:
+            agent = self.registered_agents[step["agent"]]
+            step_task = step.get("task", task)
+            if hasattr(agent, "aprocess"):
+                result = await agent.aprocess(step_task, current_context)
+            else:
+                result = await asyncio.to_thread(agent.process, step_task, current_context)
+            results.append(result)
+            current_context = result
+            
+        async for chunk in self.astream_chat(self._combine_messages(results)):
+            yield chunk
+        
+    def _evaluate_results_messages(self, task: str, results: List[Dict]) -> list:
+        """构建结果评估的消息"""
+        return [
             SystemMessage(content=f"""{self.ROLE}
             
             请评估以下处理结果：
@@ -123,5 +220,20 @@ class RouterAgent(BaseAgent):
             {json.dumps(results, ensure_ascii=False, indent=2)}""")
         ]
         
-        response = self.chat(messages)
+    def evaluate_results(self, task: str, results: List[Dict]) -> Dict:
+        """评估处理结果
+        
+        Args:
+            task: 原始任务
+            results: 处理结果列表
+            
+        Returns:
+            评估报告
+        """
+        response = self.chat(self._evaluate_results_messages(task, results))
+        return json.loads(response)
+        
+    async def aevaluate_results(self, task: str, results: List[Dict]) -> Dict:
+        """异步评估处理结果"""
+        response = await self.achat(self._evaluate_results_messages(task, results))
         return json.loads(response) 
\ No newline at end of file
@@ -1,7 +1,8 @@
 from typing import List, Dict, Any, Callable
+import asyncio
+import inspect
 from ..base_agent import BaseAgent
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain_community.tools import Tool
 import json
 
 class ToolAgent(BaseAgent):
@@ -38,8 +39,8 @@ class ToolAgent(BaseAgent):
             "description": description
         }
         
-    def execute(self, task: str) -> str:
-        """执行任务"""
+    def _execute_messages(self, task: str) -> list:
+        """构建工具选择的消息"""
         if not self.tools:
             raise ValueError("请先添加工具!")
             
@@ -50,28 +51,50 @@ class ToolAgent(BaseAgent):
         ])
         
         # 构建提示
-        messages = [
+        return [
             SystemMessage(content=self.ROLE.format(available_tools=tools_desc)),
             HumanMessage(content=task)
         ]
         
-        # 获取模型决策
-        response = self.chat(messages)
+    def _parse_decision(self, response: str):
+        """解析模型决策，返回工具函数和参数"""
         try:
             decision = json.loads(response)
             tool_name = decision["tool"]
             parameters = decision["parameters"]
-            
-            if tool_name not in self.tools:
-                raise ValueError(f"未知的工具: {tool_name}")
-                
-            # 执行工具
-            result = self.tools[tool_name]["func"](**parameters)
-            return str(result)
-            
         except json.JSONDecodeError:
             raise ValueError("工具代理返回了无效的JSON格式")
         except KeyError as e:
             raise ValueError(f"工具代理返回的数据缺少必要字段: {str(e)}")
+            
+        if tool_name not in self.tools:
+            raise ValueError(f"未知的工具: {tool_name}")
+            
+        return self.tools[tool_name]["func"], parameters
+        
+    def execute(self, task: str) -> str:
+        """执行任务"""
+        # 获取模型决策
+        response = self.chat(self._execute_messages(task))
+        func, parameters = self._parse_decision(response)
+        
+        try:
+            # 执行工具
+            result = func(**parameters)
+            return str(result)
+        except Exception as e:
+            raise ValueError(f"工具执行出错: {str(e)}")
+            
+    async def aexecute(self, task: str) -> str:
+        """异步执行任务，协程工具直接等待，普通工具在线程中执行"""
+        response = await self.achat(self._execute_messages(task))
+        func, parameters = self._parse_decision(response)
+        
+        try:
+            if inspect.iscoroutinefunction(func):
+                result = await func(**parameters)
+            else:
+                result = await asyncio.to_thread(func, **parameters)
+            return str(result)
         except Exception as e:
-            raise ValueError(f"工具执行出错: {str(e)}") 
\ No newline at end of file
+            raise ValueError(f"工具执行出错: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,283 @@
+from typing import Optional, Dict, Any, List
+from collections import deque
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+import functools
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 未启用时span()直接返回共享的空span，调用方只多一次函数调用
+_enabled = False
+_exporters: List[Any] = []
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def add(self, key: str, amount: float = 1) -> None:
+        pass
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """一次被追踪的调用
+
+    记录代理类、方法、耗时以及令牌数、缓存命中、重试次数等属性。
+    用作上下文管理器时成为当前span，其内部创建的span以它为父节点。
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "agent", "method", "attrs",
+                 "start", "duration", "error", "_token", "_started")
+
+    def __init__(self, method: str, agent: Optional[str] = None, parent: Optional["Span"] = None, **attrs):
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.agent = agent
+        self.method = method
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._token = None
+        self._started = time.perf_counter()
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 生成器可能在另一个上下文中结束，此时原上下文已不再使用
+            pass
+        self.finish(exc)
+        return False
+
+    def set(self, **attrs) -> None:
+        """设置属性"""
+        self.attrs.update(attrs)
+
+    def add(self, key: str, amount: float = 1) -> None:
+        """累加计数类属性，如retries"""
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """结束span并交给导出器，重复调用无效"""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {str(error)}"
+        for exporter in list(_exporters):
+            try:
+                exporter.export(self)
+            except Exception as e:
+                logger.warning(f"导出追踪数据失败: {str(e)}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "agent": self.agent,
+            "method": self.method,
+            "start": self.start,
+            "latency_ms": (self.duration or 0.0) * 1000,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            **self.attrs
+        }
+
+
+class JsonlExporter:
+    """把每个结束的span写成一行JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Aggregator:
+    """进程内按(代理, 方法)汇总span"""
+
+    def __init__(self, sample_size: int = 1000):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._stats: Dict[tuple, Dict[str, Any]] = {}
+
+    def export(self, span: Span) -> None:
+        key = (span.agent, span.method)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = {
+                    "count": 0, "errors": 0, "total": 0.0, "max": 0.0,
+                    "prompt_tokens": 0, "completion_tokens": 0,
+                    "cache_hits": 0, "retries": 0,
+                    "latencies": deque(maxlen=self.sample_size)
+                }
+                self._stats[key] = stats
+            stats["count"] += 1
+            stats["errors"] += 1 if span.error else 0
+            stats["total"] += span.duration
+            stats["max"] = max(stats["max"], span.duration)
+            stats["prompt_tokens"] += span.attrs.get("prompt_tokens", 0) or 0
+            stats["completion_tokens"] += span.attrs.get("completion_tokens", 0) or 0
+            stats["cache_hits"] += 1 if span.attrs.get("cache_hit") else 0
+            stats["retries"] += span.attrs.get("retries", 0)
+            stats["latencies"].append(span.duration)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """返回按总耗时降序排列的汇总，延迟单位为毫秒"""
+        with self._lock:
+            rows = []
+            for (agent, method), stats in self._stats.items():
+                latencies = sorted(stats["latencies"])
+                rows.append({
+                    "agent": agent,
+                    "method": method,
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "total_ms": stats["total"] * 1000,
+                    "avg_ms": stats["total"] / stats["count"] * 1000,
+                    "p95_ms": latencies[int((len(latencies) - 1) * 0.95)] * 1000,
+                    "max_ms": stats["max"] * 1000,
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "completion_tokens": stats["completion_tokens"],
+                    "cache_hits": stats["cache_hits"],
+                    "retries": stats["retries"]
+                })
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+_aggregator = Aggregator()
+
+
+def enable(trace_file: Optional[str] = None) -> None:
+    """启用追踪，span汇总到进程内聚合器，指定trace_file时同时写入JSONL"""
+    global _enabled
+    if _aggregator not in _exporters:
+        _exporters.append(_aggregator)
+    if trace_file and not any(getattr(e, "path", None) == trace_file for e in _exporters):
+        _exporters.append(JsonlExporter(trace_file))
+    _enabled = True
+
+
+def disable() -> None:
+    """停用追踪并关闭文件导出器"""
+    global _enabled
+    _enabled = False
+    for exporter in list(_exporters):
+        if hasattr(exporter, "close"):
+            exporter.close()
+    _exporters.clear()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def add_exporter(exporter) -> None:
+    """注册自定义导出器，需实现export(span)"""
+    _exporters.append(exporter)
+
+
+def get_aggregator() -> Aggregator:
+    return _aggregator
+
+
+def current_span():
+    """当前span，未启用或不在span内时返回空span"""
+    if not _enabled:
+        return NOOP_SPAN
+    return _current_span.get() or NOOP_SPAN
+
+
+def span(method: str, agent: Any = None, **attrs):
+    """创建span，用作上下文管理器
+
+    Args:
+        method: 方法或阶段名称，如 chat、faiss.search、query.rerank
+        agent: 代理实例或类名
+        **attrs: 初始属性
+    """
+    if not _enabled:
+        return NOOP_SPAN
+    if agent is not None and not isinstance(agent, str):
+        agent = type(agent).__name__
+    return Span(method, agent, _current_span.get(), **attrs)
+
+
+def traced(method: Optional[str] = None):
+    """为代理方法创建span的装饰器，支持同步和异步方法"""
+    def decorator(func):
+        name = method or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                with span(name, self):
+                    return await func(self, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with span(name, self):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def usage_tokens(message) -> tuple:
+    """从模型响应中读取(提示令牌, 生成令牌)，没有用量信息时返回(None, None)"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return None, None
+
+
+# 通过环境变量启用：HISTORIAN_TRACE=1 只做进程内汇总，HISTORIAN_TRACE_FILE 同时写入JSONL
+if os.getenv("HISTORIAN_TRACE_FILE") or os.getenv("HISTORIAN_TRACE", "").lower() in ("1", "true", "on"):
+    enable(os.getenv("HISTORIAN_TRACE_FILE"))
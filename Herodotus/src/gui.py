@@ -667,12 +667,18 @@ class MainWindow(QMainWindow):
                 # If no agent is selected, use RAG agent by default
                 agents.append(RAGAgent(**common_params))
                 
-            # Process task
+            # Process task, streaming the last agent's output
             result = task
-            for agent in agents:
+            for agent in agents[:-1]:
                 result = agent.process(task, result)
                 
-            self.output_text.setText(result)
+            streamed = ""
+            for chunk in agents[-1].process_stream(task, result):
+                streamed += chunk
+                self.output_text.setText(streamed)
+                QApplication.processEvents()
+                
+            self.output_text.setText(streamed)
             self.logger.info("Task processing completed")
             self.status_bar.showMessage("Task completed", 5000)  # Show for 5 seconds
             
@@ -1,17 +1,9 @@
 import argparse
-import os
-from dotenv import load_dotenv
-from agents.rag.rag_agent import RAGAgent
-from agents.tools.tool_agent import ToolAgent
-from agents.memory.memory_agent import MemoryAgent
-from agents.router.router_agent import RouterAgent
-from agents.reasoning.reasoning_agent import ReasoningAgent
 
-def main():
-    # 加载环境变量
-    load_dotenv()
-    
-    # 创建参数解析器
+# 代理、LangChain和dotenv都在参数解析之后才导入，--help和参数错误可以立即返回
+
+def build_parser() -> argparse.ArgumentParser:
+    """创建参数解析器"""
     parser = argparse.ArgumentParser(description="Historian CLI工具")
     
     # 添加基本参数
@@ -38,19 +30,30 @@ def main():
     parser.add_argument("--reflection", action="store_true", help="使用反思推理")
     parser.add_argument("--tot", action="store_true", help="使用思维树推理")
     
-    args = parser.parse_args()
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    
+    # 加载环境变量
+    from dotenv import load_dotenv
+    load_dotenv()
     
     try:
-        # 初始化代理
+        # 初始化代理（结果由process_stream输出，关闭回调打印避免重复）
         agents = []
         if args.use_rag:
-            agents.append(RAGAgent(model_name=args.model))
+            from agents.rag.rag_agent import RAGAgent
+            agents.append(RAGAgent(model_name=args.model, streaming=False))
         if args.use_tool:
-            agents.append(ToolAgent(model_name=args.model))
+            from agents.tools.tool_agent import ToolAgent
+            agents.append(ToolAgent(model_name=args.model, streaming=False))
         if args.use_memory:
-            agents.append(MemoryAgent(model_name=args.model))
+            from agents.memory.memory_agent import MemoryAgent
+            agents.append(MemoryAgent(model_name=args.model, streaming=False))
         if args.use_router:
-            router = RouterAgent(model_name=args.model)
+            from agents.router.router_agent import RouterAgent
+            router = RouterAgent(model_name=args.model, streaming=False)
             if agents:
                 router.register_agents({
                     "rag": agents[0] if args.use_rag else None,
@@ -59,7 +62,8 @@ def main():
                 })
             agents.append(router)
         if args.use_reasoning:
-            reasoning_agent = ReasoningAgent(model_name=args.model)
+            from agents.reasoning.reasoning_agent import ReasoningAgent
+            reasoning_agent = ReasoningAgent(model_name=args.model, streaming=False)
             # 设置推理技巧
             reasoning_agent.reasoning_techniques.update({
                 "zero_shot": args.zero_shot,
@@ -76,15 +80,18 @@ def main():
             
         if not agents:
             # 如果没有选择任何代理，默认使用RAG代理
-            agents.append(RAGAgent(model_name=args.model))
+            from agents.rag.rag_agent import RAGAgent
+            agents.append(RAGAgent(model_name=args.model, streaming=False))
             
-        # 处理任务
+        # 处理任务，最后一个代理流式输出结果
         result = args.task
-        for agent in agents:
+        for agent in agents[:-1]:
             result = agent.process(args.task, result)
             
         print("\n结果:")
-        print(result)
+        for chunk in agents[-1].process_stream(args.task, result):
+            print(chunk, end="", flush=True)
+        print()
         
     except Exception as e:
         print(f"\n错误: {str(e)}")
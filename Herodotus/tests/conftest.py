@@ -0,0 +1,9 @@
+"""测试共用配置：把src和benchmarks加入导入路径"""
+import os
+import sys
+
+HERODOTUS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for name in ("src", "benchmarks"):
+    path = os.path.join(HERODOTUS_DIR, name)
+    if path not in sys.path:
+        sys.path.insert(0, path)
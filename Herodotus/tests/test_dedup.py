@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from agents.rag.dedup import NearDuplicateIndex  # noqa: E402
+
+ALPHABET = "史记本纪世家列传表书太史公曰司马迁汉武帝天人古今之变一家言"
+
+
+def _text(seed: int, length: int = 400) -> str:
+    rng = random.Random(seed)
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def _mutate(text: str, changes: int, seed: int) -> str:
+    rng = random.Random(seed)
+    chars = list(text)
+    for position in rng.sample(range(len(chars)), changes):
+        chars[position] = "X"
+    return "".join(chars)
+
+
+def _jaccard(index: NearDuplicateIndex, first: str, second: str) -> float:
+    a, b = set(index._shingles(first).tolist()), set(index._shingles(second).tolist())
+    return len(a & b) / len(a | b)
+
+
+def test_grouping_around_threshold():
+    """真实Jaccard明显高于阈值的归为一组，明显低于阈值的不归组"""
+    index = NearDuplicateIndex(threshold=0.8)
+    base = _text(1)
+    near = _mutate(base, 3, seed=2)
+    far = _mutate(base, 60, seed=3)
+    assert _jaccard(index, base, near) > 0.9
+    assert _jaccard(index, base, far) < 0.5
+    assert index.group([base, near, far, _text(4)]) == [[0, 1], [2], [3]]
+
+
+def test_signature_estimates_jaccard():
+    index = NearDuplicateIndex(threshold=0.8, num_perm=256)
+    base = _text(5)
+    for changes in (5, 20, 40):
+        other = _mutate(base, changes, seed=changes)
+        estimate = index.similarity(index.signature(base), index.signature(other))
+        assert estimate == pytest.approx(_jaccard(index, base, other), abs=0.1)
+
+
+def test_group_ignores_whitespace_and_case():
+    index = NearDuplicateIndex(threshold=0.9)
+    assert index.group(["Grand Historian records", "grand  historian\nrecords"]) == [[0, 1]]
+
+
+def test_group_resets_between_calls():
+    index = NearDuplicateIndex(threshold=0.8)
+    text = _text(6)
+    assert index.group([text]) == [[0]]
+    assert index.group([text]) == [[0]]
+
+
+def test_assign_matches_across_calls_and_discard():
+    index = NearDuplicateIndex(threshold=0.8)
+    base = _text(7)
+    assert index.assign([base], ["a"]) == [None]
+    assert index.assign([_mutate(base, 3, seed=8), _text(9)], ["b", "c"]) == ["a", None]
+    assert "a" in index and "c" in index and "b" not in index
+    index.discard(["a"])
+    assert index.assign([_mutate(base, 2, seed=10)], ["d"]) == [None]
+    assert len(index) == 2
+
+
+def test_invalid_threshold():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(threshold=0)
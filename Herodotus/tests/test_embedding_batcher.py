@@ -0,0 +1,38 @@
+from agents.embedding_batcher import EmbeddingBatcher, pack_by_tokens
+
+
+def test_pack_by_tokens_respects_limits():
+    counts = [30, 30, 30, 50, 10, 10, 10, 10]
+    packs = pack_by_tokens(counts, max_tokens=100, max_inputs=3)
+    assert packs == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    for pack in packs:
+        assert sum(counts[i] for i in pack) <= 100
+        assert len(pack) <= 3
+
+
+def test_pack_by_tokens_keeps_order_and_covers_all_inputs():
+    counts = [7, 1, 99, 3, 64, 64, 2]
+    packs = pack_by_tokens(counts, max_tokens=100, max_inputs=10)
+    assert [i for pack in packs for i in pack] == list(range(len(counts)))
+
+
+def test_oversized_input_gets_its_own_pack():
+    assert pack_by_tokens([10, 500, 10], max_tokens=100, max_inputs=10) == [[0], [1], [2]]
+
+
+def test_pack_by_tokens_empty():
+    assert pack_by_tokens([], max_tokens=100, max_inputs=10) == []
+
+
+def test_batcher_reassembles_results_in_input_order():
+    texts = [f"文本{i}" * (i % 5 + 1) for i in range(50)]
+    sent = []
+
+    def send(pack, tokens):
+        sent.append(len(pack))
+        return [[float(len(text))] for text in pack]
+
+    batcher = EmbeddingBatcher(max_tokens=40, max_inputs=8, max_concurrency=4)
+    assert batcher.run(texts, send) == [[float(len(text))] for text in texts]
+    assert list(batcher.iter_run(iter(texts), send)) == [[float(len(text))] for text in texts]
+    assert max(sent) <= 8
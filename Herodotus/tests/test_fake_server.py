@@ -0,0 +1,126 @@
+import base64
+import json
+import math
+import struct
+import urllib.error
+import urllib.request
+
+import pytest
+
+from fake_openai_server import FakeOpenAIServer, FakeServerConfig, count_tokens, truncate_tokens
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(config=FakeServerConfig(embedding_dim=64)) as server:
+        yield server
+
+
+def _post(server, path, payload):
+    request = urllib.request.Request(
+        server.base_url + path,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read().decode("utf-8")
+
+
+def _chat(server, content, **params):
+    return json.loads(_post(server, "/chat/completions", {
+        "model": "fake-model", "messages": [{"role": "user", "content": content}], **params
+    }))
+
+
+def test_truncate_tokens():
+    text = "史记abcdefgh本纪"
+    for limit in range(count_tokens(text) + 1):
+        prefix = truncate_tokens(text, limit)
+        assert text.startswith(prefix)
+        assert count_tokens(prefix) <= limit
+    assert truncate_tokens(text, 100) == text
+
+
+def test_chat_completion_reports_usage(server):
+    body = _chat(server, "太史公是谁？")
+    choice = body["choices"][0]
+    assert choice["finish_reason"] == "stop"
+    assert choice["message"]["content"]
+    assert body["usage"]["completion_tokens"] == count_tokens(choice["message"]["content"])
+    assert server.stats.to_dict()["chat_requests"] == 1
+
+
+def test_max_tokens_truncates_text_responses(server):
+    full = _chat(server, "太史公是谁？")["choices"][0]["message"]["content"]
+    assert count_tokens(full) > 3
+    choice = _chat(server, "太史公是谁？", max_tokens=3)["choices"][0]
+    assert choice["finish_reason"] == "length"
+    assert full.startswith(choice["message"]["content"])
+    assert count_tokens(choice["message"]["content"]) <= 3
+
+
+def test_json_responses_are_not_truncated(server):
+    body = _chat(server, "生成摘要和要点\n司马迁著史记。史记共一百三十篇。", max_tokens=1)
+    choice = body["choices"][0]
+    assert choice["finish_reason"] == "stop"
+    assert set(json.loads(choice["message"]["content"])) == {"summary", "key_points"}
+
+
+def test_streaming_matches_non_streaming(server):
+    full = _chat(server, "太史公是谁？")["choices"][0]["message"]["content"]
+    raw = _post(server, "/chat/completions", {
+        "model": "fake-model",
+        "messages": [{"role": "user", "content": "太史公是谁？"}],
+        "stream": True,
+        "stream_options": {"include_usage": True}
+    })
+    events = [line[len("data: "):] for line in raw.split("\n\n") if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+    assert content == full
+    assert chunks[-1]["usage"]["completion_tokens"] == count_tokens(full)
+
+
+def test_embeddings_are_deterministic_and_normalized(server):
+    payload = {"model": "fake-embedding", "input": ["史记", "史记", "汉书"]}
+    data = json.loads(_post(server, "/embeddings", payload))["data"]
+    vectors = [item["embedding"] for item in data]
+    assert [item["index"] for item in data] == [0, 1, 2]
+    assert len(vectors[0]) == 64
+    assert vectors[0] == vectors[1] != vectors[2]
+    assert math.isclose(sum(v * v for v in vectors[2]), 1.0, rel_tol=1e-9)
+
+    encoded = json.loads(_post(server, "/embeddings", {**payload, "encoding_format": "base64"}))["data"]
+    decoded = struct.unpack("<64f", base64.b64decode(encoded[0]["embedding"]))
+    assert decoded == pytest.approx(vectors[0], abs=1e-6)
+
+
+def test_injected_rate_limit():
+    with FakeOpenAIServer(config=FakeServerConfig(rate_limit_rate=1.0)) as server:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            _chat(server, "太史公是谁？")
+        assert error.value.code == 429
+        assert error.value.headers["Retry-After"] == "0.1"
+        assert server.stats.to_dict()["faults"] == {"rate_limit": 1}
+
+
+def test_agent_against_fake_server(server, monkeypatch, tmp_path):
+    """代理经过客户端池、调度器和嵌入装包访问模拟服务"""
+    pytest.importorskip("langchain_openai")
+    pytest.importorskip("numpy")
+    monkeypatch.setenv("RESPONSE_CACHE", "off")
+    monkeypatch.setenv("EMBEDDING_CACHE", "off")
+    monkeypatch.setenv("EMBEDDING_CHECK_CTX_LENGTH", "off")
+    monkeypatch.setenv("HISTORIAN_CACHE_DIR", str(tmp_path))
+    from agents.rag.rewrite_agent import RewriteAgent
+
+    agent = RewriteAgent(model_name="fake-model", api_key="fake", api_base=server.base_url, streaming=False)
+    qa_pairs = agent.text_to_qa("司马迁著史记。史记共一百三十篇。")
+    assert qa_pairs and all(pair["question"] and pair["answer"] for pair in qa_pairs)
+
+    texts = ["史记", "汉书", "史记"]
+    vectors = agent.embed_documents(texts)
+    assert len(vectors) == 3 and vectors[0] == vectors[2]
+    assert list(agent.embed_iter(iter(texts))) == vectors
+    assert server.stats.to_dict()["embedding_inputs"] == 4
@@ -0,0 +1,49 @@
+import mmap
+
+import pytest
+
+from agents.rag.file_reader import FileReader
+
+WINDOW = mmap.ALLOCATIONGRANULARITY
+
+
+def _write(tmp_path, data: bytes):
+    path = tmp_path / "doc.txt"
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("shift", [1, 2, 3])
+def test_multibyte_character_across_window_boundary(tmp_path, shift):
+    """多字节字符跨越窗口边界时不产生替换字符"""
+    text = "a" * (WINDOW - shift) + "史记😀" * 50 + "b" * 10
+    path = _write(tmp_path, text.encode("utf-8"))
+    reader = FileReader(window_size=WINDOW)
+    windows = list(reader.iter_text(path))
+    assert len(windows) > 1
+    assert "\ufffd" not in "".join(windows)
+    assert "".join(windows) == text
+
+
+def test_bom_is_stripped(tmp_path):
+    path = _write(tmp_path, "\ufeff司马迁".encode("utf-8"))
+    assert FileReader().read_text(path) == "司马迁"
+
+
+def test_invalid_bytes_are_replaced(tmp_path):
+    path = _write(tmp_path, b"ok\xffok")
+    assert FileReader().read_text(path) == "ok\ufffdok"
+
+
+def test_truncated_character_at_end_of_file(tmp_path):
+    path = _write(tmp_path, "史".encode("utf-8")[:2])
+    assert FileReader(window_size=WINDOW).read_text(path) == "\ufffd"
+
+
+def test_empty_file(tmp_path):
+    assert list(FileReader().iter_text(_write(tmp_path, b""))) == []
+
+
+def test_window_size_is_aligned_to_granularity():
+    assert FileReader(window_size=1).window_size == WINDOW
+    assert FileReader(window_size=WINDOW + 1).window_size == 2 * WINDOW
@@ -0,0 +1,77 @@
+import pytest
+
+from agents.rag.manifest import IngestManifest, hash_text
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.db"))
+    yield manifest
+    manifest.close()
+
+
+def _entry(chunk_hash, i=0):
+    return (f"{chunk_hash}:{i}", f"Q{i}", {"sources": []}, [0.5, -0.25])
+
+
+def test_shared_chunk_survives_until_last_file_is_removed(manifest):
+    manifest.put_chunk("a", "甲", [], [_entry("a")])
+    manifest.put_chunk("b", "乙", [], [_entry("b")])
+    manifest.set_file("/f1", "h1", ["a", "b"])
+    manifest.set_file("/f2", "h2", ["a"])
+
+    manifest.remove_file("/f1")
+    assert manifest.pop_orphans() == ["b:0"]
+    assert manifest.known_chunks(["a", "b"]) == {"a"}
+
+    manifest.remove_file("/f2")
+    assert manifest.pop_orphan_chunks() == (["a"], ["a:0"])
+    assert manifest.stats() == {"files": 0, "chunks": 0, "entries": 0}
+
+
+def test_changed_file_orphans_replaced_chunks(manifest):
+    manifest.put_chunk("a", "甲", [], [_entry("a")])
+    manifest.set_file("/f1", "h1", ["a"])
+    manifest.put_chunk("c", "丙", [], [_entry("c")])
+    manifest.set_file("/f1", "h1b", ["c"])
+    assert manifest.pop_orphans() == ["a:0"]
+    assert manifest.chunk_hashes("/f1") == ["c"]
+    assert manifest.file_hash("/f1") == "h1b"
+
+
+def test_duplicates_follow_their_representative(manifest):
+    """代表片段被删除时，依附的近重复片段一并删除，所在文件标记为待重新处理"""
+    manifest.put_chunk("a", "甲", [], [_entry("a")])
+    manifest.put_chunk("d", "甲'", [], [], duplicate_of="a")
+    manifest.set_file("/f1", "h1", ["a"])
+    manifest.set_file("/f2", "h2", ["d"])
+    assert manifest.representative("d") == "a"
+    assert [rows for rows in manifest.iter_representatives()] == [[("a", "甲")]]
+
+    manifest.remove_file("/f1")
+    assert manifest.pop_orphan_chunks() == (["a", "d"], ["a:0"])
+    assert manifest.stale_files() == ["/f2"]
+    assert manifest.known_chunks(["d"]) == set()
+
+
+def test_entries_roundtrip_and_metadata_update(manifest):
+    manifest.put_chunk("a", "甲", [{"question": "Q", "answer": "A"}], [_entry("a", 0), _entry("a", 1)])
+    assert manifest.get_qa("a") == [{"question": "Q", "answer": "A"}]
+    assert manifest.update_entry_metadata("a:1", {"analysis": {"topic": "史"}})
+    assert not manifest.update_entry_metadata("missing", {})
+    entries = [entry for batch in manifest.iter_entries(batch_size=1) for entry in batch]
+    assert [entry[0] for entry in entries] == ["a:0", "a:1"]
+    assert entries[1][2] == {"sources": [], "analysis": {"topic": "史"}}
+    assert entries[0][3] == pytest.approx([0.5, -0.25])
+
+
+def test_reopen_keeps_state(tmp_path):
+    path = str(tmp_path / "manifest.db")
+    manifest = IngestManifest(path)
+    manifest.put_chunk(hash_text("甲"), "甲", [], [])
+    manifest.set_file("/f1", "h1", [hash_text("甲")])
+    manifest.close()
+    reopened = IngestManifest(path)
+    assert reopened.file_hash("/f1") == "h1"
+    assert reopened.known_chunks([hash_text("甲")]) == {hash_text("甲")}
+    reopened.close()
@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from agents.rag.similarity import cosine_similarity, rank, top_k_cosine  # noqa: E402
+
+
+def _brute_force(queries, documents, k):
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    d = documents / np.linalg.norm(documents, axis=1, keepdims=True)
+    scores = q @ d.T
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return order, np.take_along_axis(scores, order, axis=1)
+
+
+@pytest.mark.parametrize("count, k", [(1, 5), (10, 3), (500, 10), (500, 500)])
+def test_top_k_matches_brute_force(count, k):
+    rng = np.random.default_rng(count)
+    documents = rng.standard_normal((count, 32)).astype(np.float32)
+    queries = rng.standard_normal((7, 32)).astype(np.float32)
+    indices, scores = top_k_cosine(queries, documents, k)
+    expected_indices, expected_scores = _brute_force(queries, documents, min(k, count))
+    assert indices.shape == expected_indices.shape
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+    # 得分相同的文档顺序可以不同，比较每行的下标集合
+    assert [set(row) for row in indices] == [set(row) for row in expected_indices]
+
+
+def test_top_k_with_no_documents():
+    indices, scores = top_k_cosine(np.ones((2, 4)), np.empty((0, 4)), 3)
+    assert indices.shape == (2, 0) and scores.shape == (2, 0)
+
+
+def test_rank_and_cosine_similarity():
+    documents = [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+    assert [i for i, _ in rank([1.0, 0.1], documents, 2)] == [0, 2]
+    assert cosine_similarity([1.0, 0.0], [2.0, 0.0]) == pytest.approx(1.0)
+    assert cosine_similarity([1.0, 0.0], [0.0, 3.0]) == pytest.approx(0.0)
@@ -0,0 +1,43 @@
+import pytest
+
+from agents.rag.text_splitter import TextSplitter
+
+TEXT = (
+    "史记是西汉史学家司马迁撰写的纪传体史书。它记载了上至上古传说中的黄帝时代，下至汉武帝太初四年间共三千多年的历史！"
+    "全书包括十二本纪、三十世家、七十列传、十表、八书，共一百三十篇。\n\n"
+    "“究天人之际，通古今之变，成一家之言。”这是司马迁的自述？"
+    "The Records of the Grand Historian is a monumental history of China. It was finished around 94 BC. "
+    "Its influence on later histories was profound.\n\n"
+    "后世把它列为二十四史之首；鲁迅称其为史家之绝唱，无韵之离骚……\n\n"
+) * 6
+
+
+def _blocks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 64, 1000])
+def test_streaming_matches_whole_string(block_size):
+    """按任意大小分块输入的结果与整段输入一致"""
+    splitter = TextSplitter(chunk_tokens=60, overlap_tokens=10, length_function=len)
+    assert list(splitter.iter_chunks(_blocks(TEXT, block_size))) == splitter.split_text(TEXT)
+
+
+def test_chunks_respect_token_budget():
+    splitter = TextSplitter(chunk_tokens=40, overlap_tokens=8, length_function=len)
+    chunks = splitter.split_text(TEXT)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 40 for chunk in chunks)
+
+
+def test_long_sentence_is_hard_split():
+    splitter = TextSplitter(chunk_tokens=20, overlap_tokens=0, length_function=len)
+    chunks = splitter.split_text("无" * 95)
+    assert "".join(chunks) == "无" * 95
+    assert all(len(chunk) <= 20 for chunk in chunks)
+
+
+@pytest.mark.parametrize("chunk_tokens, overlap_tokens", [(0, 0), (10, 10), (10, -1)])
+def test_invalid_parameters(chunk_tokens, overlap_tokens):
+    with pytest.raises(ValueError):
+        TextSplitter(chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
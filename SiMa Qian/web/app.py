@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from dotenv import load_dotenv
 import os
 import sys
@@ -29,144 +29,162 @@ app = Flask(__name__)
 workflows = []
 custom_models = {}
 
+# 流式输出中途出错时的标记，与static/js/main.js中的同名常量保持一致
+STREAM_ERROR_MARKER = "\u0000STREAM_ERROR\u0000"
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/process', methods=['POST'])
-def process():
-    try:
-        data = request.json
-        task = data.get('task')
-        settings = data.get('settings', {})
+def build_agents(settings):
+    """根据前端设置创建代理链并应用LLM参数"""
+    # 初始化代理
+    agents = []
+    
+    # LLM参数
+    llm_params = {
+        "model_name": settings.get('model', 'gpt-3.5-turbo'),
+        "api_key": settings.get('api_key'),
+        "api_base": settings.get('base_url', 'https://api.openai.com/v1'),
+        "streaming": True,
+        "temperature": settings.get('temperature', 0.7),
+        "max_tokens": settings.get('max_tokens', 2000),
+        "top_p": settings.get('top_p', 1.0),
+        "presence_penalty": settings.get('presence_penalty', 0.0),
+        "frequency_penalty": settings.get('frequency_penalty', 0.0)
+    }
+    
+    # RAG Agent
+    if settings.get('use_rag'):
+        rag_params = {
+            "model_name": llm_params["model_name"],
+            "api_key": llm_params["api_key"],
+            "api_base": llm_params["api_base"],
+            "streaming": llm_params["streaming"],
+            "use_embedding": settings.get('use_embedding', False),
+            "use_database": settings.get('use_database', False),
+            "use_retrieval": settings.get('use_retrieval', False),
+            "use_rerank": settings.get('use_rerank', False)
+        }
+        agents.append(RAGAgent(**rag_params))
         
-        if not task:
-            return jsonify({"status": "error", "message": "任务不能为空"}), 400
-            
-        # 验证API密钥
-        api_key = settings.get('api_key')
-        if not api_key:
-            return jsonify({"status": "error", "message": "API密钥不能为空"}), 400
-
-        # 设置环境变量
-        os.environ["OPENAI_API_KEY"] = api_key
-        if settings.get('base_url'):
-            os.environ["OPENAI_API_BASE"] = settings.get('base_url')
-            
-        # 初始化代理
-        agents = []
+    # Tool Agent
+    if settings.get('use_tool'):
+        tool_params = {
+            "model_name": llm_params["model_name"],
+            "streaming": llm_params["streaming"]
+        }
+        tool_agent = ToolAgent(**tool_params)
+        # 设置工具代理的特定参数
+        tool_agent.use_code_tool = settings.get('use_code_tool', False)
+        tool_agent.use_shell_tool = settings.get('use_shell_tool', False)
+        tool_agent.use_web_tool = settings.get('use_web_tool', False)
+        tool_agent.use_file_tool = settings.get('use_file_tool', False)
+        agents.append(tool_agent)
         
-        # LLM参数
-        llm_params = {
-            "model_name": settings.get('model', 'gpt-3.5-turbo'),
-            "api_key": api_key,
-            "api_base": settings.get('base_url', 'https://api.openai.com/v1'),
-            "streaming": True,
-            "temperature": settings.get('temperature', 0.7),
-            "max_tokens": settings.get('max_tokens', 2000),
-            "top_p": settings.get('top_p', 1.0),
-            "presence_penalty": settings.get('presence_penalty', 0.0),
-            "frequency_penalty": settings.get('frequency_penalty', 0.0)
+    # Memory Agent
+    if settings.get('use_memory'):
+        memory_params = {
+            "model_name": llm_params["model_name"]
         }
+        memory_agent = MemoryAgent(**memory_params)
+        # 设置记忆代理的特定参数
+        memory_agent.use_conversation_memory = settings.get('use_conversation_memory', False)
+        memory_agent.use_summary_memory = settings.get('use_summary_memory', False)
+        memory_agent.use_vector_memory = settings.get('use_vector_memory', False)
+        agents.append(memory_agent)
         
-        # RAG Agent
-        if settings.get('use_rag'):
-            rag_params = {
-                "model_name": llm_params["model_name"],
-                "api_key": llm_params["api_key"],
-                "api_base": llm_params["api_base"],
-                "streaming": llm_params["streaming"],
-                "use_embedding": settings.get('use_embedding', False),
-                "use_database": settings.get('use_database', False),
-                "use_retrieval": settings.get('use_retrieval', False),
-                "use_rerank": settings.get('use_rerank', False)
-            }
-            agents.append(RAGAgent(**rag_params))
-            
-        # Tool Agent
-        if settings.get('use_tool'):
-            tool_params = {
-                "model_name": llm_params["model_name"],
-                "streaming": llm_params["streaming"]
-            }
-            tool_agent = ToolAgent(**tool_params)
-            # 设置工具代理的特定参数
-            tool_agent.use_code_tool = settings.get('use_code_tool', False)
-            tool_agent.use_shell_tool = settings.get('use_shell_tool', False)
-            tool_agent.use_web_tool = settings.get('use_web_tool', False)
-            tool_agent.use_file_tool = settings.get('use_file_tool', False)
-            agents.append(tool_agent)
-            
-        # Memory Agent
-        if settings.get('use_memory'):
-            memory_params = {
-                "model_name": llm_params["model_name"]
-            }
-            memory_agent = MemoryAgent(**memory_params)
-            # 设置记忆代理的特定参数
-            memory_agent.use_conversation_memory = settings.get('use_conversation_memory', False)
-            memory_agent.use_summary_memory = settings.get('use_summary_memory', False)
-            memory_agent.use_vector_memory = settings.get('use_vector_memory', False)
-            agents.append(memory_agent)
-            
-        # Router Agent
-        if settings.get('use_router'):
-            router_params = {
-                "model_name": llm_params["model_name"]
-            }
-            router = RouterAgent(**router_params)
-            # 设置路由代理的特定参数
-            router.use_output_agent = settings.get('use_output_agent', False)
-            router.use_evaluation_agent = settings.get('use_evaluation_agent', False)
-            router.use_prompt_agent = settings.get('use_prompt_agent', False)
-            if agents:
-                router.register_agents({
-                    "rag": agents[0] if settings.get('use_rag') else None,
-                    "tool": agents[1] if settings.get('use_tool') else None,
-                    "memory": agents[2] if settings.get('use_memory') else None
-                })
-            agents.append(router)
-            
-        # Reasoning Agent
-        if settings.get('use_reasoning'):
-            reasoning_params = {
-                "model_name": llm_params["model_name"]
-            }
-            reasoning_agent = ReasoningAgent(**reasoning_params)
-            # 设置推理技巧
-            reasoning_agent.reasoning_techniques = {
-                k: settings.get(k, False) for k in [
-                    'zero_shot', 'few_shot', 'one_shot', 'cot',
-                    'least_to_most', 'self_consistency', 'react',
-                    'reflection', 'tot'
-                ]
-            }
-            agents.append(reasoning_agent)
+    # Router Agent
+    if settings.get('use_router'):
+        router_params = {
+            "model_name": llm_params["model_name"]
+        }
+        router = RouterAgent(**router_params)
+        # 设置路由代理的特定参数
+        router.use_output_agent = settings.get('use_output_agent', False)
+        router.use_evaluation_agent = settings.get('use_evaluation_agent', False)
+        router.use_prompt_agent = settings.get('use_prompt_agent', False)
+        if agents:
+            router.register_agents({
+                "rag": agents[0] if settings.get('use_rag') else None,
+                "tool": agents[1] if settings.get('use_tool') else None,
+                "memory": agents[2] if settings.get('use_memory') else None
+            })
+        agents.append(router)
         
-        if not agents:
-            default_params = {
-                "model_name": llm_params["model_name"],
-                "api_key": llm_params["api_key"],
-                "api_base": llm_params["api_base"],
-                "streaming": llm_params["streaming"]
-            }
-            agents.append(RAGAgent(**default_params))
+    # Reasoning Agent
+    if settings.get('use_reasoning'):
+        reasoning_params = {
+            "model_name": llm_params["model_name"]
+        }
+        reasoning_agent = ReasoningAgent(**reasoning_params)
+        # 设置推理技巧
+        reasoning_agent.reasoning_techniques = {
+            k: settings.get(k, False) for k in [
+                'zero_shot', 'few_shot', 'one_shot', 'cot',
+                'least_to_most', 'self_consistency', 'react',
+                'reflection', 'tot'
+            ]
+        }
+        agents.append(reasoning_agent)
+    
+    if not agents:
+        default_params = {
+            "model_name": llm_params["model_name"],
+            "api_key": llm_params["api_key"],
+            "api_base": llm_params["api_base"],
+            "streaming": llm_params["streaming"]
+        }
+        agents.append(RAGAgent(**default_params))
+    
+    # 设置LLM参数
+    for agent in agents:
+        agent.update_config({
+            "model": llm_params["model_name"],
+            "temperature": llm_params["temperature"],
+            "max_tokens": llm_params["max_tokens"],
+            "top_p": llm_params["top_p"],
+            "presence_penalty": llm_params["presence_penalty"],
+            "frequency_penalty": llm_params["frequency_penalty"],
+            "stream_output": llm_params["streaming"],
+            "openai_api_key": llm_params["api_key"],
+            "openai_api_base": llm_params["api_base"]
+        })
+    
+    return agents
+
+def validate_request(data):
+    """校验请求并设置环境变量，返回(task, settings, 错误响应)"""
+    task = data.get('task')
+    settings = data.get('settings', {})
+    
+    if not task:
+        return task, settings, (jsonify({"status": "error", "message": "任务不能为空"}), 400)
+        
+    # 验证API密钥
+    api_key = settings.get('api_key')
+    if not api_key:
+        return task, settings, (jsonify({"status": "error", "message": "API密钥不能为空"}), 400)
+
+    # 设置环境变量
+    os.environ["OPENAI_API_KEY"] = api_key
+    if settings.get('base_url'):
+        os.environ["OPENAI_API_BASE"] = settings.get('base_url')
+        
+    return task, settings, None
+
+@app.route('/api/process', methods=['POST'])
+def process():
+    try:
+        task, settings, error = validate_request(request.json)
+        if error:
+            return error
+            
+        agents = build_agents(settings)
         
         # 处理任务
         result = task
         for agent in agents:
-            # 设置LLM参数
-            agent.update_config({
-                "model": llm_params["model_name"],
-                "temperature": llm_params["temperature"],
-                "max_tokens": llm_params["max_tokens"],
-                "top_p": llm_params["top_p"],
-                "presence_penalty": llm_params["presence_penalty"],
-                "frequency_penalty": llm_params["frequency_penalty"],
-                "stream_output": llm_params["streaming"],
-                "openai_api_key": llm_params["api_key"],
-                "openai_api_base": llm_params["api_base"]
-            })
             result = agent.process(task, result)
         
         return jsonify({
@@ -181,6 +199,42 @@ def process():
             "message": f"处理任务时出错: {str(e)}"
         }), 500
 
+@app.route('/api/process_stream', methods=['POST'])
+def process_stream():
+    """流式处理任务，前面的代理正常执行，最后一个代理的输出逐段返回
+    
+    首个片段之前的错误按普通请求返回错误响应；开始输出后的错误以STREAM_ERROR_MARKER
+    开头追加在正文之后，前端据此区分错误和正常结束。
+    """
+    try:
+        task, settings, error = validate_request(request.json)
+        if error:
+            return error
+            
+        agents = build_agents(settings)
+        result = task
+        for agent in agents[:-1]:
+            result = agent.process(task, result)
+        chunks = iter(agents[-1].process_stream(task, result))
+        first = next(chunks, "")
+    except Exception as e:
+        logger.error(f"处理任务时出错: {str(e)}", exc_info=True)
+        return jsonify({
+            "status": "error",
+            "message": f"处理任务时出错: {str(e)}"
+        }), 500
+        
+    def generate():
+        yield first
+        try:
+            for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            logger.error(f"处理任务时出错: {str(e)}", exc_info=True)
+            yield f"{STREAM_ERROR_MARKER}处理任务时出错: {str(e)}"
+            
+    return Response(stream_with_context(generate()), mimetype='text/plain; charset=utf-8')
+
 @app.route('/api/workflow', methods=['GET'])
 def get_workflows():
     return jsonify({"workflows": workflows})
@@ -1,3 +1,6 @@
+// 流式输出中途出错时的标记，与app.py中的STREAM_ERROR_MARKER保持一致
+const STREAM_ERROR_MARKER = '\u0000STREAM_ERROR\u0000';
+
 document.addEventListener('DOMContentLoaded', function() {
     // 获取DOM元素
     const settingsForm = document.getElementById('settingsForm');
@@ -172,7 +175,7 @@ document.addEventListener('DOMContentLoaded', function() {
         updateStatus('正在处理任务...');
 
         try {
-            const response = await fetch('/api/process', {
+            const response = await fetch('/api/process_stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -183,16 +186,33 @@ document.addEventListener('DOMContentLoaded', function() {
                 })
             });
 
-            const data = await response.json();
-            
-            if (data.status === 'success') {
-                output.innerHTML = marked.parse(data.result);
-                showMessage('处理完成', 'success');
-                addLog('任务处理完成');
-            } else {
+            if (!response.ok) {
+                const data = await response.json();
                 showMessage(data.message || '处理失败', 'error');
                 addLog(`处理失败: ${data.message}`);
+                return;
+            }
+
+            // 逐段读取流式结果并实时渲染
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder('utf-8');
+            let result = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                result += decoder.decode(value, { stream: true });
+                output.innerHTML = marked.parse(result.split(STREAM_ERROR_MARKER)[0]);
+            }
+            result += decoder.decode();
+            const [content, streamError] = result.split(STREAM_ERROR_MARKER);
+            output.innerHTML = marked.parse(content);
+            if (streamError !== undefined) {
+                showMessage(streamError, 'error');
+                addLog(`处理失败: ${streamError}`);
+                return;
             }
+            showMessage('处理完成', 'success');
+            addLog('任务处理完成');
         } catch (error) {
             showMessage('请求失败: ' + error.message, 'error');
             addLog(`请求失败: ${error.message}`);